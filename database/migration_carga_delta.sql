@@ -0,0 +1,10 @@
+-- =====================================================================
+-- MIGRATION: hash de contenido para cargas incrementales
+-- scripts/cargar_datos_excel.py --delta compara el hash de cada fila
+-- del Excel con hash_contenido y solo reescribe las claves cambiadas.
+-- hash_contenido = 0 marca las filas dadas de baja por la carga (--bajas).
+-- =====================================================================
+
+ALTER TABLE prestadores ADD COLUMN IF NOT EXISTS hash_contenido BIGINT;
+ALTER TABLE nomencladores ADD COLUMN IF NOT EXISTS hash_contenido BIGINT;
+ALTER TABLE acuerdos_prestador ADD COLUMN IF NOT EXISTS hash_contenido BIGINT;
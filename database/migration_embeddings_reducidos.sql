@@ -0,0 +1,23 @@
+-- =====================================================================
+-- MIGRATION: embeddings de dimensiones reducidas en media precision
+-- text-embedding-3-small pedido con dimensions = 512 y guardado como
+-- halfvec (float2, requiere pgvector >= 0.7.0): ~6x menos espacio que
+-- vector(1536) en la tabla, el indice y la cache de embeddings.
+--
+-- Los embeddings existentes no se pueden convertir y quedan en NULL;
+-- regenerarlos con la misma configuracion (sin costo de API para los
+-- textos que ya estan en la cache local con 1536 dimensiones):
+--   EMBEDDING_TYPE=halfvec EMBEDDING_DIMENSIONS=512 \
+--     python scripts/cargar_datos_excel.py --only-embeddings --recrear-indices
+-- La API y los workers tienen que usar las mismas EMBEDDING_TYPE y
+-- EMBEDDING_DIMENSIONS. Para otra combinacion, cambiar halfvec(512).
+-- =====================================================================
+
+DROP INDEX IF EXISTS idx_prestadores_embedding;
+DROP INDEX IF EXISTS idx_nomencladores_embedding;
+
+ALTER TABLE prestadores ALTER COLUMN nombre_embedding TYPE halfvec(512) USING NULL;
+ALTER TABLE nomencladores ALTER COLUMN descripcion_embedding TYPE halfvec(512) USING NULL;
+
+COMMENT ON COLUMN nomencladores.descripcion_embedding IS 'Vector embedding (text-embedding-3-small, 512 dims, halfvec)';
+COMMENT ON COLUMN prestadores.nombre_embedding IS 'Vector embedding (text-embedding-3-small, 512 dims, halfvec)';
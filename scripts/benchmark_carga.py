@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark de cargar_datos_excel.py con datos sinteticos.
+
+Genera los tres Excel con el formato real (prestadores con la columna extra
+de fila, y los libros combinados nomenclador+acuerdo) para cada tamano
+pedido, levanta un backend de embeddings falso con latencia configurable y
+corre la carga completa contra una base local con pgvector, cada tamano en
+un proceso aparte. Informa tiempo, filas/s y pico de RSS de cada paso
+(lectura, limpieza, embeddings, serializacion, escritura, contadores) y
+agrega el resultado a benchmarks/carga_excel.jsonl junto con el commit,
+comparandolo con la corrida anterior de la misma maquina y configuracion.
+
+La base de benchmark se VACIA (TRUNCATE de prestadores, nomencladores y
+acuerdos_prestador) antes de cada corrida: tiene que ser una base aparte
+con el schema y las migraciones aplicadas (default medical_ocr_bench).
+
+Uso:
+    python scripts/benchmark_carga.py                       # 10k, 100k y 1M filas
+    python scripts/benchmark_carga.py --filas 10000 --latencia-ms 200
+    python scripts/benchmark_carga.py --args="--bulk-mode values --secuencial"
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import os
+import platform
+import random
+import shlex
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import openpyxl
+import psycopg2
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import cargar_datos_excel as carga  # noqa: E402
+
+RESULTADOS_PATH = os.path.join(carga.PROJECT_DIR, 'benchmarks', 'carga_excel.jsonl')
+LIBROS_DIR = os.path.join(carga.DATA_DIR, '.cache', 'benchmark')
+FORMATO_LIBROS = 1  # subir si cambia el generador, para no reusar libros viejos
+
+ARGUMENTOS_CARGA = '--bulk-mode copy --secuencial --no-cache --no-embedding-cache'
+PASOS = ['lectura', 'limpieza', 'embeddings', 'serializacion', 'escritura', 'contadores']
+
+ENCABEZADO_PRESTADORES = [None, 'ID_PRESTADOR', 'RUC', 'NOMBRE_FANTASIA', 'RAZ_SOC_NOMBRE',
+                          'RANKING', 'REGISTRO_PROFESIONAL', 'CANTIDAD']
+ENCABEZADO_COMBINADO = ['ID_NOMENCLADOR', 'ESPECIALIDAD', 'NOMEN_DESCRIPCION_DET', 'ID_NOMENCLADOR2',
+                        'ID_SERVICIO', 'DESC_NOMENCLADOR', 'PLAN_ID_PLAN', 'PREST_ID_PRESTADOR',
+                        'PRECIO', 'PRECIO_NORMAL', 'PRECIO_DIFERENCIADO', 'PRECIO_INTERNADO']
+
+ESPECIALIDADES = ['CLINICA MEDICA', 'GINECOLOGÍA Y OBSTETRICIA', 'ANALISIS LABORATORIALES', 'CARDIOLOGÍA',
+                  'PEDIATRÍA', 'TRAUMATOLOGÍA', 'OFTALMOLOGÍA', 'DIAGNÓSTICO POR IMÁGENES']
+PALABRAS = ['CONSULTA', 'HISTERECTOMÍA', 'RADICAL', 'ECOGRAFÍA', 'ABDOMINAL', 'TOTAL', 'PARCIAL',
+            'VISITA', 'SANATORIAL', 'HEMOGRAMA', 'COMPLETO', 'RESONANCIA', 'MAGNÉTICA', 'CRÁNEO',
+            'EXTIRPACIÓN', 'QUISTE', 'OVÁRICO', 'NIÑO', 'ADULTO', 'URGENCIA', 'CONTROL', 'BILATERAL']
+
+
+def log(msg):
+    carga.log(msg)
+
+
+# ============================================================
+# LIBROS SINTETICOS
+# ============================================================
+def escribir_libro(ruta, encabezado, filas):
+    wb = openpyxl.Workbook(write_only=True)
+    hoja = wb.create_sheet()
+    hoja.append(encabezado)
+    for fila in filas:
+        hoja.append(fila)
+    wb.save(ruta)
+
+
+def filas_prestadores(azar, cantidad):
+    for i in range(cantidad):
+        id_prestador = i + 1
+        nombre = f"{'Sanatorio' if i % 3 else 'Clínica'} {azar.choice(PALABRAS).title()} {id_prestador}"
+        yield (
+            i,
+            id_prestador if i % 997 else float(id_prestador),
+            f'{80000000 + i}-{i % 10}' if i % 7 else None,
+            f'  {nombre}\xa0' if i % 13 == 0 else (nombre if i % 101 else None),
+            f'RAZÓN  SOCIAL {id_prestador} S.A.',
+            azar.choice([None, 1, 2.5, 4, 'N/A']),
+            azar.choice([None, 1234, 'R-55']),
+            azar.choice([None, 0, 3, 10]),
+        )
+
+
+def filas_combinadas(azar, cantidad, catalogo, prestadores):
+    """
+    Filas nomenclador+acuerdo: los nomencladores salen de un catalogo fijo
+    (misma descripcion para el mismo id), con ids como float o nulos, texto
+    con espacios de mas, precios no numericos y prestadores inexistentes en
+    las mismas proporciones aproximadas que los Excel reales.
+    """
+    for i in range(cantidad):
+        k = azar.randrange(len(catalogo))
+        id_nomenclador, especialidad, descripcion = catalogo[k]
+        if i % 53 == 0:
+            descripcion = f' {descripcion.replace(" ", "  ")}\xa0'
+        yield (
+            None if i % 499 == 0 else (float(id_nomenclador) if i % 211 == 0 else id_nomenclador),
+            especialidad,
+            descripcion if i % 97 else None,
+            str(10000000 + id_nomenclador) if i % 3 else None,
+            id_nomenclador % 1000000 if i % 4 else None,
+            descripcion.split(' ')[0] if i % 5 else None,
+            None if i % 103 == 0 else azar.randint(1, 5),
+            azar.randint(1, prestadores + prestadores // 50 + 1),
+            'N/A' if i % 101 == 0 else (None if i % 47 == 0 else azar.randint(1, 2000) * 500),
+            azar.choice([0, 1000, None]),
+            azar.choice([None, azar.randint(1, 2000) * 500]),
+            azar.choice([0, 77.25]),
+        )
+
+
+def generar_libros(filas, semilla):
+    """
+    Directorio con los tres Excel para `filas` filas de acuerdos (se generan
+    una sola vez por tamano, semilla y formato). NOMENCLADORES_GENERALES tiene
+    un decimo de las filas y el catalogo un vigesimo; prestadores, un centesimo.
+    """
+    directorio = os.path.join(LIBROS_DIR, f'{filas}-s{semilla}-v{FORMATO_LIBROS}')
+    listo = os.path.join(directorio, '.completo')
+    if os.path.exists(listo):
+        return directorio
+    os.makedirs(directorio, exist_ok=True)
+
+    inicio = time.time()
+    azar = random.Random(semilla)
+    prestadores = max(50, filas // 100)
+    catalogo = [(100000 + k, azar.choice(ESPECIALIDADES), f"{' '.join(azar.sample(PALABRAS, 3))} {100000 + k}")
+                for k in range(max(100, filas // 20))]
+
+    escribir_libro(os.path.join(directorio, 'PRESTADORES_PRINCIPALES.xlsx'), ENCABEZADO_PRESTADORES,
+                   filas_prestadores(azar, prestadores))
+    escribir_libro(os.path.join(directorio, 'NOMENCLADORES_GENERALES.xlsx'), ENCABEZADO_COMBINADO,
+                   filas_combinadas(azar, max(100, filas // 10), catalogo, prestadores))
+    escribir_libro(os.path.join(directorio, 'ACUERDO_PRESTADORES.xlsx'), ENCABEZADO_COMBINADO,
+                   filas_combinadas(azar, filas, catalogo, prestadores))
+    open(listo, 'w').close()
+    log(f"  Libros de {filas} filas generados en {time.time() - inicio:.1f}s ({directorio})")
+    return directorio
+
+
+# ============================================================
+# BACKEND DE EMBEDDINGS FALSO
+# ============================================================
+class BackendEmbeddings:
+    """
+    Imita POST /v1/embeddings con `latencia` segundos por request. Los vectores
+    salen de un conjunto fijo elegido por hash del texto (respeta `dimensions`).
+    """
+
+    def __init__(self, latencia):
+        self.latencia = latencia
+        self.requests = 0
+        self._vectores = {}
+        self._lock = threading.Lock()
+        backend = self
+
+        class Manejador(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                pedido = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                textos = pedido['input'] if isinstance(pedido['input'], list) else [pedido['input']]
+                with backend._lock:
+                    backend.requests += 1
+                time.sleep(backend.latencia)
+                cuerpo = json.dumps({
+                    'object': 'list', 'model': pedido['model'],
+                    'usage': {'prompt_tokens': sum(len(t) // 4 + 1 for t in textos),
+                              'total_tokens': sum(len(t) // 4 + 1 for t in textos)},
+                    'data': [{'object': 'embedding', 'index': i,
+                              'embedding': backend.vector(t, pedido.get('dimensions') or 1536)}
+                             for i, t in enumerate(textos)],
+                }).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(cuerpo)))
+                self.end_headers()
+                self.wfile.write(cuerpo)
+
+        self.servidor = ThreadingHTTPServer(('127.0.0.1', 0), Manejador)
+        self.url = f'http://127.0.0.1:{self.servidor.server_address[1]}/v1'
+        threading.Thread(target=self.servidor.serve_forever, daemon=True).start()
+
+    def vector(self, texto, dimensiones):
+        with self._lock:
+            if dimensiones not in self._vectores:
+                azar = np.random.default_rng(dimensiones)
+                base = azar.standard_normal((256, dimensiones)).astype('<f4')
+                base /= np.linalg.norm(base, axis=1, keepdims=True)
+                self._vectores[dimensiones] = [base64.b64encode(v.tobytes()).decode() for v in base]
+        return self._vectores[dimensiones][hashlib.md5(texto.encode()).digest()[0]]
+
+    def cerrar(self):
+        self.servidor.shutdown()
+
+
+# ============================================================
+# CORRIDAS
+# ============================================================
+def correr_carga(directorio, salida, argumentos):
+    """Proceso hijo: corre la carga sobre los libros de `directorio` y deja las mediciones en `salida`."""
+    carga.EXCEL_PRESTADORES = os.path.join(directorio, 'PRESTADORES_PRINCIPALES.xlsx')
+    carga.EXCEL_NOMENCLADORES = os.path.join(directorio, 'NOMENCLADORES_GENERALES.xlsx')
+    carga.EXCEL_ACUERDOS = os.path.join(directorio, 'ACUERDO_PRESTADORES.xlsx')
+    carga.RECHAZOS_ACUERDOS_PATH = os.path.join(directorio, 'acuerdos_rechazados.csv')
+    carga.METRICAS_JSON_PATH = os.path.join(directorio, 'metricas_carga.json')
+    carga.METRICAS_PROM_PATH = os.path.join(directorio, 'metricas_carga.prom')
+    sys.argv = ['cargar_datos_excel.py', *argumentos]
+
+    codigo = 0
+    inicio = time.perf_counter()
+    try:
+        carga.main()
+    except SystemExit as e:
+        codigo = e.code or 0
+    # Se escribe aparte y se renombra: un hijo muerto a mitad no deja un JSON cortado
+    with open(salida + '.tmp', 'w') as f:
+        json.dump({
+            'codigo': codigo,
+            'segundos': round(time.perf_counter() - inicio, 3),
+            'rss_pico_mb': round(carga.rss_pico_mb(), 1),
+            'etapas': {k: round(v, 3) for k, v in carga.TIEMPOS_ETAPAS.items()},
+            'pasos': {k: {'segundos': round(v['segundos'], 3), 'filas': v['filas'],
+                          'rss_pico_mb': round(v['rss_pico_mb'], 1)} for k, v in carga.PASOS.items()},
+        }, f)
+    os.replace(salida + '.tmp', salida)
+
+
+def vaciar_base(db_config):
+    conn = psycopg2.connect(**db_config)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("TRUNCATE acuerdos_prestador, nomencladores, prestadores RESTART IDENTITY CASCADE")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def version_codigo():
+    """(commit corto, hay cambios sin commitear en scripts/)"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=carga.PROJECT_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        sucio = subprocess.run(['git', 'status', '--porcelain', '--', 'scripts'], cwd=carga.PROJECT_DIR,
+                               capture_output=True, text=True, check=True).stdout.strip() != ''
+        return commit, sucio
+    except (OSError, subprocess.CalledProcessError):
+        return None, False
+
+
+def leer_resultados(ruta):
+    if not os.path.exists(ruta):
+        return []
+    with open(ruta) as f:
+        return [json.loads(linea) for linea in f if linea.strip()]
+
+
+def misma_configuracion(a, b):
+    return all(a.get(k) == b.get(k) for k in ('maquina', 'filas', 'latencia_ms', 'argumentos'))
+
+
+def mostrar_resultado(resultado, anterior, umbral):
+    log(f"  {'paso':<14} {'segundos':>9} {'filas':>9} {'filas/s':>10} {'RSS pico':>9}"
+        + (f" {'vs ' + anterior['commit']:>14}" if anterior else ""))
+    regresiones = []
+    for nombre in [p for p in PASOS if p in resultado['pasos']] + ['total']:
+        if nombre == 'total':
+            paso = {'segundos': resultado['segundos'], 'filas': resultado['filas'],
+                    'rss_pico_mb': resultado['rss_pico_mb']}
+            previo = {'segundos': anterior['segundos']} if anterior else None
+        else:
+            paso = resultado['pasos'][nombre]
+            previo = anterior['pasos'].get(nombre) if anterior else None
+        por_segundo = f"{paso['filas'] / paso['segundos']:,.0f}" if paso['filas'] and paso['segundos'] else '-'
+        linea = (f"  {nombre:<14} {paso['segundos']:>9.2f} {paso['filas']:>9} {por_segundo:>10} "
+                 f"{paso['rss_pico_mb']:>6.0f} MB")
+        if previo and previo['segundos'] > 0:
+            cambio = (paso['segundos'] - previo['segundos']) / previo['segundos']
+            linea += f" {cambio:>+13.0%}"
+            # Diferencias de fracciones de segundo son ruido aunque el porcentaje sea alto
+            if cambio > umbral and paso['segundos'] - previo['segundos'] > 0.5:
+                linea += "  REGRESION"
+                regresiones.append(nombre)
+        log(linea)
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de cargar_datos_excel.py con datos sinteticos')
+    parser.add_argument('--filas', type=int, nargs='+', default=[10000, 100000, 1000000],
+                        help='Filas de ACUERDO_PRESTADORES por corrida (default 10000 100000 1000000)')
+    parser.add_argument('--latencia-ms', type=float, default=100,
+                        help='Latencia por request del backend de embeddings falso (default 100)')
+    parser.add_argument('--args', default=ARGUMENTOS_CARGA,
+                        help=f'Argumentos para cargar_datos_excel.py (default "{ARGUMENTOS_CARGA}")')
+    parser.add_argument('--base', default=os.getenv('BENCHMARK_DB', 'medical_ocr_bench'),
+                        help='Base de benchmark; se vacia en cada corrida (default medical_ocr_bench)')
+    parser.add_argument('--semilla', type=int, default=1)
+    parser.add_argument('--resultados', default=RESULTADOS_PATH,
+                        help='JSONL donde se agregan los resultados (default benchmarks/carga_excel.jsonl)')
+    parser.add_argument('--umbral', type=float, default=0.10,
+                        help='Aumento de tiempo de un paso que se marca como regresion (default 0.10)')
+    parser.add_argument('--correr-carga', nargs=2, metavar=('LIBROS', 'SALIDA'), help=argparse.SUPPRESS)
+    args, resto = parser.parse_known_args()
+
+    if args.correr_carga:
+        correr_carga(*args.correr_carga, resto)
+        return
+    if resto:
+        parser.error(f"argumentos no reconocidos: {' '.join(resto)} (para la carga usar --args=\"...\")")
+
+    db_config = {**carga.DB_CONFIG, 'database': args.base}
+    try:
+        vaciar_base(db_config)
+    except psycopg2.Error as e:
+        log(f"ERROR: La base de benchmark {args.base} no esta lista ({e}). Crearla y aplicar "
+            f"database/schema_matching.sql y las migraciones de database/")
+        sys.exit(1)
+
+    backend = BackendEmbeddings(args.latencia_ms / 1000)
+    entorno = {**os.environ, 'POSTGRES_DB': args.base, 'OPENAI_API_KEY': 'benchmark',
+               'OPENAI_BASE_URL': backend.url, 'PYTHONUNBUFFERED': '1'}
+    commit, sucio = version_codigo()
+    historial = leer_resultados(args.resultados)
+    os.makedirs(os.path.dirname(os.path.abspath(args.resultados)), exist_ok=True)
+    hubo_regresiones = False
+
+    try:
+        for filas in args.filas:
+            log("=" * 60)
+            log(f"BENCHMARK: {filas} filas, latencia {args.latencia_ms:.0f} ms, {args.args}")
+            log("=" * 60)
+            directorio = generar_libros(filas, args.semilla)
+            vaciar_base(db_config)
+
+            salida = os.path.join(directorio, 'mediciones.json')
+            registro = os.path.join(directorio, 'carga.log')
+            # El directorio se reutiliza: si la carga muere sin escribir, no se lee la medicion anterior
+            if os.path.exists(salida):
+                os.remove(salida)
+            requests_antes = backend.requests
+            with open(registro, 'w') as f:
+                proceso = subprocess.run([sys.executable, os.path.abspath(__file__), '--correr-carga', directorio,
+                                          salida, *shlex.split(args.args)],
+                                         env=entorno, stdout=f, stderr=subprocess.STDOUT)
+            if proceso.returncode or not os.path.exists(salida):
+                # Muerta por el OOM killer o una senal: no llego a escribir las mediciones
+                log(f"  ERROR: la carga termino sin mediciones (codigo de salida {proceso.returncode}); "
+                    f"ver {registro}")
+                hubo_regresiones = True
+                continue
+            with open(salida) as f:
+                medicion = json.load(f)
+            if medicion['codigo']:
+                log(f"  ERROR: la carga termino con codigo {medicion['codigo']}; ver {registro}")
+                hubo_regresiones = True
+                continue
+
+            resultado = {
+                'fecha': time.strftime('%Y-%m-%dT%H:%M:%S'), 'commit': commit, 'sucio': sucio,
+                'maquina': platform.node(), 'cpus': os.cpu_count(), 'filas': filas,
+                'latencia_ms': args.latencia_ms, 'argumentos': args.args,
+                'requests_embeddings': backend.requests - requests_antes, **medicion,
+            }
+            # Una medicion con cambios sin commitear no identifica el codigo medido: no sirve de base
+            anterior = next((r for r in reversed(historial)
+                             if not r.get('sucio') and misma_configuracion(r, resultado)), None)
+            if mostrar_resultado(resultado, anterior, args.umbral):
+                hubo_regresiones = True
+            with open(args.resultados, 'a') as f:
+                f.write(json.dumps(resultado, ensure_ascii=False) + '\n')
+            historial.append(resultado)
+    finally:
+        backend.cerrar()
+
+    log(f"Resultados agregados a {args.resultados}")
+    sys.exit(1 if hubo_regresiones else 0)
+
+
+if __name__ == '__main__':
+    main()
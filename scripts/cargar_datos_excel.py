@@ -15,14 +15,56 @@ Soporta modo --only-embeddings para vectorizar datos ya cargados.
 """
 
 import argparse
+import base64
+import cProfile
+import csv
+import functools
+import glob
+import hashlib
+import inspect
+import io
+import json
 import os
+import pstats
+import queue
+import re
+import shutil
+import sqlite3
+import struct
 import sys
+import threading
 import time
-
+import tracemalloc
+import uuid
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from contextlib import closing, contextmanager
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from itertools import islice
+from xml.etree import ElementTree
+
+import numpy as np
 import pandas as pd
 import psycopg2
+from psycopg2.extensions import AsIs, register_adapter
 from psycopg2.extras import execute_values
-from openai import OpenAI
+from psycopg2.pool import ThreadedConnectionPool
+
+try:
+    import pyarrow  # motor Parquet para la cache de parseo (opcional)
+except ImportError:
+    pyarrow = None
+
+try:
+    import tiktoken  # conteo exacto de tokens para armar batches (opcional)
+except ImportError:
+    tiktoken = None
+
+try:
+    import resource  # pico de RSS por paso (no existe en Windows)
+except ImportError:
+    resource = None
 
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -32,6 +74,14 @@ DATA_DIR = os.path.join(PROJECT_DIR, 'data')
 EXCEL_PRESTADORES = os.path.join(DATA_DIR, 'PRESTADORES_PRINCIPALES.xlsx')
 EXCEL_NOMENCLADORES = os.path.join(DATA_DIR, 'NOMENCLADORES_GENERALES.xlsx')
 EXCEL_ACUERDOS = os.path.join(DATA_DIR, 'ACUERDO_PRESTADORES.xlsx')
+# Con --libros: archivos, directorios o globs de Excel combinados (nomencladores + acuerdos)
+# que reemplazan a los dos de arriba
+LIBROS_COMBINADOS = None
+
+PARSE_CACHE_DIR = os.getenv('PARSE_CACHE_DIR', os.path.join(DATA_DIR, '.cache'))
+EMBEDDING_CACHE_PATH = os.getenv('EMBEDDING_CACHE_PATH', os.path.join(DATA_DIR, '.cache', 'embeddings.sqlite'))
+RECHAZOS_ACUERDOS_PATH = os.getenv('RECHAZOS_ACUERDOS_PATH', os.path.join(DATA_DIR, 'acuerdos_rechazados.csv'))
+RECHAZOS_EMBEDDINGS_PATH = os.getenv('RECHAZOS_EMBEDDINGS_PATH', os.path.join(DATA_DIR, 'embeddings_rechazados.csv'))
 
 DB_CONFIG = {
     'host': os.getenv('POSTGRES_HOST', 'localhost'),
@@ -42,39 +92,81 @@ DB_CONFIG = {
 }
 
 EMBEDDING_MODEL = 'text-embedding-3-small'
-EMBEDDING_BATCH_SIZE = 200
-EMBEDDING_DIMENSIONS = 1536
+EMBEDDING_BATCH_SIZE = int(os.getenv('EMBEDDING_BATCH_SIZE', '1000'))        # textos por request
+EMBEDDING_BATCH_TOKENS = int(os.getenv('EMBEDDING_BATCH_TOKENS', '100000'))  # tokens por request
+EMBEDDING_MAX_TOKENS_TEXTO = 8191  # limite de entrada del modelo
+EMBEDDING_DIMENSIONS_MODELO = 1536  # dimensiones completas de EMBEDDING_MODEL
+# Dimensiones pedidas a la API (parametro `dimensions`) y tipo de pgvector de las columnas:
+# vector (float4) o halfvec (float2, pgvector >= 0.7)
+EMBEDDING_DIMENSIONS = int(os.getenv('EMBEDDING_DIMENSIONS', str(EMBEDDING_DIMENSIONS_MODELO)))
+EMBEDDING_TYPE = os.getenv('EMBEDDING_TYPE', 'vector')
+EMBEDDING_CONCURRENCY = int(os.getenv('EMBEDDING_CONCURRENCY', '4'))
+EMBEDDING_RPM = int(os.getenv('EMBEDDING_RPM', '3000'))
+EMBEDDING_TPM = int(os.getenv('EMBEDDING_TPM', '1000000'))
+
+STREAM_CHUNK_SIZE = 50000
+PIPELINE_CHUNK_SIZE = 5000  # filas por chunk entre embeddings y escritura
+COPY_BUFFER_BYTES = 32 * 1024 * 1024  # --bulk-mode copy envia el COPY cada ~32 MB
 
 
 def log(msg):
     print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] {msg}", flush=True)
 
 
+TABLA_ACENTOS = str.maketrans('áéíóúäëïöüñ', 'aeiouaeioun')
+
+
 def normalizar_texto(texto):
     if pd.isna(texto) or texto is None:
         return None
-    texto = str(texto).strip().lower()
-    reemplazos = {
-        'á': 'a', 'é': 'e', 'í': 'i', 'ó': 'o', 'ú': 'u',
-        'ä': 'a', 'ë': 'e', 'ï': 'i', 'ö': 'o', 'ü': 'u',
-        'ñ': 'n',
-    }
-    for old, new in reemplazos.items():
-        texto = texto.replace(old, new)
-    texto = ' '.join(texto.split())
-    return texto
+    return ' '.join(str(texto).lower().translate(TABLA_ACENTOS).split())
 
 
 def limpiar_texto(texto):
     if pd.isna(texto) or texto is None:
         return None
-    texto = str(texto).strip()
-    texto = texto.replace('\xa0', ' ')
-    texto = ' '.join(texto.split())
+    texto = ' '.join(str(texto).split())
     return texto if texto else None
 
 
-def conectar_db():
+def _con_none(valores, index):
+    """Reubica `valores` sobre `index` dejando None (no NaN) en las filas faltantes."""
+    valores = valores.reindex(index).astype(object)
+    return valores.where(valores.notna(), None)
+
+
+def limpiar_serie(serie):
+    """limpiar_texto vectorizado sobre una Series."""
+    textos = serie[serie.notna()].astype(str).str.split().str.join(' ')
+    return _con_none(textos[textos != ''], serie.index)
+
+
+def normalizar_serie(serie):
+    """normalizar_texto vectorizado sobre una Series."""
+    textos = serie[serie.notna()].astype(str).str.lower().str.translate(TABLA_ACENTOS)
+    return _con_none(textos.str.split().str.join(' '), serie.index)
+
+
+def recortar_serie(serie):
+    """str(x).strip() para los valores no nulos."""
+    return _con_none(serie[serie.notna()].astype(str).str.strip(), serie.index)
+
+
+def enteros_serie(serie):
+    """int(x) vectorizado: trunca como int() y deja <NA> en los nulos."""
+    numeros = pd.to_numeric(serie)
+    if numeros.dtype.kind == 'f':
+        numeros = np.trunc(numeros)
+    return numeros.astype('Int64')
+
+
+def decimales_serie(serie):
+    """float(x) o NaN si el valor no es numerico."""
+    return pd.to_numeric(serie, errors='coerce').astype(float)
+
+
+def conectar_db(reintentable=False):
+    """Conexion nueva; si falla sale del script, o propaga el error con `reintentable` (--watch)."""
     try:
         conn = psycopg2.connect(**DB_CONFIG)
         conn.autocommit = False
@@ -82,10 +174,860 @@ def conectar_db():
         return conn
     except Exception as e:
         log(f"ERROR: No se pudo conectar a PostgreSQL: {e}")
+        if reintentable:
+            raise
         sys.exit(1)
 
 
-def generar_embeddings_batch(client, textos, desc=""):
+# ============================================================
+# MEDICION POR PASO (lectura, limpieza, embeddings, serializacion, escritura, contadores)
+# ============================================================
+PASOS = {}
+_lock_pasos = threading.Lock()
+_pasos_activos = threading.local()
+
+
+def rss_pico_mb():
+    """Pico de memoria residente del proceso hasta ahora, en MB (0 sin `resource`)."""
+    if resource is None:
+        return 0.0
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico / (1024 * 1024) if sys.platform == 'darwin' else pico / 1024
+
+
+@contextmanager
+def medir_paso(nombre, filas=0):
+    """
+    Suma a PASOS[nombre] el tiempo propio del bloque (el de los pasos anidados
+    se cuenta en esos pasos), sus filas y el pico de RSS al terminarlo. Es
+    seguro entre hilos; las filas se pueden completar adentro con paso['filas'].
+    """
+    pila = _pasos_activos.__dict__.setdefault('pila', [])
+    paso = {'filas': filas, 'anidados': 0.0}
+    pila.append(paso)
+    inicio = time.perf_counter()
+    try:
+        yield paso
+    finally:
+        duracion = time.perf_counter() - inicio
+        pila.pop()
+        if pila:
+            pila[-1]['anidados'] += duracion
+        sumar_pasos({nombre: {'segundos': duracion - paso['anidados'], 'filas': paso['filas'],
+                              'rss_pico_mb': rss_pico_mb()}})
+
+
+def sumar_pasos(pasos):
+    """Acumula en PASOS los de otra medicion (por ejemplo, de un proceso de parseo)."""
+    with _lock_pasos:
+        for nombre, valores in pasos.items():
+            total = PASOS.setdefault(nombre, {'segundos': 0.0, 'filas': 0, 'rss_pico_mb': 0.0})
+            total['segundos'] += valores['segundos']
+            total['filas'] += valores['filas']
+            total['rss_pico_mb'] = max(total['rss_pico_mb'], valores['rss_pico_mb'])
+
+
+# ============================================================
+# METRICAS (resumen JSON + textfile collector de Prometheus)
+# ============================================================
+METRICAS_JSON_PATH = os.getenv('METRICAS_JSON_PATH', os.path.join(DATA_DIR, 'metricas_carga.json'))
+METRICAS_PROM_PATH = os.getenv('METRICAS_PROM_PATH', os.path.join(DATA_DIR, 'metricas_carga.prom'))
+PREFIJO_METRICAS = 'carga_excel_'
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# nombre -> (tipo, ayuda). Las etiquetas de cada serie se pasan al registrarla.
+DEFINICION_METRICAS = {
+    'filas_leidas_total': ('counter', 'Filas leidas por libro y origen (excel o cache de parseo)'),
+    'filas_limpias_total': ('counter', 'Filas validas despues de limpiar y deduplicar, por entidad'),
+    'filas_descartadas_total': ('counter', 'Filas descartadas por entidad y motivo'),
+    'filas_escritas_total': ('counter', 'Filas enviadas a la base por tabla'),
+    'filas_sin_cambios_total': ('counter', 'Filas que --delta no reescribio, por tabla'),
+    'embeddings_request_segundos': ('histogram', 'Latencia de cada request de embeddings, por resultado'),
+    'embeddings_reintentos_total': ('counter', 'Reintentos de requests de embeddings, por motivo'),
+    'embeddings_batches_fallidos_total': ('counter', 'Batches de embeddings que agotaron los reintentos'),
+    'embeddings_rechazados_total': ('counter', 'Textos rechazados por la API, por origen (api o conocido)'),
+    'embeddings_textos_total': ('counter', 'Textos con embedding por origen (cache o api)'),
+    'embeddings_tokens_total': ('counter', 'Tokens enviados a la API de embeddings'),
+    'upsert_batch_segundos': ('histogram', 'Latencia de cada batch de escritura, por tabla'),
+    'contadores_actualizados_total': ('counter', 'Filas con cantidad_acuerdos recalculado'),
+    'paso_segundos': ('gauge', 'Tiempo propio de cada paso de la carga'),
+    'paso_filas': ('gauge', 'Filas procesadas por cada paso'),
+    'etapa_segundos': ('gauge', 'Duracion de cada etapa de la carga'),
+    'rss_pico_bytes': ('gauge', 'Pico de memoria residente del proceso'),
+    'duracion_segundos': ('gauge', 'Duracion total de la carga'),
+    'exito': ('gauge', '1 si la carga termino bien, 0 si fallo o se interrumpio'),
+    'fin_timestamp_segundos': ('gauge', 'Momento en que termino la carga (epoch)'),
+}
+
+
+class Metricas:
+    """
+    Contadores, gauges e histogramas con etiquetas, en memoria y seguros
+    entre hilos. Al final de la carga se escriben como resumen JSON y en el
+    formato de texto de Prometheus.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.series = {}  # nombre -> {etiquetas (tupla ordenada): valor o histograma}
+
+    def _clave(self, nombre, etiquetas):
+        if nombre not in DEFINICION_METRICAS:
+            raise KeyError(f"Metrica no definida: {nombre}")
+        return self.series.setdefault(nombre, {}), tuple(sorted(etiquetas.items()))
+
+    def sumar(self, nombre, valor=1, **etiquetas):
+        with self._lock:
+            serie, clave = self._clave(nombre, etiquetas)
+            serie[clave] = serie.get(clave, 0) + valor
+
+    def fijar(self, nombre, valor, **etiquetas):
+        with self._lock:
+            serie, clave = self._clave(nombre, etiquetas)
+            serie[clave] = valor
+
+    def observar(self, nombre, valor, **etiquetas):
+        with self._lock:
+            serie, clave = self._clave(nombre, etiquetas)
+            histograma = serie.setdefault(clave, {'buckets': [0] * len(BUCKETS_SEGUNDOS), 'suma': 0.0,
+                                                  'cantidad': 0})
+            for i, limite in enumerate(BUCKETS_SEGUNDOS):
+                if valor <= limite:
+                    histograma['buckets'][i] += 1
+            histograma['suma'] += valor
+            histograma['cantidad'] += 1
+
+    @contextmanager
+    def medir(self, nombre, **etiquetas):
+        """Observa en el histograma `nombre` la duracion del bloque."""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(nombre, time.perf_counter() - inicio, **etiquetas)
+
+    def combinar(self, series):
+        """Acumula las series de otro proceso (por ejemplo, de un proceso de parseo)."""
+        with self._lock:
+            for nombre, valores in series.items():
+                serie = self.series.setdefault(nombre, {})
+                for clave, valor in valores.items():
+                    if DEFINICION_METRICAS[nombre][0] == 'counter':
+                        serie[clave] = serie.get(clave, 0) + valor
+                    elif DEFINICION_METRICAS[nombre][0] == 'histogram' and clave in serie:
+                        actual = serie[clave]
+                        actual['buckets'] = [a + b for a, b in zip(actual['buckets'], valor['buckets'])]
+                        actual['suma'] += valor['suma']
+                        actual['cantidad'] += valor['cantidad']
+                    else:
+                        serie[clave] = valor
+
+    def reiniciar(self):
+        with self._lock:
+            self.series = {}
+
+    def como_dict(self):
+        """Resumen JSON: por metrica, su tipo, ayuda y una entrada por combinacion de etiquetas."""
+        with self._lock:
+            resumen = {}
+            for nombre in sorted(self.series):
+                tipo, ayuda = DEFINICION_METRICAS[nombre]
+                entradas = []
+                for clave, valor in sorted(self.series[nombre].items()):
+                    entrada = {'etiquetas': dict(clave)}
+                    if tipo == 'histogram':
+                        entrada.update(cantidad=valor['cantidad'], suma=round(valor['suma'], 6),
+                                       buckets=dict(zip(map(str, BUCKETS_SEGUNDOS), valor['buckets'])))
+                    else:
+                        entrada['valor'] = valor
+                    entradas.append(entrada)
+                resumen[PREFIJO_METRICAS + nombre] = {'tipo': tipo, 'ayuda': ayuda, 'series': entradas}
+            return resumen
+
+    def como_prometheus(self):
+        """Formato de texto de Prometheus (el que lee el textfile collector de node_exporter)."""
+        def etiquetas_texto(clave, extra=()):
+            pares = [*clave, *extra]
+            if not pares:
+                return ''
+            escapar = lambda v: str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+            return '{' + ','.join(f'{k}="{escapar(v)}"' for k, v in pares) + '}'
+
+        lineas = []
+        with self._lock:
+            for nombre in sorted(self.series):
+                tipo, ayuda = DEFINICION_METRICAS[nombre]
+                completo = PREFIJO_METRICAS + nombre
+                lineas += [f"# HELP {completo} {ayuda}", f"# TYPE {completo} {tipo}"]
+                for clave, valor in sorted(self.series[nombre].items()):
+                    if tipo != 'histogram':
+                        lineas.append(f"{completo}{etiquetas_texto(clave)} {valor}")
+                        continue
+                    for limite, cantidad in zip(BUCKETS_SEGUNDOS, valor['buckets']):
+                        lineas.append(f"{completo}_bucket{etiquetas_texto(clave, [('le', f'{limite:g}')])} {cantidad}")
+                    lineas.append(f"{completo}_bucket{etiquetas_texto(clave, [('le', '+Inf')])} {valor['cantidad']}")
+                    lineas.append(f"{completo}_sum{etiquetas_texto(clave)} {valor['suma']:.6f}")
+                    lineas.append(f"{completo}_count{etiquetas_texto(clave)} {valor['cantidad']}")
+        return '\n'.join(lineas) + '\n'
+
+
+METRICAS = Metricas()
+
+
+def _escribir_atomico(ruta, contenido):
+    """Escribe a un temporal y lo renombra: el collector nunca lee un archivo a medias."""
+    os.makedirs(os.path.dirname(ruta) or '.', exist_ok=True)
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    with open(temporal, 'w', encoding='utf-8') as f:
+        f.write(contenido)
+    os.replace(temporal, ruta)
+
+
+def exportar_metricas(exito, duracion, ruta_json=None, ruta_prom=None):
+    """
+    Vuelca PASOS, TIEMPOS_ETAPAS y ESTADISTICAS_EMBEDDINGS como gauges y
+    contadores y escribe el resumen JSON y el archivo de Prometheus. Un
+    error al escribir se loguea pero no hace fallar la carga.
+    """
+    for nombre, paso in PASOS.items():
+        METRICAS.fijar('paso_segundos', round(paso['segundos'], 6), paso=nombre)
+        METRICAS.fijar('paso_filas', paso['filas'], paso=nombre)
+    for nombre, segundos in TIEMPOS_ETAPAS.items():
+        METRICAS.fijar('etapa_segundos', round(segundos, 6), etapa=nombre)
+    if ESTADISTICAS_EMBEDDINGS['textos']:
+        METRICAS.fijar('embeddings_textos_total', ESTADISTICAS_EMBEDDINGS['cache'], origen='cache')
+        METRICAS.fijar('embeddings_textos_total', ESTADISTICAS_EMBEDDINGS['api'], origen='api')
+        METRICAS.fijar('embeddings_tokens_total', ESTADISTICAS_EMBEDDINGS['tokens'])
+    METRICAS.fijar('rss_pico_bytes', int(rss_pico_mb() * 1024 * 1024))
+    METRICAS.fijar('duracion_segundos', round(duracion, 3))
+    METRICAS.fijar('exito', 1 if exito else 0)
+    METRICAS.fijar('fin_timestamp_segundos', int(time.time()))
+
+    for ruta, contenido in [
+        (ruta_json, lambda: json.dumps(METRICAS.como_dict(), ensure_ascii=False, indent=2) + '\n'),
+        (ruta_prom, METRICAS.como_prometheus),
+    ]:
+        if not ruta:
+            continue
+        try:
+            _escribir_atomico(ruta, contenido())
+            log(f"  Metricas: {ruta}")
+        except OSError as e:
+            log(f"  ADVERTENCIA: No se pudieron escribir las metricas en {ruta}: {e}")
+
+
+# ============================================================
+# PERFILADO (--profile: cProfile, tracemalloc y esperas por etapa)
+# ============================================================
+PERFILES_DIR = os.getenv('PERFILES_DIR', os.path.join(DATA_DIR, 'perfiles'))
+PERFIL = None  # Perfilado activo; sin --profile queda en None y no se mide nada
+_etapa_perfilada = threading.local()
+FILTROS_TRACEMALLOC = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+)
+
+
+class Perfilado:
+    """
+    cProfile, asignaciones (tracemalloc) y pico de RSS por etapa, con el
+    tiempo esperando a la base y a la API aparte. Los hilos auxiliares de una
+    etapa (pipeline, requests de embeddings) se perfilan dentro de ella.
+    """
+
+    def __init__(self, directorio, top=15):
+        self.directorio = directorio
+        self.top = top
+        self.etapas = {}
+        self._lock = threading.Lock()
+        tracemalloc.start()
+
+    def _datos(self, nombre):
+        with self._lock:
+            return self.etapas.setdefault(nombre, {
+                'segundos': 0.0, 'perfiles': [], 'espera': {'base': 0.0, 'api': 0.0},
+                'asignaciones': [], 'rss_pico_mb': 0.0, 'tracemalloc_pico_mb': 0.0,
+            })
+
+    @contextmanager
+    def etapa(self, nombre):
+        datos = self._datos(nombre)
+        _etapa_perfilada.nombre = nombre
+        antes = tracemalloc.take_snapshot().filter_traces(FILTROS_TRACEMALLOC)
+        tracemalloc.reset_peak()
+        perfil = cProfile.Profile()
+        inicio = time.perf_counter()
+        perfil.enable()
+        try:
+            yield
+        finally:
+            perfil.disable()
+            segundos = time.perf_counter() - inicio
+            pico = tracemalloc.get_traced_memory()[1]
+            despues = tracemalloc.take_snapshot().filter_traces(FILTROS_TRACEMALLOC)
+            _etapa_perfilada.nombre = None
+            with self._lock:
+                datos['segundos'] += segundos
+                datos['perfiles'].append(perfil)
+                datos['asignaciones'] = despues.compare_to(antes, 'lineno')[:self.top]
+                datos['rss_pico_mb'] = rss_pico_mb()
+                datos['tracemalloc_pico_mb'] = max(datos['tracemalloc_pico_mb'], pico / (1024 * 1024))
+
+    def en_hilo(self, nombre, funcion, *args, **kwargs):
+        """Corre `funcion` en un hilo auxiliar, con su perfil sumado a la etapa `nombre`."""
+        datos = self._datos(nombre)
+        _etapa_perfilada.nombre = nombre
+        perfil = cProfile.Profile()
+        perfil.enable()
+        try:
+            return funcion(*args, **kwargs)
+        finally:
+            perfil.disable()
+            _etapa_perfilada.nombre = None
+            with self._lock:
+                datos['perfiles'].append(perfil)
+
+    def sumar_espera(self, recurso, segundos):
+        datos = self._datos(getattr(_etapa_perfilada, 'nombre', None) or 'fuera de etapas')
+        with self._lock:
+            datos['espera'][recurso] += segundos
+
+    @contextmanager
+    def esperando(self, recurso):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.sumar_espera(recurso, time.perf_counter() - inicio)
+
+    def informe(self):
+        """Texto del informe: etapas por tiempo y, por etapa, funciones y asignaciones principales."""
+        def ubicacion(ruta, linea, funcion):
+            if ruta == '~':
+                return re.sub(r' at 0x[0-9a-f]+', '', funcion)
+            return f"{os.path.join(*ruta.split(os.sep)[-2:])}:{linea}({funcion})"
+
+        ranking = sorted(self.etapas.items(), key=lambda e: e[1]['segundos'], reverse=True)
+        lineas = [
+            "Etapas por tiempo (base y API incluyen la espera de los hilos auxiliares, que",
+            "corre en paralelo: pueden sumar mas que el total; resto = total - esperas)",
+            f"{'etapa':<28}{'total':>9}{'base':>9}{'API':>9}{'resto':>9}{'RSS MB':>9}{'traza MB':>10}",
+        ]
+        for nombre, datos in ranking:
+            base, api = datos['espera']['base'], datos['espera']['api']
+            resto = max(0.0, datos['segundos'] - base - api)
+            lineas.append(f"{nombre:<28}{datos['segundos']:>8.1f}s{base:>8.1f}s{api:>8.1f}s{resto:>8.1f}s"
+                          f"{datos['rss_pico_mb']:>9.0f}{datos['tracemalloc_pico_mb']:>10.0f}")
+
+        for nombre, datos in ranking:
+            if not datos['perfiles']:
+                continue
+            stats = pstats.Stats(*datos['perfiles'])
+            lineas += ['', f"{nombre}: funciones por tiempo propio (tottime, cumtime, llamadas)"]
+            funciones = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:self.top]
+            for clave, (_, llamadas, propio, acumulado, _) in funciones:
+                lineas.append(f"  {propio:8.2f}s {acumulado:8.2f}s {llamadas:>10}  {ubicacion(*clave)}")
+            if datos['asignaciones']:
+                lineas.append(f"{nombre}: memoria retenida al terminar, por linea (tracemalloc)")
+                for diferencia in datos['asignaciones']:
+                    marco = diferencia.traceback[0]
+                    lineas.append(f"  {diferencia.size_diff / (1024 * 1024):+8.1f} MB {diferencia.count_diff:>+10}  "
+                                  f"{ubicacion(marco.filename, marco.lineno, '')}")
+        return '\n'.join(lineas) + '\n'
+
+    def escribir(self):
+        """Un .pstats por etapa (para snakeviz, pstats, etc.) e informe.txt en el directorio."""
+        os.makedirs(self.directorio, exist_ok=True)
+        for nombre, datos in self.etapas.items():
+            if datos['perfiles']:
+                pstats.Stats(*datos['perfiles']).dump_stats(
+                    os.path.join(self.directorio, f"{nombre.replace(' ', '_')}.pstats"))
+        ruta = os.path.join(self.directorio, 'informe.txt')
+        with open(ruta, 'w', encoding='utf-8') as f:
+            f.write(self.informe())
+        tracemalloc.stop()
+        log(f"  Perfil: {ruta}")
+
+
+def etapa_perfilada(funcion):
+    """Con --profile, perfila cada llamada a `funcion` como una etapa; sin el, la llama directo."""
+    @functools.wraps(funcion)
+    def envoltura(*args, **kwargs):
+        if PERFIL is None or getattr(_etapa_perfilada, 'nombre', None):
+            return funcion(*args, **kwargs)
+        with PERFIL.etapa(funcion.__name__):
+            return funcion(*args, **kwargs)
+    return envoltura
+
+
+def en_hilo(funcion):
+    """
+    Envuelve `funcion` para correrla en otro hilo: con --profile queda
+    perfilada dentro de la etapa desde la que se lanza; sin el, es la misma.
+    """
+    nombre = getattr(_etapa_perfilada, 'nombre', None) if PERFIL is not None else None
+    if nombre is None:
+        return funcion
+    return functools.partial(PERFIL.en_hilo, nombre, funcion)
+
+
+class CursorMedido(psycopg2.extensions.cursor):
+    """Cursor que suma a la etapa el tiempo esperando a la base (solo con --profile)."""
+
+    def execute(self, query, vars=None):
+        with PERFIL.esperando('base'):
+            return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        with PERFIL.esperando('base'):
+            return super().executemany(query, vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        with PERFIL.esperando('base'):
+            return super().copy_expert(sql, file, size)
+
+
+class ConexionMedida(psycopg2.extensions.connection):
+    """Conexion con CursorMedido y commits medidos (solo con --profile)."""
+
+    def cursor(self, *args, **kwargs):
+        kwargs.setdefault('cursor_factory', CursorMedido)
+        return super().cursor(*args, **kwargs)
+
+    def commit(self):
+        with PERFIL.esperando('base'):
+            return super().commit()
+
+
+# ============================================================
+# CACHE DE EMBEDDINGS (SQLite, por modelo + dimensiones + texto)
+# ============================================================
+_cache_embeddings = {}
+_lock_cache_embeddings = threading.Lock()
+ESTADISTICAS_EMBEDDINGS = {'textos': 0, 'distintos': 0, 'cache': 0, 'api': 0, 'requests': 0, 'tokens': 0}
+_lock_estadisticas = threading.Lock()
+REINTENTAR_RECHAZADOS = False  # --reintentar-rechazados: volver a pedir los textos ya rechazados
+
+
+def sumar_estadisticas(**valores):
+    """Suma a ESTADISTICAS_EMBEDDINGS (prestadores y nomencladores pueden cargarse a la vez)."""
+    with _lock_estadisticas:
+        for clave, valor in valores.items():
+            ESTADISTICAS_EMBEDDINGS[clave] += valor
+
+
+def _conexion_cache_embeddings():
+    if not EMBEDDING_CACHE_PATH:
+        return None
+    with _lock_cache_embeddings:
+        if EMBEDDING_CACHE_PATH not in _cache_embeddings:
+            try:
+                os.makedirs(os.path.dirname(EMBEDDING_CACHE_PATH) or '.', exist_ok=True)
+                # Se usa desde el hilo de embeddings del pipeline; los accesos van con lock
+                db = sqlite3.connect(EMBEDDING_CACHE_PATH, check_same_thread=False)
+                db.execute("""
+                    CREATE TABLE IF NOT EXISTS embeddings (
+                        modelo TEXT NOT NULL,
+                        dimensiones INTEGER NOT NULL,
+                        hash_texto TEXT NOT NULL,
+                        vector BLOB NOT NULL,
+                        PRIMARY KEY (modelo, dimensiones, hash_texto)
+                    ) WITHOUT ROWID
+                """)
+                db.execute("""
+                    CREATE TABLE IF NOT EXISTS rechazados (
+                        modelo TEXT NOT NULL,
+                        hash_texto TEXT NOT NULL,
+                        error TEXT NOT NULL,
+                        fecha TEXT NOT NULL,
+                        PRIMARY KEY (modelo, hash_texto)
+                    ) WITHOUT ROWID
+                """)
+                db.commit()
+            except sqlite3.Error as e:
+                log(f"  ADVERTENCIA: Cache de embeddings no disponible ({EMBEDDING_CACHE_PATH}): {e}")
+                db = None
+            _cache_embeddings[EMBEDDING_CACHE_PATH] = db
+        return _cache_embeddings[EMBEDDING_CACHE_PATH]
+
+
+def hash_texto(texto):
+    """Clave del texto tal como se envia a la API (ya limpio y recortado)."""
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+
+def reducir_dimensiones(vector, dimensiones):
+    """
+    Primeras `dimensiones` de un embedding de text-embedding-3 (o de cada fila
+    de una matriz), renormalizado: es lo que devuelve la API con `dimensions`.
+    """
+    recortado = np.asarray(vector, dtype=np.float32)[..., :dimensiones]
+    norma = np.linalg.norm(recortado, axis=-1, keepdims=True)
+    return recortado / np.where(norma > 0, norma, 1)
+
+
+def leer_cache_embeddings(textos):
+    """
+    {texto: vector float32} para los `textos` que ya estan en la cache. Con
+    dimensiones reducidas, los textos que solo estan con las dimensiones
+    completas se recortan de ahi en vez de volver a pedirlos a la API.
+    """
+    db = _conexion_cache_embeddings()
+    if db is None or not textos:
+        return {}
+
+    por_hash = {hash_texto(t): t for t in textos}
+    encontrados = {}
+    for dimensiones in dict.fromkeys([EMBEDDING_DIMENSIONS, EMBEDDING_DIMENSIONS_MODELO]):
+        hashes = [h for h, t in por_hash.items() if t not in encontrados]
+        for i in range(0, len(hashes), 500):
+            lote = hashes[i:i + 500]
+            with _lock_cache_embeddings:
+                filas = db.execute(
+                    f"SELECT hash_texto, vector FROM embeddings WHERE modelo = ? AND dimensiones = ? "
+                    f"AND hash_texto IN ({','.join('?' * len(lote))})",
+                    [EMBEDDING_MODEL, dimensiones, *lote]
+                ).fetchall()
+            for h, vector in filas:
+                vector = np.frombuffer(vector, dtype='<f4')
+                if dimensiones != EMBEDDING_DIMENSIONS:
+                    vector = reducir_dimensiones(vector, EMBEDDING_DIMENSIONS)
+                encontrados[por_hash[h]] = vector
+    return encontrados
+
+
+def guardar_cache_embeddings(vectores):
+    """Guarda {texto: vector}; se llama por batch para no perder lo ya pagado si la carga se corta."""
+    db = _conexion_cache_embeddings()
+    if db is None or not vectores:
+        return
+    filas = [(EMBEDDING_MODEL, EMBEDDING_DIMENSIONS, hash_texto(t), np.asarray(v, dtype='<f4').tobytes())
+             for t, v in vectores.items()]
+    with _lock_cache_embeddings:
+        db.executemany(
+            "INSERT OR REPLACE INTO embeddings (modelo, dimensiones, hash_texto, vector) VALUES (?, ?, ?, ?)",
+            filas
+        )
+        db.commit()
+
+
+def leer_rechazados(textos):
+    """
+    {texto: error} de los `textos` que la API ya rechazo con este modelo. La
+    clave es el hash del texto: si el texto de origen cambia, se vuelve a pedir.
+    """
+    db = _conexion_cache_embeddings()
+    if db is None or not textos or REINTENTAR_RECHAZADOS:
+        return {}
+    por_hash = {hash_texto(t): t for t in textos}
+    hashes = list(por_hash)
+    encontrados = {}
+    for i in range(0, len(hashes), 500):
+        lote = hashes[i:i + 500]
+        with _lock_cache_embeddings:
+            filas = db.execute(
+                f"SELECT hash_texto, error FROM rechazados WHERE modelo = ? "
+                f"AND hash_texto IN ({','.join('?' * len(lote))})",
+                [EMBEDDING_MODEL, *lote]
+            ).fetchall()
+        encontrados.update((por_hash[h], error) for h, error in filas)
+    return encontrados
+
+
+def guardar_rechazados(rechazados):
+    """Guarda {texto: error} de los textos que la API rechazo, para no volver a pedirlos."""
+    db = _conexion_cache_embeddings()
+    if db is None or not rechazados:
+        return
+    fecha = datetime.now().isoformat(timespec='seconds')
+    with _lock_cache_embeddings:
+        db.executemany(
+            "INSERT OR REPLACE INTO rechazados (modelo, hash_texto, error, fecha) VALUES (?, ?, ?, ?)",
+            [(EMBEDDING_MODEL, hash_texto(t), error, fecha) for t, error in rechazados.items()]
+        )
+        db.commit()
+
+
+class TextosRechazados:
+    """
+    Dead-letter de embeddings: CSV con las filas cuyo texto rechazo la API
+    (tabla, id, error). Como el de acuerdos, se crea con el primer rechazo.
+    """
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self.total = 0
+        self.conocidos = 0
+        self._lock = threading.Lock()
+        if ruta and os.path.exists(ruta):
+            os.remove(ruta)
+
+    def agregar(self, tabla, filas):
+        """Agrega filas (id, texto, error, ya_conocido) de `tabla`."""
+        if not filas:
+            return
+        with self._lock:
+            self.total += len(filas)
+            self.conocidos += sum(1 for fila in filas if fila[3])
+            if not self.ruta:
+                return
+            os.makedirs(os.path.dirname(self.ruta) or '.', exist_ok=True)
+            nuevo = not os.path.exists(self.ruta)
+            with open(self.ruta, 'a', newline='', encoding='utf-8') as f:
+                escritor = csv.writer(f)
+                if nuevo:
+                    escritor.writerow(['tabla', 'id', 'hash_texto', 'origen', 'error', 'texto'])
+                escritor.writerows(
+                    [tabla, id_fila, hash_texto(texto), 'conocido' if conocido else 'api', error, texto]
+                    for id_fila, texto, error, conocido in filas
+                )
+
+    def resumen(self):
+        if not self.total:
+            return
+        destino = f" (ver {self.ruta})" if self.ruta else ""
+        log(f"  Textos rechazados por la API: {self.total} filas, "
+            f"{self.conocidos} ya rechazadas en cargas anteriores{destino}")
+
+
+RECHAZOS_EMBEDDINGS = None  # TextosRechazados de la corrida en curso
+
+
+def resumen_cache_embeddings():
+    e = ESTADISTICAS_EMBEDDINGS
+    if not e['textos']:
+        return
+    log(f"  Embeddings: {e['textos']} textos, {e['distintos']} distintos "
+        f"({e['textos'] - e['distintos']} duplicados no enviados)")
+    if EMBEDDING_CACHE_PATH:
+        tasa = 100 * e['cache'] / e['distintos']
+        log(f"  Cache de embeddings: {e['cache']}/{e['distintos']} aciertos ({tasa:.1f}%), "
+            f"{e['api']} pedidos a la API")
+    if e['requests']:
+        log(f"  API de embeddings: {e['requests']} requests, "
+            f"{e['tokens'] / e['requests']:.0f} tokens/request")
+    if RECHAZOS_EMBEDDINGS is not None:
+        RECHAZOS_EMBEDDINGS.resumen()
+
+
+# ============================================================
+# MOTOR DE EMBEDDINGS (batches concurrentes + limite RPM/TPM)
+# ============================================================
+class CuboTokens:
+    """
+    Token bucket con `por_minuto` unidades que se reponen de forma continua.
+    Compartido entre hilos; `pausar` bloquea a todos (p.ej. tras un 429).
+    """
+
+    def __init__(self, por_minuto):
+        self.capacidad = por_minuto
+        self.disponible = float(por_minuto)
+        self.ultimo = time.monotonic()
+        self.pausa_hasta = 0.0
+        self.lock = threading.Lock()
+
+    def tomar(self, cantidad=1):
+        cantidad = min(cantidad, self.capacidad)
+        while True:
+            with self.lock:
+                ahora = time.monotonic()
+                self.disponible = min(self.capacidad,
+                                      self.disponible + (ahora - self.ultimo) * self.capacidad / 60)
+                self.ultimo = ahora
+                if ahora >= self.pausa_hasta and self.disponible >= cantidad:
+                    self.disponible -= cantidad
+                    return
+                espera = max(self.pausa_hasta - ahora,
+                             (cantidad - self.disponible) * 60 / self.capacidad)
+            time.sleep(espera)
+
+    def pausar(self, segundos):
+        with self.lock:
+            self.pausa_hasta = max(self.pausa_hasta, time.monotonic() + segundos)
+
+
+_limites_api = {}
+_lock_limites_api = threading.Lock()
+
+
+def limites_api():
+    """Cubos RPM/TPM compartidos por todas las llamadas (y todos los hilos) del proceso."""
+    with _lock_limites_api:
+        if not _limites_api:
+            _limites_api['rpm'] = CuboTokens(EMBEDDING_RPM)
+            _limites_api['tpm'] = CuboTokens(EMBEDDING_TPM)
+        return _limites_api['rpm'], _limites_api['tpm']
+
+
+_tokenizador = {}
+_PIEZAS_TEXTO = re.compile(r'\w+|[^\w\s]')
+
+
+def tokenizador():
+    """Encoding de tiktoken del modelo, o None si no esta instalado o no se puede cargar."""
+    if 'encoding' not in _tokenizador:
+        encoding = None
+        if tiktoken is not None:
+            try:
+                encoding = tiktoken.encoding_for_model(EMBEDDING_MODEL)
+            except Exception as e:
+                log(f"  ADVERTENCIA: tiktoken no disponible, se estiman los tokens: {e}")
+        _tokenizador['encoding'] = encoding
+    return _tokenizador['encoding']
+
+
+def recortar_tokens(texto, max_tokens):
+    """
+    (texto recortado a `max_tokens` tokens, cantidad de tokens). Sin tiktoken
+    se cuenta por palabra/signo a razon de 3 caracteres por token (estimacion
+    por exceso para espanol) y el corte cae entre palabras.
+    """
+    encoding = tokenizador()
+    if encoding is not None:
+        ids = encoding.encode(texto, disallowed_special=())
+        if len(ids) > max_tokens:
+            return encoding.decode(ids[:max_tokens]), max_tokens
+        return texto, len(ids)
+
+    total = 0
+    for pieza in _PIEZAS_TEXTO.finditer(texto):
+        tokens = (pieza.end() - pieza.start() + 2) // 3
+        if total + tokens > max_tokens:
+            return texto[:pieza.start()].rstrip(), total
+        total += tokens
+    return texto, total
+
+
+def planificar_batches(textos, tokens, max_textos=None, max_tokens=None):
+    """
+    Agrupa `textos` en orden, cerrando cada batch al llegar a `max_textos`
+    textos o cuando el siguiente pasaria de `max_tokens` tokens.
+    """
+    max_textos = max_textos or EMBEDDING_BATCH_SIZE
+    max_tokens = max_tokens or EMBEDDING_BATCH_TOKENS
+    batches, actual, suma = [], [], 0
+    for texto in textos:
+        n = tokens[texto]
+        if actual and (len(actual) >= max_textos or suma + n > max_tokens):
+            batches.append(actual)
+            actual, suma = [], 0
+        actual.append(texto)
+        suma += n
+    if actual:
+        batches.append(actual)
+    return batches
+
+
+def segundos_reintento(error, intento):
+    """Retry-After(-ms) de la respuesta si lo hay; si no, backoff exponencial."""
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000
+        if headers.get('retry-after'):
+            valor = headers['retry-after']
+            try:
+                return max(0.0, float(valor))
+            except ValueError:
+                return max(0.0, parsedate_to_datetime(valor).timestamp() - time.time())
+    except (TypeError, ValueError):
+        pass
+    return 2 ** intento
+
+
+# Respuestas de la API que rechazan el contenido del request: reintentarlo igual no sirve
+ESTADOS_ENTRADA_RECHAZADA = (400, 413, 422)
+# Si ya anduvo algun request en este proceso (el modelo y las dimensiones no cambian
+# durante la corrida): desde ahi un rechazo es del texto, no de la configuracion
+_estado_api = {'respondio': False}
+
+
+class EntradaRechazada(Exception):
+    """La API rechazo el contenido de un batch; quien llama lo parte para aislar los textos."""
+
+    def __init__(self, mensaje, estado=None):
+        super().__init__(mensaje)
+        self.estado = estado
+
+    @property
+    def permanente(self):
+        """
+        Si el rechazo depende del texto y vale guardarlo. Un 413 o un limite
+        de tokens dependen del tamaño del request o del recorte: no.
+        """
+        return self.estado != 413 and 'token' not in str(self).lower()
+
+    @property
+    def posicion(self):
+        """Indice del texto del batch que nombra el error (`input[3]`), o None."""
+        nombrado = re.search(r'input\[(\d+)\]', str(self))
+        return int(nombrado.group(1)) if nombrado else None
+
+
+def pedir_embeddings(client, batch, tokens, desc_batch):
+    """
+    Un request a la API con reintentos. Devuelve ({texto: vector}, tokens del
+    request segun `usage`, o `tokens` estimados si no viene); ({}, 0) si se
+    agotan. Si la API rechaza el contenido, EntradaRechazada sin reintentar.
+    """
+    rpm, tpm = limites_api()
+    dimensiones = {}
+    if EMBEDDING_DIMENSIONS != EMBEDDING_DIMENSIONS_MODELO:
+        dimensiones['dimensions'] = EMBEDDING_DIMENSIONS
+    for intento in range(5):
+        rpm.tomar()
+        tpm.tomar(tokens)
+        inicio = time.perf_counter()
+        try:
+            response = client.embeddings.create(
+                model=EMBEDDING_MODEL,
+                input=batch,
+                encoding_format='base64',
+                **dimensiones
+            )
+            METRICAS.observar('embeddings_request_segundos', time.perf_counter() - inicio, resultado='ok')
+            if PERFIL is not None:
+                PERFIL.sumar_espera('api', time.perf_counter() - inicio)
+            usados = getattr(getattr(response, 'usage', None), 'prompt_tokens', None) or tokens
+            _estado_api['respondio'] = True
+            return {batch[item.index]: vector_de_respuesta(item.embedding) for item in response.data}, usados
+        except Exception as e:
+            limitado = getattr(e, 'status_code', None) == 429
+            rechazada = getattr(e, 'status_code', None) in ESTADOS_ENTRADA_RECHAZADA
+            if PERFIL is not None:
+                PERFIL.sumar_espera('api', time.perf_counter() - inicio)
+            METRICAS.observar('embeddings_request_segundos', time.perf_counter() - inicio,
+                              resultado='rate_limit' if limitado else 'rechazo' if rechazada else 'error')
+            if rechazada:
+                raise EntradaRechazada(str(e), getattr(e, 'status_code', None)) from e
+            if intento < 4:
+                wait = segundos_reintento(e, intento)
+                if limitado:
+                    rpm.pausar(wait)
+                METRICAS.sumar('embeddings_reintentos_total', motivo='rate_limit' if limitado else 'error')
+                log(f"  Reintento {intento+1}/5 en {wait:.1f}s: {e}")
+                time.sleep(wait)
+            else:
+                METRICAS.sumar('embeddings_batches_fallidos_total')
+                log(f"  ERROR: No se pudieron generar embeddings para batch {desc_batch}: {e}")
+    return {}, 0
+
+
+def generar_embeddings_batch(client, textos, desc="", detalle=True, tabla=None, ids=None):
+    """
+    Embeddings de `textos` en el mismo orden (None si el texto esta vacio,
+    fallo o la API lo rechaza). Con detalle=False no se loguea el avance (lo
+    hace quien llama). Las filas cuyo texto se rechaza van al dead-letter de
+    embeddings con su `tabla` e id (`ids`, en el orden de `textos`).
+
+    Un batch rechazado se parte en mitades. Un texto solo se guarda como
+    rechazado si el error lo nombra o si algun request de la corrida ya
+    anduvo: si no, el problema puede ser del request (modelo, dimensiones) y
+    no del texto. Si todos los textos de un batch fallan solos con el mismo
+    error y nada anduvo todavia, se pide un texto que ya tiene vector; si
+    la API tambien lo rechaza (o no hay ninguno), la carga se corta.
+    """
     if not textos:
         return []
 
@@ -95,164 +1037,1285 @@ def generar_embeddings_batch(client, textos, desc=""):
     textos_limpios = []
     for t in textos:
         t_str = str(t).strip() if t and not pd.isna(t) else ''
-        textos_limpios.append(t_str[:8000] if t_str else '')
+        textos_limpios.append(t_str)
 
     idx_con_texto = [i for i, t in enumerate(textos_limpios) if t]
-    textos_a_embeddear = [textos_limpios[i] for i in idx_con_texto]
-
-    if not textos_a_embeddear:
+    if not idx_con_texto:
         return all_embeddings
 
-    log(f"  Generando {len(textos_a_embeddear)} embeddings {desc}...")
-
+    # Recorte por tokens (no por caracteres), una vez por texto distinto
+    recortes = {t: recortar_tokens(t, EMBEDDING_MAX_TOKENS_TEXTO)
+                for t in dict.fromkeys(textos_limpios[i] for i in idx_con_texto)}
+    textos_a_embeddear = [recortes[textos_limpios[i]][0] for i in idx_con_texto]
+    tokens = dict(recortes.values())
+
+    # Textos repetidos se piden una sola vez; los ya embebidos salen de la cache
+    distintos = list(dict.fromkeys(textos_a_embeddear))
+    vectores = leer_cache_embeddings(distintos)
+    pendientes = [t for t in distintos if t not in vectores]
+    # Los que la API ya rechazo no se vuelven a pedir mientras el texto no cambie
+    rechazados = leer_rechazados(pendientes)
+    conocidos = set(rechazados)
+    pendientes = [t for t in pendientes if t not in rechazados]
+    sumar_estadisticas(textos=len(textos_a_embeddear), distintos=len(distintos), cache=len(vectores))
+
+    if detalle:
+        log(f"  Generando {len(textos_a_embeddear)} embeddings {desc}: {len(distintos)} distintos, "
+            f"{len(vectores)} en cache, {len(pendientes)} a la API...")
+
+    # Hasta EMBEDDING_CONCURRENCY requests en vuelo; la cache (SQLite) se escribe
+    # solo desde este hilo a medida que llegan los resultados
     procesados = 0
-    for batch_start in range(0, len(textos_a_embeddear), EMBEDDING_BATCH_SIZE):
-        batch_end = min(batch_start + EMBEDDING_BATCH_SIZE, len(textos_a_embeddear))
-        batch = textos_a_embeddear[batch_start:batch_end]
-
-        for intento in range(5):
+    requests = tokens_enviados = 0
+    # Por batch original (la raiz de `n`): requests sin terminar y {texto: (error, se
+    # guarda)} de los que fallaron solos
+    en_curso, fallidos = {}, {}
+    confirmados = set()
+    # Mientras no ande ningun request se parte un solo batch (la sonda): si el
+    # rechazo es del request, asi no se pide texto por texto todo el catalogo
+    sonda, aparcados = None, []
+    with ThreadPoolExecutor(max_workers=max(1, EMBEDDING_CONCURRENCY)) as pool:
+        def enviar(batch, n):
+            futuro = pool.submit(en_hilo(pedir_embeddings), client, batch, sum(tokens[t] for t in batch), n)
+            en_vuelo[futuro] = (batch, n)
+            raiz = str(n).split('.')[0]
+            en_curso[raiz] = en_curso.get(raiz, 0) + 1
+
+        def partir(batch, n):
+            mitad = len(batch) // 2
+            enviar(batch[:mitad], f"{n}.1")
+            enviar(batch[mitad:], f"{n}.2")
+
+        def rechaza_el_request():
+            """Pide un texto que ya tiene vector (de la cache): si tambien falla, el problema es el request."""
+            control = next(iter(vectores), None)
+            if control is None:
+                return True
             try:
-                response = client.embeddings.create(
-                    model=EMBEDDING_MODEL,
-                    input=batch
-                )
-                for item in response.data:
-                    original_idx = idx_con_texto[batch_start + item.index]
-                    all_embeddings[original_idx] = item.embedding
-                procesados += len(batch)
-                break
-            except Exception as e:
-                if intento < 4:
-                    wait = 2 ** intento
-                    log(f"  Reintento {intento+1}/5 en {wait}s: {e}")
-                    time.sleep(wait)
+                pedir_embeddings(client, [control], tokens[control], 'control')
+            except EntradaRechazada:
+                return True
+            return False  # anduvo, o no se pudo saber (red): no se corta la carga
+
+        def cerrar_batch(raiz):
+            """Con el batch original ya resuelto, decide que hacer con los textos que fallaron solos."""
+            fallos = fallidos.pop(raiz, {})
+            errores = {error for error, _ in fallos.values()}
+            if (not _estado_api['respondio'] and len(fallos) > 1 and len(errores) == 1
+                    and rechaza_el_request()):
+                for futuro in en_vuelo:
+                    futuro.cancel()
+                raise RuntimeError(f"La API rechaza cada texto {desc} con el mismo error: el problema es "
+                                   f"el request (modelo, dimensiones), no los textos: {errores.pop()}")
+            for texto, (error, permanente) in fallos.items():
+                rechazados[texto] = error
+                if permanente and _estado_api['respondio']:
+                    confirmados.add(texto)
+
+        en_vuelo = {}
+        for n, batch in enumerate(planificar_batches(pendientes, tokens), 1):
+            enviar(batch, n)
+        while en_vuelo:
+            listos, _ = wait(en_vuelo, return_when=FIRST_COMPLETED)
+            for futuro in listos:
+                batch, n = en_vuelo.pop(futuro)
+                raiz = str(n).split('.')[0]
+                en_curso[raiz] -= 1
+                try:
+                    nuevos, usados = futuro.result()
+                except EntradaRechazada as e:
+                    posicion = e.posicion
+                    if posicion is not None and posicion < len(batch):
+                        # El error nombra el texto: se aparta y el resto se vuelve a pedir
+                        rechazados[batch[posicion]] = str(e)
+                        if e.permanente:
+                            confirmados.add(batch[posicion])
+                        log(f"  ADVERTENCIA: La API rechazo un texto {desc} ({batch[posicion][:60]!r}): {e}")
+                        if len(batch) > 1:
+                            enviar(batch[:posicion] + batch[posicion + 1:], f"{n}.r")
+                    elif len(batch) == 1:
+                        fallidos.setdefault(raiz, {})[batch[0]] = (str(e), e.permanente)
+                        log(f"  ADVERTENCIA: La API rechazo un texto {desc} ({batch[0][:60]!r}): {e}")
+                    elif sonda and sonda != raiz and not _estado_api['respondio']:
+                        aparcados.append((batch, n))
+                    else:
+                        # Se parte hasta aislar los textos rechazados; el resto se embebe igual
+                        if sonda is None:
+                            sonda = raiz
+                        partir(batch, n)
                 else:
-                    log(f"  ERROR: No se pudieron generar embeddings para batch {batch_start}: {e}")
+                    guardar_cache_embeddings(nuevos)
+                    vectores.update(nuevos)
+                    sumar_estadisticas(api=len(nuevos))
+                    if nuevos:
+                        for parado in aparcados:
+                            partir(*parado)
+                        aparcados.clear()
+                        procesados += len(batch)
+                        requests += 1
+                        tokens_enviados += usados
+
+                    if detalle and (procesados // 1000 > (procesados - len(batch)) // 1000
+                                    or procesados == len(pendientes)):
+                        log(f"  Progreso embeddings: {procesados}/{len(pendientes)}")
+                if not en_curso[raiz] and raiz in fallidos:
+                    cerrar_batch(raiz)
+                if not en_curso[raiz] and raiz == sonda:
+                    sonda = False  # el rechazo no es del request: se parten los demas
+                    for parado in aparcados:
+                        partir(*parado)
+                    aparcados.clear()
+
+    nuevos_rechazos = {t: error for t, error in rechazados.items() if t not in conocidos}
+    # Solo los confirmados quedan guardados; el resto se vuelve a pedir en la proxima carga
+    guardar_rechazados({t: error for t, error in nuevos_rechazos.items() if t in confirmados})
+    if rechazados:
+        METRICAS.sumar('embeddings_rechazados_total', len(nuevos_rechazos), origen='api')
+        METRICAS.sumar('embeddings_rechazados_total', len(conocidos), origen='conocido')
+        if RECHAZOS_EMBEDDINGS is not None and ids is not None:
+            RECHAZOS_EMBEDDINGS.agregar(tabla, [
+                (ids[i], textos_limpios[i], rechazados[texto], texto in conocidos)
+                for i, texto in zip(idx_con_texto, textos_a_embeddear) if texto in rechazados
+            ])
+
+    if requests:
+        sumar_estadisticas(requests=requests, tokens=tokens_enviados)
+    if requests and detalle:
+        log(f"  Requests: {requests}, {tokens_enviados / requests:.0f} tokens/request, "
+            f"{procesados / requests:.0f} textos/request "
+            f"(techo {EMBEDDING_BATCH_TOKENS} tokens, {EMBEDDING_BATCH_SIZE} textos)")
+
+    for i, texto in zip(idx_con_texto, textos_a_embeddear):
+        all_embeddings[i] = vectores.get(texto)
+
+    if detalle:
+        generados = sum(1 for e in all_embeddings if e is not None)
+        log(f"  Embeddings generados: {generados}/{total}")
+    return all_embeddings
 
-        if procesados % 1000 == 0 or procesados == len(textos_a_embeddear):
-            log(f"  Progreso embeddings: {procesados}/{len(textos_a_embeddear)}")
 
-        time.sleep(0.1)
-
-    generados = sum(1 for e in all_embeddings if e is not None)
-    log(f"  Embeddings generados: {generados}/{total}")
-    return all_embeddings
+def vector_de_respuesta(embedding):
+    """
+    Embedding de la API como array float32. Con encoding_format='base64' la API
+    devuelve los float32 crudos (little endian); si llega como lista de floats
+    se convierte igual.
+    """
+    if isinstance(embedding, str):
+        return np.frombuffer(base64.b64decode(embedding), dtype='<f4')
+    return np.asarray(embedding, dtype=np.float32)
 
 
 def embedding_to_pgvector(embedding):
+    """Literal de texto de pgvector; solo se usa cuando no se escribe en binario."""
     if embedding is None:
         return None
+    if isinstance(embedding, np.ndarray) and EMBEDDING_TYPE == 'halfvec':
+        # Se redondea a float16 aca para que la base guarde el mismo valor; 5 digitos alcanzan
+        return '[' + ','.join(['%.5g'] * len(embedding)) % tuple(embedding.astype(np.float16).tolist()) + ']'
+    if isinstance(embedding, np.ndarray):
+        # 9 digitos significativos alcanzan para reconstruir exactamente un float32
+        return '[' + ','.join(['%.9g'] * len(embedding)) % tuple(embedding.tolist()) + ']'
     return f"[{','.join(map(str, embedding))}]"
 
 
+def embedding_to_pgvector_binario(embedding):
+    """Formato binario de pgvector (vector_recv): dim int16, int16 sin uso, float4 big endian."""
+    valores = np.asarray(embedding, dtype='>f4')
+    return struct.pack('!hh', len(valores), 0) + valores.tobytes()
+
+
+def embedding_to_halfvec_binario(embedding):
+    """Formato binario de halfvec (halfvec_recv): igual que vector pero con float2 big endian."""
+    valores = np.asarray(embedding, dtype='>f2')
+    return struct.pack('!hh', len(valores), 0) + valores.tobytes()
+
+
+# Los arrays de NumPy que llegan a execute_values/cur.execute se escriben como literal de pgvector
+register_adapter(np.ndarray, lambda arr: AsIs(f"'{embedding_to_pgvector(arr)}'"))
+
+
 # ============================================================
-# CARGAR PRESTADORES
+# LECTURA DE EXCEL (cada archivo se parsea una sola vez)
 # ============================================================
-def cargar_prestadores(conn, client, skip_embeddings=False):
-    log("=" * 60)
-    log("CARGANDO PRESTADORES")
-    log("=" * 60)
+COLUMNAS_PRESTADOR = {
+    'ID_PRESTADOR': 'id_prestador',
+    'RUC': 'ruc',
+    'NOMBRE_FANTASIA': 'nombre_fantasia',
+    'RAZ_SOC_NOMBRE': 'raz_soc_nombre',
+    'RAZON_SOCIAL': 'raz_soc_nombre',
+    'RANKING': 'ranking',
+    'REGISTRO_PROFESIONAL': 'registro_profesional',
+    'CANTIDAD': 'cantidad_acuerdos',
+}
 
-    df = pd.read_excel(EXCEL_PRESTADORES, sheet_name=0)
-    log(f"  Filas en Excel: {len(df)}")
-    log(f"  Columnas: {list(df.columns)}")
+COLUMNAS_NOMENCLADOR = {
+    'ID_NOMENCLADOR': 'id_nomenclador',
+    'ESPECIALIDAD': 'especialidad',
+    'NOMEN_DESCRIPCION_DET': 'descripcion',
+    'DESCRIPCION': 'descripcion',
+    'ID_NOMENCLADOR2': 'id_nomenclador2',
+    'ID_SERVICIO': 'id_servicio',
+    'DESC_NOMENCLADOR': 'desc_nomenclador',
+}
 
-    col_map = {}
-    for col in df.columns:
-        col_upper = str(col).strip().upper()
-        if col_upper == 'ID_PRESTADOR':
-            col_map['id_prestador'] = col
-        elif col_upper == 'RUC':
-            col_map['ruc'] = col
-        elif col_upper == 'NOMBRE_FANTASIA':
-            col_map['nombre_fantasia'] = col
-        elif col_upper in ('RAZ_SOC_NOMBRE', 'RAZON_SOCIAL'):
-            col_map['raz_soc_nombre'] = col
-        elif col_upper == 'RANKING':
-            col_map['ranking'] = col
-        elif col_upper == 'REGISTRO_PROFESIONAL':
-            col_map['registro_profesional'] = col
-        elif col_upper == 'CANTIDAD':
-            col_map['cantidad_acuerdos'] = col
-
-    if 'id_prestador' not in col_map or 'nombre_fantasia' not in col_map:
-        log("ERROR: Columnas obligatorias no encontradas (ID_PRESTADOR, NOMBRE_FANTASIA)")
-        return 0
+COLUMNAS_ACUERDO = {
+    'ID_NOMENCLADOR': 'id_nomenclador',
+    'PREST_ID_PRESTADOR': 'prest_id_prestador',
+    'PLAN_ID_PLAN': 'plan_id_plan',
+    'PRECIO': 'precio',
+    'PRECIO_NORMAL': 'precio_normal',
+    'PRECIO_DIFERENCIADO': 'precio_diferenciado',
+    'PRECIO_INTERNADO': 'precio_internado',
+}
+
+REQUERIDAS_PRESTADOR = ('id_prestador', 'nombre_fantasia')
+REQUERIDAS_NOMENCLADOR = ('id_nomenclador', 'descripcion')
+REQUERIDAS_ACUERDO = ('id_nomenclador', 'prest_id_prestador', 'plan_id_plan')
+
+CAMPOS_NOMENCLADOR = [
+    'id_nomenclador', 'especialidad', 'descripcion',
+    'id_nomenclador2', 'id_servicio', 'desc_nomenclador',
+]
+CAMPOS_ACUERDO = [
+    'id_nomenclador', 'prest_id_prestador', 'plan_id_plan',
+    'precio', 'precio_normal', 'precio_diferenciado', 'precio_internado',
+]
 
-    df_clean = pd.DataFrame()
-    df_clean['id_prestador'] = pd.to_numeric(df[col_map['id_prestador']], errors='coerce')
-    df_clean['nombre_fantasia'] = df[col_map['nombre_fantasia']].apply(limpiar_texto)
-    df_clean['ruc'] = df[col_map.get('ruc', col_map['nombre_fantasia'])].apply(
-        lambda x: str(x).strip() if pd.notna(x) else None
-    ) if 'ruc' in col_map else None
-    df_clean['raz_soc_nombre'] = df[col_map.get('raz_soc_nombre', col_map['nombre_fantasia'])].apply(limpiar_texto) if 'raz_soc_nombre' in col_map else df_clean['nombre_fantasia']
-    df_clean['registro_profesional'] = df[col_map.get('registro_profesional', col_map['nombre_fantasia'])].apply(
-        lambda x: str(x).strip() if pd.notna(x) else None
-    ) if 'registro_profesional' in col_map else None
-    df_clean['ranking'] = pd.to_numeric(df[col_map.get('ranking', col_map['id_prestador'])], errors='coerce').fillna(0) if 'ranking' in col_map else 0
-    df_clean['cantidad_acuerdos'] = pd.to_numeric(df[col_map.get('cantidad_acuerdos', col_map['id_prestador'])], errors='coerce').fillna(0).astype(int) if 'cantidad_acuerdos' in col_map else 0
+# Libros ya procesados en este proceso, por ruta de archivo
+_libros_leidos = {}
+
+
+def mapear_columnas(columnas, reglas):
+    """Mapea encabezados del Excel a claves internas segun `reglas`."""
+    col_map = {}
+    for col in columnas:
+        clave = reglas.get(str(col).strip().upper())
+        if clave:
+            col_map[clave] = col
+    return col_map
+
+
+def sin_nan(df):
+    """Copia de `df` con None en lugar de NaN (psycopg2 envia NaN como float)."""
+    return df.astype(object).where(df.notna(), None)
+
+
+def filas_como_tuplas(df):
+    return list(sin_nan(df).itertuples(index=False, name=None))
+
+
+def con_columnas_del_tenant(registros, df):
+    """Con --tenant, agrega id_externo y tenant_id (al final, como en con_columnas_tenant)."""
+    if TENANT is None:
+        return registros
+    registros['id_externo'] = df['id_externo'].to_numpy()
+    registros['tenant_id'] = TENANT.id
+    return registros
+
+
+def registros_prestadores(df_clean, embeddings):
+    """Tuplas para el INSERT de prestadores, en el orden de columnas del SQL."""
+    return filas_como_tuplas(con_columnas_del_tenant(pd.DataFrame({
+        'id_prestador': df_clean['id_prestador'].astype('int64').to_numpy(),
+        'ruc': df_clean['ruc'].to_numpy(),
+        'nombre_fantasia': df_clean['nombre_fantasia'].to_numpy(),
+        'raz_soc_nombre': df_clean['raz_soc_nombre'].to_numpy(),
+        'registro_profesional': df_clean['registro_profesional'].to_numpy(),
+        'ranking': df_clean['ranking'].fillna(0).astype(float).to_numpy(),
+        'nombre_embedding': list(embeddings),
+        'nombre_normalizado': df_clean['nombre_normalizado'].to_numpy(),
+        'cantidad_acuerdos': df_clean['cantidad_acuerdos'].fillna(0).astype('int64').to_numpy(),
+    }), df_clean))
+
+
+def registros_nomencladores(df_nomen, embeddings):
+    """Tuplas para el INSERT de nomencladores, en el orden de columnas del SQL."""
+    return filas_como_tuplas(con_columnas_del_tenant(pd.DataFrame({
+        'id_nomenclador': df_nomen['id_nomenclador'].astype('int64').to_numpy(),
+        'especialidad': df_nomen['especialidad'].to_numpy(),
+        'descripcion': df_nomen['descripcion'].to_numpy(),
+        'id_nomenclador2': df_nomen['id_nomenclador2'].astype('Int64').array,
+        'id_servicio': df_nomen['id_servicio'].astype('Int64').array,
+        'desc_nomenclador': df_nomen['desc_nomenclador'].to_numpy(),
+        'grupo': df_nomen['grupo'].to_numpy(),
+        'subgrupo': df_nomen['subgrupo'].to_numpy(),
+        'descripcion_embedding': list(embeddings),
+        'descripcion_normalizada': df_nomen['descripcion_normalizada'].to_numpy(),
+    }), df_nomen))
+
+
+def procesar_prestadores(df):
+    """Limpia el Excel de prestadores (None si faltan columnas obligatorias)."""
+    col_map = mapear_columnas(df.columns, COLUMNAS_PRESTADOR)
+    if not all(k in col_map for k in REQUERIDAS_PRESTADOR):
+        return {'prestadores': None}
+
+    def columna(clave, convertir, defecto=None):
+        return convertir(df[col_map[clave]]) if clave in col_map else defecto
+
+    df_clean = pd.DataFrame({
+        'id_prestador': pd.to_numeric(df[col_map['id_prestador']], errors='coerce'),
+        'nombre_fantasia': limpiar_serie(df[col_map['nombre_fantasia']]),
+    })
+    df_clean['ruc'] = columna('ruc', recortar_serie)
+    df_clean['raz_soc_nombre'] = columna('raz_soc_nombre', limpiar_serie, df_clean['nombre_fantasia'])
+    df_clean['registro_profesional'] = columna('registro_profesional', recortar_serie)
+    df_clean['ranking'] = columna('ranking', lambda c: pd.to_numeric(c, errors='coerce').fillna(0), 0)
+    df_clean['cantidad_acuerdos'] = columna('cantidad_acuerdos', lambda c: pd.to_numeric(c, errors='coerce').fillna(0).astype(int), 0)
 
     df_clean = df_clean.dropna(subset=['id_prestador'])
     df_clean['id_prestador'] = df_clean['id_prestador'].astype(int)
     df_clean = df_clean.drop_duplicates(subset=['id_prestador'], keep='first')
-    df_clean['nombre_normalizado'] = df_clean['nombre_fantasia'].apply(normalizar_texto)
+    df_clean['nombre_normalizado'] = normalizar_serie(df_clean['nombre_fantasia'])
+    return {'prestadores': df_clean.reset_index(drop=True)}
+
+
+def procesar_libro_combinado(df, entidades=('nomencladores', 'acuerdos')):
+    """
+    Extrae nomencladores y acuerdos de un Excel combinado en una sola pasada.
+
+    Devuelve un DataFrame por entidad, o None si faltan sus columnas requeridas.
+    """
+    col_map = mapear_columnas(df.columns, {**COLUMNAS_NOMENCLADOR, **COLUMNAS_ACUERDO})
+    tiene_nomen = 'nomencladores' in entidades and all(k in col_map for k in REQUERIDAS_NOMENCLADOR)
+    tiene_acuerdos = 'acuerdos' in entidades and all(k in col_map for k in REQUERIDAS_ACUERDO)
+
+    if 'id_nomenclador' not in col_map:
+        return {'nomencladores': None, 'acuerdos': None}
+    df = df[df[col_map['id_nomenclador']].notna()]
+
+    def columna(origen, clave, convertir):
+        if clave in col_map:
+            return convertir(origen[col_map[clave]])
+        return pd.Series(None, index=origen.index, dtype=object)
+
+    nomencladores = None
+    if tiene_nomen:
+        nomencladores = pd.DataFrame({
+            'id_nomenclador': enteros_serie(df[col_map['id_nomenclador']]).astype('int64'),
+            'especialidad': columna(df, 'especialidad', limpiar_serie),
+            'descripcion': columna(df, 'descripcion', limpiar_serie),
+            'id_nomenclador2': columna(df, 'id_nomenclador2', enteros_serie),
+            'id_servicio': columna(df, 'id_servicio', enteros_serie),
+            'desc_nomenclador': columna(df, 'desc_nomenclador', limpiar_serie),
+        }, columns=CAMPOS_NOMENCLADOR).reset_index(drop=True)
+
+    acuerdos = None
+    if tiene_acuerdos:
+        df = df[df[col_map['prest_id_prestador']].notna() & df[col_map['plan_id_plan']].notna()]
+        acuerdos = pd.DataFrame({
+            'id_nomenclador': enteros_serie(df[col_map['id_nomenclador']]).astype('int64'),
+            'prest_id_prestador': enteros_serie(df[col_map['prest_id_prestador']]).astype('int64'),
+            'plan_id_plan': enteros_serie(df[col_map['plan_id_plan']]).astype('int64'),
+            'precio': columna(df, 'precio', decimales_serie),
+            'precio_normal': columna(df, 'precio_normal', decimales_serie),
+            'precio_diferenciado': columna(df, 'precio_diferenciado', decimales_serie),
+            'precio_internado': columna(df, 'precio_internado', decimales_serie),
+        }, columns=CAMPOS_ACUERDO).reset_index(drop=True)
+
+    return {'nomencladores': nomencladores, 'acuerdos': acuerdos}
+
+
+def nombre_libro(archivo):
+    """Etiqueta de un libro en las metricas: el nombre del archivo sin extension."""
+    return os.path.splitext(os.path.basename(archivo))[0]
+
+
+def expandir_libros(patrones):
+    """
+    Archivos de cada patron (archivo, directorio con sus .xlsx, o glob con **),
+    ordenados dentro de cada patron y sin repetir. Los temporales que deja
+    Excel con el libro abierto (~$...) se ignoran.
+    """
+    archivos = []
+    for patron in patrones:
+        if os.path.isdir(patron):
+            patron = os.path.join(patron, '*.xlsx')
+        for archivo in sorted(glob.glob(patron, recursive=True)):
+            archivo = os.path.abspath(archivo)
+            if os.path.isfile(archivo) and not os.path.basename(archivo).startswith('~$') and archivo not in archivos:
+                archivos.append(archivo)
+    return archivos
+
+
+def libros_combinados():
+    """
+    [(archivo, nombre)] de los Excel con nomencladores y acuerdos. El orden
+    decide los duplicados: en nomencladores gana la ultima aparicion y en
+    acuerdos la primera.
+    """
+    if LIBROS_COMBINADOS is None:
+        return [(EXCEL_NOMENCLADORES, 'NOMENCLADORES_GENERALES'), (EXCEL_ACUERDOS, 'ACUERDO_PRESTADORES')]
+    return [(archivo, nombre_libro(archivo)) for archivo in expandir_libros(LIBROS_COMBINADOS)]
+
+
+def hojas_excel(archivo):
+    """Nombres de las hojas, en orden. Lee solo el indice del .xlsx, no las hojas ni los textos."""
+    with zipfile.ZipFile(archivo) as z:
+        raiz = ElementTree.fromstring(z.read('xl/workbook.xml'))
+    return [hoja.get('name') for hoja in raiz.iter() if hoja.tag.rsplit('}', 1)[-1] == 'sheet']
+
+
+def leer_hoja(excel, archivo, nombre, hoja, procesar, varias=False):
+    """Lee y limpia una hoja de `excel` (ruta o pd.ExcelFile abierto): {entidad: DataFrame o None, 'filas'}."""
+    with medir_paso('lectura') as paso:
+        df = pd.read_excel(excel, sheet_name=hoja)
+        paso['filas'] = len(df)
+    METRICAS.sumar('filas_leidas_total', len(df), libro=nombre_libro(archivo), origen='excel')
+    log(f"  {f'{nombre} [{hoja}]' if varias else nombre}: {len(df)} filas, columnas: {list(df.columns)}")
+    with medir_paso('limpieza', len(df)):
+        resultado = procesar(df)
+    resultado['filas'] = len(df)
+    return resultado
+
+
+def unir_hojas(hojas):
+    """
+    Une lo limpiado en cada hoja de un libro, en el orden de las hojas. Una
+    entidad queda en None solo si ninguna hoja tiene sus columnas. Los
+    duplicados entre hojas los resuelve cada carga con sus reglas, salvo los
+    de prestadores, que se deduplican por hoja: entre hojas gana la primera.
+    """
+    libro = {'filas': sum(hoja['filas'] for hoja in hojas)}
+    for entidad in [clave for clave in hojas[0] if clave != 'filas']:
+        partes = [hoja[entidad] for hoja in hojas if hoja[entidad] is not None]
+        libro[entidad] = partes[0] if len(partes) == 1 else (
+            pd.concat(partes, ignore_index=True) if partes else None)
+    if len(hojas) > 1 and libro.get('prestadores') is not None:
+        libro['prestadores'] = libro['prestadores'].drop_duplicates(
+            subset=['id_prestador'], keep='first').reset_index(drop=True)
+    return libro
+
+
+def libro_de_cache(archivo, nombre):
+    """El libro desde la cache de parseo (y a _libros_leidos), o None si no hay entrada valida."""
+    with medir_paso('lectura') as paso:
+        libro = leer_cache_parseo(archivo)
+        if libro is not None:
+            paso['filas'] = libro['filas']
+    if libro is not None:
+        log(f"  {nombre}: {libro['filas']} filas (cache de parseo)")
+        METRICAS.sumar('filas_leidas_total', libro['filas'], libro=nombre_libro(archivo), origen='cache')
+        _libros_leidos[archivo] = libro
+    return libro
+
+
+def leer_libro(archivo, nombre, procesar):
+    """
+    Lee y limpia todas las hojas de un Excel a lo sumo una vez por proceso.
+
+    Busca primero en la cache de parseo en disco; si no hay entrada valida
+    parsea cada hoja con `procesar`, une los resultados y los guarda para la
+    proxima ejecucion.
+    """
+    if archivo in _libros_leidos:
+        return _libros_leidos[archivo]
+
+    libro = libro_de_cache(archivo, nombre)
+    if libro is None:
+        with medir_paso('lectura'):
+            excel = pd.ExcelFile(archivo)
+        with excel:
+            libro = unir_hojas([leer_hoja(excel, archivo, nombre, hoja, procesar, len(excel.sheet_names) > 1)
+                                for hoja in excel.sheet_names])
+        guardar_cache_parseo(archivo, libro)
+        _libros_leidos[archivo] = libro
+    return libro
+
+
+def leer_libro_combinado(archivo, nombre):
+    return leer_libro(archivo, nombre, procesar_libro_combinado)
+
+
+def _nombres_columnas(encabezado):
+    """Nombres de columna como los genera pd.read_excel (Unnamed: N, duplicados .1)."""
+    nombres = []
+    vistos = {}
+    for i, valor in enumerate(encabezado):
+        nombre = f"Unnamed: {i}" if valor is None else valor
+        if nombre in vistos:
+            vistos[nombre] += 1
+            nombre = f"{nombre}.{vistos[nombre]}"
+        else:
+            vistos[nombre] = 0
+        nombres.append(nombre)
+    return nombres
 
-    log(f"  Prestadores unicos: {len(df_clean)}")
 
-    embeddings = [None] * len(df_clean)
-    if not skip_embeddings and client:
-        embeddings = generar_embeddings_batch(
-            client,
-            df_clean['nombre_fantasia'].tolist(),
-            desc="(prestadores)"
-        )
+def iterar_excel(archivo, chunk_size):
+    """
+    Recorre todas las hojas, en orden, con openpyxl en modo read_only.
 
-    cur = conn.cursor()
-    records = []
-    for i, (_, row) in enumerate(df_clean.iterrows()):
-        records.append((
-            int(row['id_prestador']),
-            row.get('ruc'),
-            row.get('nombre_fantasia'),
-            row.get('raz_soc_nombre'),
-            row.get('registro_profesional'),
-            float(row['ranking']) if pd.notna(row.get('ranking')) else 0,
-            embedding_to_pgvector(embeddings[i]),
-            row.get('nombre_normalizado'),
-            int(row['cantidad_acuerdos']) if pd.notna(row.get('cantidad_acuerdos')) else 0,
-        ))
-
-    batch_size = 500
+    Produce DataFrames de a lo sumo `chunk_size` filas de una misma hoja, de
+    modo que la memoria usada no depende del tamano de las hojas.
+    """
+    import openpyxl  # solo el modo streaming lo usa directo; pandas lo importa al leer
+
+    wb = openpyxl.load_workbook(archivo, read_only=True, data_only=True)
+    try:
+        for hoja in wb.worksheets:
+            filas = hoja.iter_rows(values_only=True)
+            encabezado = next(filas, None)
+            if encabezado is None:
+                continue
+            columnas = _nombres_columnas(encabezado)
+            ancho = len(columnas)
+
+            while True:
+                with medir_paso('lectura') as paso:
+                    bloque = [fila if len(fila) == ancho else (tuple(fila) + (None,) * ancho)[:ancho]
+                              for fila in islice(filas, chunk_size)]
+                    paso['filas'] = len(bloque)
+                    df = pd.DataFrame(bloque, columns=columnas) if bloque else None
+                if df is None:
+                    break
+                METRICAS.sumar('filas_leidas_total', len(df), libro=nombre_libro(archivo), origen='excel')
+                yield df
+    finally:
+        wb.close()
+
+
+# ============================================================
+# CACHE DE PARSEO (Parquet, por hash de archivo + version de limpieza)
+# ============================================================
+PARSE_CACHE_FORMAT = 2  # 2: todas las hojas del libro
+
+_version_limpieza = None
+
+
+def sha256_archivo(archivo):
+    h = hashlib.sha256()
+    with open(archivo, 'rb') as f:
+        for bloque in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def version_limpieza():
+    """
+    Hash del codigo de limpieza y de las reglas de columnas.
+
+    Cualquier cambio en las funciones de limpieza (*_serie y las que usan),
+    TABLA_ACENTOS, los col_map, las columnas requeridas, las funciones
+    procesar_* o las versiones de pandas y NumPy (to_numeric y .str
+    definen los valores guardados) invalida las entradas de la cache.
+    """
+    global _version_limpieza
+    if _version_limpieza is None:
+        h = hashlib.sha256(str(PARSE_CACHE_FORMAT).encode())
+        h.update(f"pandas {pd.__version__} numpy {np.__version__}".encode())
+        for fn in (limpiar_texto, normalizar_texto, _con_none, limpiar_serie, normalizar_serie,
+                   recortar_serie, enteros_serie, decimales_serie, mapear_columnas, sin_nan,
+                   procesar_prestadores, procesar_libro_combinado, unir_hojas):
+            h.update(inspect.getsource(fn).encode())
+        h.update(json.dumps(sorted(TABLA_ACENTOS.items())).encode())
+        for reglas in (COLUMNAS_PRESTADOR, COLUMNAS_NOMENCLADOR, COLUMNAS_ACUERDO):
+            h.update(json.dumps(reglas, sort_keys=True).encode())
+        h.update(json.dumps([REQUERIDAS_PRESTADOR, REQUERIDAS_NOMENCLADOR, REQUERIDAS_ACUERDO,
+                             CAMPOS_NOMENCLADOR, CAMPOS_ACUERDO]).encode())
+        _version_limpieza = h.hexdigest()
+    return _version_limpieza
+
+
+def _prefijo_cache_parseo(archivo):
+    """Nombre y ruta del libro: libros con el mismo nombre en otras carpetas no se pisan las entradas."""
+    ruta = hashlib.sha256(os.path.abspath(archivo).encode()).hexdigest()[:8]
+    return f"{nombre_libro(archivo)}-{ruta}"
+
+
+def _dir_cache_parseo(archivo, digest):
+    return os.path.join(PARSE_CACHE_DIR, f"{_prefijo_cache_parseo(archivo)}-{digest[:16]}-{version_limpieza()[:16]}")
+
+
+def leer_cache_parseo(archivo):
+    if not PARSE_CACHE_DIR or pyarrow is None:
+        return None
+
+    directorio = _dir_cache_parseo(archivo, sha256_archivo(archivo))
+    meta_path = os.path.join(directorio, 'meta.json')
+    if not os.path.exists(meta_path):
+        return None
+
+    try:
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+        libro = {'filas': meta['filas']}
+        for parte in meta['partes']:
+            libro[parte] = pd.read_parquet(os.path.join(directorio, f"{parte}.parquet"))
+        for parte in meta['vacias']:
+            libro[parte] = None
+        return libro
+    except Exception as e:
+        log(f"  ADVERTENCIA: Cache de parseo ilegible, se vuelve a parsear: {e}")
+        return None
+
+
+def guardar_cache_parseo(archivo, libro):
+    if not PARSE_CACHE_DIR or pyarrow is None:
+        return
+
+    directorio = _dir_cache_parseo(archivo, sha256_archivo(archivo))
+    base = _prefijo_cache_parseo(archivo)
+    try:
+        os.makedirs(PARSE_CACHE_DIR, exist_ok=True)
+        # Entradas anteriores del mismo libro ya no sirven: otro hash u otra version
+        for entrada in os.listdir(PARSE_CACHE_DIR):
+            if entrada.startswith(f"{base}-") and os.path.join(PARSE_CACHE_DIR, entrada) != directorio:
+                shutil.rmtree(os.path.join(PARSE_CACHE_DIR, entrada), ignore_errors=True)
+
+        tmp = f"{directorio}.tmp{os.getpid()}"
+        os.makedirs(tmp, exist_ok=True)
+        partes = [k for k, v in libro.items() if isinstance(v, pd.DataFrame)]
+        for parte in partes:
+            libro[parte].to_parquet(os.path.join(tmp, f"{parte}.parquet"), index=False)
+        with open(os.path.join(tmp, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({
+                'archivo': os.path.basename(archivo),
+                'filas': libro['filas'],
+                'partes': partes,
+                'vacias': [k for k, v in libro.items() if k != 'filas' and v is None],
+                'version_limpieza': version_limpieza(),
+            }, f)
+        shutil.rmtree(directorio, ignore_errors=True)
+        os.rename(tmp, directorio)
+    except Exception as e:
+        log(f"  ADVERTENCIA: No se pudo guardar la cache de parseo: {e}")
+
+
+# ============================================================
+# ESCRITURA (INSERT por batches o COPY + tabla staging)
+# ============================================================
+CAMPOS_SQL_PRESTADOR = [
+    'id_prestador', 'ruc', 'nombre_fantasia', 'raz_soc_nombre',
+    'registro_profesional', 'ranking', 'nombre_embedding',
+    'nombre_normalizado', 'cantidad_acuerdos',
+]
+CAMPOS_SQL_NOMENCLADOR = [
+    'id_nomenclador', 'especialidad', 'descripcion',
+    'id_nomenclador2', 'id_servicio', 'desc_nomenclador',
+    'grupo', 'subgrupo', 'descripcion_embedding',
+    'descripcion_normalizada',
+]
+
+# {origen} es "VALUES %s" (execute_values) o un SELECT sobre la tabla staging
+UPSERT_PRESTADORES_SQL = """
+    INSERT INTO prestadores (
+        id_prestador, ruc, nombre_fantasia, raz_soc_nombre,
+        registro_profesional, ranking, nombre_embedding,
+        nombre_normalizado, cantidad_acuerdos
+    ) {origen}
+    ON CONFLICT (id_prestador) DO UPDATE SET
+        ruc = EXCLUDED.ruc,
+        nombre_fantasia = EXCLUDED.nombre_fantasia,
+        raz_soc_nombre = EXCLUDED.raz_soc_nombre,
+        registro_profesional = EXCLUDED.registro_profesional,
+        ranking = EXCLUDED.ranking,
+        nombre_embedding = COALESCE(EXCLUDED.nombre_embedding, prestadores.nombre_embedding),
+        nombre_normalizado = EXCLUDED.nombre_normalizado,
+        cantidad_acuerdos = EXCLUDED.cantidad_acuerdos,
+        updated_at = NOW()
+"""
+
+UPSERT_NOMENCLADORES_SQL = """
+    INSERT INTO nomencladores (
+        id_nomenclador, especialidad, descripcion,
+        id_nomenclador2, id_servicio, desc_nomenclador,
+        grupo, subgrupo, descripcion_embedding,
+        descripcion_normalizada
+    ) {origen}
+    ON CONFLICT (id_nomenclador) DO UPDATE SET
+        especialidad = EXCLUDED.especialidad,
+        descripcion = EXCLUDED.descripcion,
+        id_nomenclador2 = EXCLUDED.id_nomenclador2,
+        id_servicio = EXCLUDED.id_servicio,
+        desc_nomenclador = EXCLUDED.desc_nomenclador,
+        grupo = EXCLUDED.grupo,
+        subgrupo = EXCLUDED.subgrupo,
+        descripcion_embedding = COALESCE(EXCLUDED.descripcion_embedding, nomencladores.descripcion_embedding),
+        descripcion_normalizada = EXCLUDED.descripcion_normalizada,
+        updated_at = NOW()
+"""
+
+UPSERT_ACUERDOS_SQL = """
+    INSERT INTO acuerdos_prestador (
+        id_nomenclador, prest_id_prestador, plan_id_plan,
+        precio, precio_normal, precio_diferenciado, precio_internado
+    ) {origen}
+    ON CONFLICT (prest_id_prestador, id_nomenclador, plan_id_plan) DO UPDATE SET
+        precio = EXCLUDED.precio,
+        precio_normal = EXCLUDED.precio_normal,
+        precio_diferenciado = EXCLUDED.precio_diferenciado,
+        precio_internado = EXCLUDED.precio_internado,
+        updated_at = NOW()
+    {condicion}
+"""
+
+
+def upsert_values(cur, upsert_sql, records, batch_size):
     total_inserted = 0
     for i in range(0, len(records), batch_size):
         batch = records[i:i + batch_size]
-        execute_values(
-            cur,
-            """
-            INSERT INTO prestadores (
-                id_prestador, ruc, nombre_fantasia, raz_soc_nombre,
-                registro_profesional, ranking, nombre_embedding,
-                nombre_normalizado, cantidad_acuerdos
-            ) VALUES %s
-            ON CONFLICT (id_prestador) DO UPDATE SET
-                ruc = EXCLUDED.ruc,
-                nombre_fantasia = EXCLUDED.nombre_fantasia,
-                raz_soc_nombre = EXCLUDED.raz_soc_nombre,
-                registro_profesional = EXCLUDED.registro_profesional,
-                ranking = EXCLUDED.ranking,
-                nombre_embedding = COALESCE(EXCLUDED.nombre_embedding, prestadores.nombre_embedding),
-                nombre_normalizado = EXCLUDED.nombre_normalizado,
-                cantidad_acuerdos = EXCLUDED.cantidad_acuerdos,
-                updated_at = NOW()
-            """,
-            batch
-        )
+        execute_values(cur, upsert_sql.format(origen='VALUES %s'), batch)
         total_inserted += len(batch)
-        if total_inserted % 1000 == 0:
-            log(f"  Insertados: {total_inserted}/{len(records)}")
+    return total_inserted
+
+
+def escribir_registros(cur, tabla, columnas, upsert_sql, records, bulk_mode):
+    """Upsert de `records` con INSERT por batches o COPY binario + merge."""
+    with METRICAS.medir('upsert_batch_segundos', tabla=tabla):
+        if bulk_mode == 'copy':
+            staging = crear_staging(cur, tabla, columnas, records, binario=True)
+            return fusionar_staging(cur, staging, columnas, upsert_sql)
+        return upsert_values(cur, upsert_sql, records, 500)
+
+
+def _valor_copy(valor):
+    """Serializa un valor al formato texto de COPY."""
+    if valor is None:
+        return '\\N'
+    if isinstance(valor, np.ndarray):
+        return embedding_to_pgvector(valor)
+    if isinstance(valor, str):
+        return (valor.replace('\\', '\\\\').replace('\t', '\\t')
+                .replace('\n', '\\n').replace('\r', '\\r'))
+    return str(valor)
+
+
+def _enviar_copy(cur, sql, lineas, buf, inicio=None, fin=None):
+    """
+    Escribe `lineas` en `buf` y ejecuta el COPY cada COPY_BUFFER_BYTES, para
+    que filas con embeddings no acumulen cientos de MB en memoria.
+    """
+    def enviar():
+        if fin is not None:
+            buf.write(fin)
+        buf.seek(0)
+        with medir_paso('escritura'):
+            cur.copy_expert(sql, buf)
+        buf.seek(0)
+        buf.truncate()
+        if inicio is not None:
+            buf.write(inicio)
+
+    if inicio is not None:
+        buf.write(inicio)
+    pendientes = False
+    # Las filas ya las cuenta quien arma los registros; aca solo se suma el tiempo de codificarlas
+    with medir_paso('serializacion'):
+        for linea in lineas:
+            buf.write(linea)
+            pendientes = True
+            if buf.tell() >= COPY_BUFFER_BYTES:
+                enviar()
+                pendientes = False
+        if pendientes:
+            enviar()
+
+
+def copiar_a_tabla(cur, tabla, columnas, registros):
+    """COPY ... FROM STDIN (formato texto) de `registros`."""
+    sql = f"COPY {tabla} ({', '.join(columnas)}) FROM STDIN"
+    lineas = ('\t'.join(map(_valor_copy, fila)) + '\n' for fila in registros)
+    _enviar_copy(cur, sql, lineas, io.StringIO())
+
+
+_NULO_BINARIO = struct.pack('!i', -1)
+
+
+def _con_largo(codificar):
+    def campo(valor):
+        if valor is None:
+            return _NULO_BINARIO
+        datos = codificar(valor)
+        return struct.pack('!i', len(datos)) + datos
+    return campo
+
+
+CODIFICADORES_BINARIOS = {
+    'integer': _con_largo(lambda v: struct.pack('!i', int(v))),
+    'bigint': _con_largo(lambda v: struct.pack('!q', int(v))),
+    'double precision': _con_largo(lambda v: struct.pack('!d', float(v))),
+    'text': _con_largo(lambda v: str(v).encode('utf-8')),
+    'character varying': _con_largo(lambda v: str(v).encode('utf-8')),
+    'vector': _con_largo(embedding_to_pgvector_binario),
+    'halfvec': _con_largo(embedding_to_halfvec_binario),
+    'uuid': _con_largo(lambda v: uuid.UUID(str(v)).bytes),
+}
+
 
+def copiar_a_tabla_binario(cur, tabla, columnas, registros):
+    """
+    COPY ... FROM STDIN (FORMAT binary). Los embeddings viajan como float4 sin
+    pasar por texto; el resto de las columnas se codifica segun su tipo en
+    `tabla` (numeric debe convertirse antes a double precision).
+    """
+    cur.execute(
+        "SELECT attname, format_type(atttypid, NULL) FROM pg_attribute "
+        "WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped",
+        (tabla,)
+    )
+    tipos = dict(cur.fetchall())
+    codificadores = [CODIFICADORES_BINARIOS[tipos[c]] for c in columnas]
+    cantidad = struct.pack('!h', len(columnas))
+
+    sql = f"COPY {tabla} ({', '.join(columnas)}) FROM STDIN WITH (FORMAT binary)"
+    lineas = (cantidad + b''.join([codificar(v) for codificar, v in zip(codificadores, fila)])
+              for fila in registros)
+    _enviar_copy(cur, sql, lineas, io.BytesIO(),
+                 inicio=b'PGCOPY\n\xff\r\n\x00' + struct.pack('!ii', 0, 0),
+                 fin=struct.pack('!h', -1))
+
+
+def crear_staging(cur, tabla, columnas, registros, binario=False):
+    """
+    Crea una tabla temporal con los tipos de `columnas` en `tabla` (sin sus
+    constraints) y carga `registros` con COPY. Con `binario` se usa COPY
+    binario y, si falla, COPY de texto.
+    """
+    staging = f"staging_{tabla}"
+    cur.execute(f"DROP TABLE IF EXISTS {staging}")
+    cur.execute(f"CREATE TEMP TABLE {staging} ON COMMIT DROP AS "
+                f"SELECT {', '.join(columnas)} FROM {tabla} WITH NO DATA")
+    if binario:
+        cur.execute("SAVEPOINT copy_binario")
+        try:
+            cur.execute(
+                "SELECT attname FROM pg_attribute WHERE attrelid = %s::regclass "
+                "AND atttypid = 'numeric'::regtype",
+                (staging,)
+            )
+            for (columna,) in cur.fetchall():
+                cur.execute(f"ALTER TABLE {staging} ALTER COLUMN {columna} TYPE double precision")
+            copiar_a_tabla_binario(cur, staging, columnas, registros)
+            cur.execute("RELEASE SAVEPOINT copy_binario")
+            return staging
+        except Exception as e:
+            log(f"  COPY binario no disponible para {tabla}, se usa COPY de texto: {e}")
+            cur.execute("ROLLBACK TO SAVEPOINT copy_binario")
+    copiar_a_tabla(cur, staging, columnas, registros)
+    return staging
+
+
+def fusionar_staging(cur, staging, columnas, upsert_sql, filtro='', condicion=''):
+    """Un unico INSERT ... SELECT ... ON CONFLICT desde la tabla staging."""
+    origen = f"SELECT {', '.join(columnas)} FROM {staging} s {filtro}"
+    cur.execute(upsert_sql.format(origen=origen, condicion=condicion))
+    afectadas = cur.rowcount
+    cur.execute(f"DROP TABLE {staging}")
+    return afectadas
+
+
+# ============================================================
+# DIARIO DE CARGA (chunks ya commiteados, para --resume)
+# ============================================================
+DIARIO_CARGA_PATH = os.getenv('DIARIO_CARGA_PATH', os.path.join(DATA_DIR, '.cache', 'diario_carga.sqlite'))
+DIARIO = None  # DiarioCarga de la corrida (None si DIARIO_CARGA_PATH esta vacio)
+
+
+class DiarioCarga:
+    """
+    Registro en SQLite de los chunks ya escritos y commiteados, por tabla y
+    huella del contenido, y de los momentos de inicio de la carga. Una carga
+    nueva lo vacia y una que termina bien tambien, asi que solo describe una
+    carga cortada; con --resume se saltean sus chunks (sin volver a pedir
+    embeddings ni a escribirlos) y se reusan sus momentos de inicio.
+    """
+
+    def __init__(self, ruta, reanudar=False):
+        os.makedirs(os.path.dirname(ruta) or '.', exist_ok=True)
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        # Lo usan los hilos de prestadores y nomencladores a la vez; los accesos van con lock
+        self.db = sqlite3.connect(ruta, check_same_thread=False)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                tabla TEXT NOT NULL,
+                huella TEXT NOT NULL,
+                filas INTEGER NOT NULL,
+                PRIMARY KEY (tabla, huella)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS momentos (clave TEXT PRIMARY KEY, valor TEXT NOT NULL);
+        """)
+        if not reanudar:
+            self.vaciar()
+
+    def pendiente(self):
+        """(chunks, filas) registrados por una carga anterior que no termino."""
+        with self._lock:
+            return self.db.execute("SELECT COUNT(*), COALESCE(SUM(filas), 0) FROM chunks").fetchone()
+
+    def hecho(self, tabla, huella):
+        with self._lock:
+            return self.db.execute("SELECT 1 FROM chunks WHERE tabla = ? AND huella = ?",
+                                   (tabla, huella)).fetchone() is not None
+
+    def registrar(self, tabla, huella, filas):
+        """Se llama despues del commit en la base: un chunk registrado ya esta escrito."""
+        with self._lock:
+            self.db.execute("INSERT OR REPLACE INTO chunks (tabla, huella, filas) VALUES (?, ?, ?)",
+                            (tabla, huella, filas))
+            self.db.commit()
+
+    def momento(self, clave, actual):
+        """El momento `clave` de la carga que se reanuda, o `actual` (que queda registrado)."""
+        with self._lock:
+            fila = self.db.execute("SELECT valor FROM momentos WHERE clave = ?", (clave,)).fetchone()
+            if fila:
+                return datetime.fromisoformat(fila[0])
+            self.db.execute("INSERT INTO momentos (clave, valor) VALUES (?, ?)", (clave, actual.isoformat()))
+            self.db.commit()
+            return actual
+
+    def vaciar(self):
+        with self._lock:
+            self.db.execute("DELETE FROM chunks")
+            self.db.execute("DELETE FROM momentos")
+            self.db.commit()
+
+    def cerrar(self):
+        with self._lock:
+            self.db.close()
+
+
+def huella_chunk(df, *contexto):
+    """SHA-256 del contenido de `df` y del `contexto` (p. ej. si lleva embeddings y de que modelo)."""
+    digest = hashlib.sha256(repr(contexto).encode())
+    digest.update(hash_filas(df).tobytes())
+    return digest.hexdigest()
+
+
+def momento_carga(clave, actual):
+    """Con diario, el inicio registrado por la carga que se reanuda; sin el, `actual`."""
+    return DIARIO.momento(clave, actual) if DIARIO is not None else actual
+
+
+# ============================================================
+# PIPELINE (chunks -> embeddings -> escritura, con colas acotadas)
+# ============================================================
+def _poner(cola, item, cancelado):
+    while not cancelado.is_set():
+        try:
+            cola.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def en_segundo_plano(iterable, maxsize=2):
+    """
+    Consume `iterable` en un hilo aparte y entrega sus elementos por una cola
+    de `maxsize`: el productor se adelanta a lo sumo ese numero de elementos.
+    Las excepciones del productor se relanzan del lado del consumidor; si el
+    consumidor corta (excepcion o close()), el productor se detiene.
+    """
+    cola = queue.Queue(maxsize)
+    cancelado = threading.Event()
+
+    def producir():
+        try:
+            for item in iterable:
+                if not _poner(cola, (True, item), cancelado):
+                    return
+            _poner(cola, (False, None), cancelado)
+        except BaseException as e:
+            _poner(cola, (False, e), cancelado)
+        finally:
+            if hasattr(iterable, 'close'):
+                iterable.close()
+
+    threading.Thread(target=en_hilo(producir), daemon=True).start()
+    try:
+        while True:
+            ok, item = cola.get()
+            if ok:
+                yield item
+            elif item is None:
+                return
+            else:
+                raise item
+    finally:
+        cancelado.set()
+
+
+def cargar_en_pipeline(conn, df, tabla, columna_texto, client, a_registros, escribir, desc, filtrar=None):
+    """
+    Carga `df` en tres etapas: cortar en chunks de PIPELINE_CHUNK_SIZE filas,
+    generar los embeddings de `columna_texto` y armar los registros (hilo
+    aparte), y escribir + commitear cada chunk (este hilo). Mientras se
+    escribe un chunk ya se generan los embeddings del siguiente, y en memoria
+    hay a lo sumo unos pocos chunks con vectores. Cada chunk commiteado queda
+    en el DIARIO; los que ya estaban (--resume) se saltean.
+
+    `filtrar` (el de --delta) se aplica a cada chunk despues de calcular su
+    huella: los chunks se cortan siempre sobre `df` completo, asi al reanudar
+    coinciden con los del diario aunque lo escrito antes del corte ya no pase
+    el filtro.
+    """
+    contexto = (tabla, EMBEDDING_MODEL, EMBEDDING_DIMENSIONS, EMBEDDING_TYPE) if client else (tabla,)
+    contexto += contexto_tenant()
+    salteados = []
+
+    def chunks():
+        for inicio in range(0, len(df), PIPELINE_CHUNK_SIZE):
+            parte = df.iloc[inicio:inicio + PIPELINE_CHUNK_SIZE]
+            huella = huella_chunk(parte, *contexto) if DIARIO is not None else None
+            escrito = huella is not None and DIARIO.hecho(tabla, huella)
+            if filtrar:
+                # Tambien para los chunks ya escritos: el delta necesita ver todas las claves
+                parte = filtrar(parte)
+            if escrito:
+                salteados.append(len(parte))
+                continue
+            if len(parte):
+                yield parte, huella
+
+    def con_embeddings(partes):
+        for parte, huella in partes:
+            embeddings = [None] * len(parte)
+            if client:
+                with medir_paso('embeddings', len(parte)):
+                    embeddings = generar_embeddings_batch(
+                        client, parte[columna_texto].tolist(), desc=desc, detalle=False,
+                        tabla=tabla, ids=parte[TABLAS_DELTA[tabla]['claves'][0]].tolist())
+            with medir_paso('serializacion', len(parte)):
+                records = a_registros(parte, embeddings)
+            yield records, huella, sum(1 for e in embeddings if e is not None)
+
+    if client:
+        # Ordenar por texto deja los repetidos en el mismo chunk, donde se piden una sola vez
+        df = df.sort_values(columna_texto, kind='stable', na_position='last')
+        log(f"  Generando embeddings {desc} y escribiendo por chunks de {PIPELINE_CHUNK_SIZE}...")
+
+    cur = conn.cursor()
+    total_inserted = total_embeddings = 0
+    try:
+        with closing(en_segundo_plano(con_embeddings(en_segundo_plano(chunks())))) as etapas:
+            for records, huella, generados in etapas:
+                with medir_paso('escritura', len(records)):
+                    total_inserted += escribir(cur, records)
+                    conn.commit()
+                if huella:
+                    DIARIO.registrar(tabla, huella, len(records))
+                total_embeddings += generados
+                log(f"  Escritos {desc}: {total_inserted}"
+                    + (f"/{len(df) - sum(salteados)}" if not filtrar else "")
+                    + (f" (con embedding: {total_embeddings})" if client else ""))
+    finally:
+        cur.close()
+    if salteados:
+        log(f"  {desc}: {len(salteados)} chunks ({sum(salteados)} filas) ya escritos en la carga "
+            f"anterior, salteados")
+    return total_inserted
+
+
+# ============================================================
+# CARGA INCREMENTAL (--delta)
+# ============================================================
+# Por tabla: clave, columna de embedding y columna/valores de estado
+TABLAS_DELTA = {
+    'prestadores': {
+        'claves': ['id_prestador'], 'embedding': 'nombre_embedding', 'texto': 'nombre_fantasia',
+        'estado': 'estado', 'activo': 'ACTIVO', 'inactivo': 'INACTIVO',
+    },
+    'nomencladores': {
+        'claves': ['id_nomenclador'], 'embedding': 'descripcion_embedding', 'texto': 'descripcion',
+        'estado': 'estado', 'activo': 'ACTIVO', 'inactivo': 'INACTIVO',
+    },
+    'acuerdos_prestador': {
+        'claves': CAMPOS_ACUERDO[:3], 'embedding': None, 'texto': None,
+        'estado': 'vigente', 'activo': 'SI', 'inactivo': 'NO',
+    },
+}
+HASH_BAJA = 0  # hash_contenido de las filas que la carga dio de baja
+
+
+def hash_filas(df):
+    """Hash estable (int64) del contenido limpio de cada fila."""
+    return pd.util.hash_pandas_object(df, index=False).to_numpy().view('int64')
+
+
+def _indice_claves(df, claves):
+    if len(claves) == 1:
+        return pd.Index(df[claves[0]])
+    return pd.MultiIndex.from_frame(df[claves])
+
+
+def leer_hashes(conn, tabla, con_embeddings=False):
+    """
+    Claves, hash_contenido, si estan activas y si les falta el embedding,
+    de todas las filas de `tabla` (un COPY). Tambien devuelve el
+    LOCALTIMESTAMP de la lectura, que marca el inicio de la carga.
+    """
+    config = TABLAS_DELTA[tabla]
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT 1 FROM information_schema.columns WHERE table_name = %s AND column_name = 'hash_contenido'",
+        (tabla,)
+    )
+    if cur.fetchone() is None:
+        cur.close()
+        raise RuntimeError(f"{tabla} no tiene la columna hash_contenido; "
+                           f"aplicar database/migration_carga_delta.sql para usar --delta")
+    cur.execute("SELECT LOCALTIMESTAMP")
+    inicio = cur.fetchone()[0]
+
+    sin_embedding = 'false'
+    if con_embeddings and config['embedding']:
+        sin_embedding = f"{config['embedding']} IS NULL"
+    buf = io.StringIO()
+    cur.copy_expert(
+        f"COPY (SELECT {', '.join(config['claves'])}, COALESCE(hash_contenido, {HASH_BAJA}), "
+        f"COALESCE({config['estado']} = '{config['activo']}', false), {sin_embedding} "
+        f"FROM {tabla}) TO STDOUT WITH CSV",
+        buf
+    )
     conn.commit()
     cur.close()
+    buf.seek(0)
+    existentes = pd.read_csv(buf, header=None, names=config['claves'] + ['hash', 'activo', 'sin_embedding'],
+                             dtype={'hash': 'int64'}, true_values=['t'], false_values=['f'])
+    return inicio, existentes
+
+
+class CargaDelta:
+    """
+    Carga incremental de una tabla. Compara el hash del contenido de cada
+    fila limpia con `hash_contenido` en la base y deja pasar solo las claves
+    nuevas o cambiadas; las filas sin cambios no se reescriben. Al terminar
+    guarda los hashes de lo escrito y, con `bajas`, marca como inactivas
+    las claves que ya no vienen en el Excel.
+    """
+
+    def __init__(self, conn, tabla, con_embeddings=False, bajas=False):
+        self.conn = conn
+        self.tabla = tabla
+        self.config = TABLAS_DELTA[tabla]
+        self.claves = self.config['claves']
+        self.bajas = bajas
+        self.cambiadas = []
+        self.sin_cambios = 0
+
+        self.inicio, existentes = leer_hashes(conn, tabla, con_embeddings)
+        # Al reanudar, lo escrito antes del corte tambien cuenta como escrito en esta carga
+        self.inicio = momento_carga(f'delta {tabla}', self.inicio)
+        self.existentes = existentes[self.claves]
+        self.indice = _indice_claves(existentes, self.claves)
+        self.hashes = existentes['hash'].to_numpy()
+        self.activas = existentes['activo'].to_numpy(dtype=bool)
+        self.sin_embedding = existentes['sin_embedding'].to_numpy(dtype=bool)
+        self.vistas = np.zeros(len(existentes), dtype=bool)
+
+    def filtrar(self, df):
+        """
+        Filas de `df` nuevas o con contenido distinto al de la base (o sin
+        embedding, si se generan). Las claves ya vistas en un chunk anterior
+        se descartan: gana la primera aparicion, como en el resto de la carga.
+        """
+        hashes = hash_filas(df)
+        posiciones = self.indice.get_indexer(_indice_claves(df, self.claves))
+        en_base = posiciones >= 0
+        existentes = posiciones[en_base]
+
+        cambiadas = np.ones(len(df), dtype=bool)
+        cambiadas[en_base] = self.hashes[existentes] != hashes[en_base]
+        if self.config['texto']:
+            # Filas sin embedding en la base (p. ej. cargadas con --skip-embeddings)
+            con_texto = df[self.config['texto']].notna().to_numpy()
+            cambiadas[en_base] |= self.sin_embedding[existentes] & con_texto[en_base]
+        repetidas = np.zeros(len(df), dtype=bool)
+        repetidas[en_base] = self.vistas[existentes]
+        self.vistas[existentes] = True
+
+        self.sin_cambios += int((~cambiadas & ~repetidas).sum())
+        seleccion = cambiadas & ~repetidas
+        df = df[seleccion]
+        self.cambiadas.append(df[self.claves].assign(hash_contenido=hashes[seleccion]))
+        return df
+
+    def guardar(self):
+        """
+        Guarda el hash de las filas escritas en esta carga (las que fallaron
+        no llegan a tener updated_at >= inicio y conservan el hash anterior),
+        reactiva las que la carga habia dado de baja y, con `bajas`, da de
+        baja las claves que no vinieron en el Excel.
+        """
+        estado = self.config['estado']
+        union = ' AND '.join(f"t.{c} = s.{c}" for c in self.claves)
+        cur = self.conn.cursor()
+
+        cambiadas = pd.concat(self.cambiadas or [pd.DataFrame(columns=self.claves + ['hash_contenido'])],
+                              ignore_index=True)
+        staging = crear_staging(cur, self.tabla, self.claves + ['hash_contenido'], filas_como_tuplas(cambiadas))
+        cur.execute(
+            f"UPDATE {self.tabla} t SET hash_contenido = s.hash_contenido, "
+            f"{estado} = CASE WHEN t.hash_contenido = {HASH_BAJA} THEN '{self.config['activo']}' ELSE t.{estado} END "
+            f"FROM {staging} s WHERE {union} AND t.updated_at >= %s",
+            (self.inicio,)
+        )
+        escritas = cur.rowcount
+        cur.execute(f"DROP TABLE {staging}")
+
+        bajas = 0
+        if self.bajas:
+            ausentes = self.activas & ~self.vistas
+            staging = crear_staging(cur, self.tabla, self.claves,
+                                    filas_como_tuplas(self.existentes[ausentes]))
+            cur.execute(
+                f"UPDATE {self.tabla} t SET {estado} = '{self.config['inactivo']}', "
+                f"hash_contenido = {HASH_BAJA}, updated_at = NOW() FROM {staging} s WHERE {union}"
+            )
+            bajas = cur.rowcount
+            cur.execute(f"DROP TABLE {staging}")
+        self.conn.commit()
+        cur.close()
+
+        METRICAS.sumar('filas_sin_cambios_total', self.sin_cambios, tabla=self.tabla)
+        log(f"  Delta {self.tabla}: {self.sin_cambios} sin cambios, {escritas} nuevas o cambiadas"
+            + (f", {bajas} dadas de baja" if self.bajas else ""))
+
+
+# ============================================================
+# CARGAR PRESTADORES
+# ============================================================
+@etapa_perfilada
+def cargar_prestadores(conn, client, skip_embeddings=False, bulk_mode='values', delta=False, bajas=False):
+    log("=" * 60)
+    log("CARGANDO PRESTADORES")
+    log("=" * 60)
+
+    libro = leer_libro(EXCEL_PRESTADORES, 'PRESTADORES_PRINCIPALES', procesar_prestadores)
+    df_clean = libro['prestadores']
+    if df_clean is None:
+        log("ERROR: Columnas obligatorias no encontradas (ID_PRESTADOR, NOMBRE_FANTASIA)")
+        return 0
+
+    log(f"  Prestadores unicos: {len(df_clean)}")
+    # procesar_prestadores descarta sin ID y deduplica en el mismo paso
+    METRICAS.sumar('filas_limpias_total', len(df_clean), entidad='prestadores')
+    METRICAS.sumar('filas_descartadas_total', libro['filas'] - len(df_clean), entidad='prestadores',
+                   motivo='incompleta o duplicada')
+    def escribir(cur, records):
+        return escribir_registros(
+            cur, 'prestadores', *con_columnas_tenant(CAMPOS_SQL_PRESTADOR, UPSERT_PRESTADORES_SQL),
+            records, bulk_mode)
+
+    if TENANT is not None:
+        df_clean = con_ids_del_tenant(conn, df_clean, 'prestadores', registros_prestadores, escribir)
+
+    carga_delta = None
+    if delta:
+        carga_delta = CargaDelta(conn, 'prestadores', con_embeddings=client is not None and not skip_embeddings,
+                                 bajas=bajas)
+
+    total_inserted = cargar_en_pipeline(
+        conn, df_clean, 'prestadores', 'nombre_fantasia', None if skip_embeddings else client,
+        registros_prestadores, escribir,
+        desc="(prestadores)", filtrar=carga_delta.filtrar if carga_delta else None
+    )
+    if carga_delta:
+        carga_delta.guardar()
+    METRICAS.sumar('filas_escritas_total', total_inserted, tabla='prestadores')
     log(f"  Prestadores cargados: {total_inserted}")
     return total_inserted
 
@@ -260,305 +2323,464 @@ def cargar_prestadores(conn, client, skip_embeddings=False):
 # ============================================================
 # CARGAR NOMENCLADORES (extraidos de ambos Excel combinados)
 # ============================================================
-def cargar_nomencladores(conn, client, skip_embeddings=False):
+def leer_nomencladores_streaming(archivo, nombre, chunk_size):
+    """
+    Nomencladores de un Excel combinado leido por chunks.
+
+    Solo se conservan los nomencladores unicos (ultima aparicion), no las
+    filas de acuerdo, asi la memoria queda acotada por el catalogo.
+    """
+    acumulado = None
+    filas = validas = 0
+    for df in iterar_excel(archivo, chunk_size):
+        filas += len(df)
+        with medir_paso('limpieza', len(df)):
+            parte = procesar_libro_combinado(df, entidades=('nomencladores',))['nomencladores']
+        if parte is None:
+            continue  # hoja sin columnas de nomenclador
+        validas += len(parte)
+        acumulado = parte if acumulado is None else pd.concat([acumulado, parte], ignore_index=True)
+        acumulado = acumulado.drop_duplicates(subset=['id_nomenclador'], keep='last')
+    log(f"  {nombre}: {filas} filas (streaming)")
+    if filas and acumulado is None:
+        return None
+    unicos = len(acumulado) if acumulado is not None else 0
+    METRICAS.sumar('filas_descartadas_total', filas - validas, entidad='nomencladores', motivo='incompleta')
+    METRICAS.sumar('filas_descartadas_total', validas - unicos, entidad='nomencladores', motivo='duplicada')
+    return acumulado if acumulado is not None else pd.DataFrame(columns=CAMPOS_NOMENCLADOR)
+
+
+def preparar_nomencladores(partes):
+    """Une los nomencladores de cada Excel (gana la ultima aparicion) y deriva columnas."""
+    if not partes:
+        return pd.DataFrame()
+    df_nomen = pd.concat(partes, ignore_index=True)
+    df_nomen = df_nomen.drop_duplicates(subset=['id_nomenclador'], keep='last').copy()
+
+    df_nomen['descripcion_normalizada'] = normalizar_serie(df_nomen['descripcion'])
+
+    ids = df_nomen['id_nomenclador'].astype('int64').astype(str)
+    df_nomen['grupo'] = ids.str[:2].where(ids.str.len() >= 2)
+    df_nomen['subgrupo'] = ids.str[:4].where(ids.str.len() >= 4)
+    return df_nomen
+
+
+@etapa_perfilada
+def cargar_nomencladores(conn, client, skip_embeddings=False, chunk_size=None, bulk_mode='values',
+                         delta=False, bajas=False):
     log("=" * 60)
     log("CARGANDO NOMENCLADORES")
     log("=" * 60)
 
-    all_nomen = []
+    partes = []
 
-    for archivo, nombre in [
-        (EXCEL_NOMENCLADORES, 'NOMENCLADORES_GENERALES'),
-        (EXCEL_ACUERDOS, 'ACUERDO_PRESTADORES'),
-    ]:
+    for archivo, nombre in libros_combinados():
         if not os.path.exists(archivo):
             log(f"  Archivo no encontrado: {archivo}")
             continue
 
-        df = pd.read_excel(archivo, sheet_name=0)
-        log(f"  {nombre}: {len(df)} filas, columnas: {list(df.columns)}")
-
-        col_map = {}
-        for col in df.columns:
-            col_upper = str(col).strip().upper()
-            if col_upper == 'ID_NOMENCLADOR':
-                col_map['id_nomenclador'] = col
-            elif col_upper == 'ESPECIALIDAD':
-                col_map['especialidad'] = col
-            elif col_upper in ('NOMEN_DESCRIPCION_DET', 'DESCRIPCION'):
-                col_map['descripcion'] = col
-            elif col_upper == 'ID_NOMENCLADOR2':
-                col_map['id_nomenclador2'] = col
-            elif col_upper == 'ID_SERVICIO':
-                col_map['id_servicio'] = col
-            elif col_upper == 'DESC_NOMENCLADOR':
-                col_map['desc_nomenclador'] = col
-
-        if 'id_nomenclador' not in col_map or 'descripcion' not in col_map:
+        if chunk_size:
+            nomencladores = leer_nomencladores_streaming(archivo, nombre, chunk_size)
+        else:
+            libro = leer_libro_combinado(archivo, nombre)
+            nomencladores = libro['nomencladores']
+            if nomencladores is not None:
+                METRICAS.sumar('filas_descartadas_total', libro['filas'] - len(nomencladores),
+                               entidad='nomencladores', motivo='incompleta')
+        if nomencladores is None:
             log(f"  ADVERTENCIA: Columnas nomenclador no encontradas en {nombre}")
             continue
 
-        for _, row in df.iterrows():
-            id_nom = row[col_map['id_nomenclador']]
-            if pd.isna(id_nom):
-                continue
-            all_nomen.append({
-                'id_nomenclador': int(id_nom),
-                'especialidad': limpiar_texto(row.get(col_map.get('especialidad', ''), None)),
-                'descripcion': limpiar_texto(row.get(col_map['descripcion'], None)),
-                'id_nomenclador2': int(row[col_map['id_nomenclador2']]) if 'id_nomenclador2' in col_map and pd.notna(row.get(col_map['id_nomenclador2'])) else None,
-                'id_servicio': int(row[col_map['id_servicio']]) if 'id_servicio' in col_map and pd.notna(row.get(col_map['id_servicio'])) else None,
-                'desc_nomenclador': limpiar_texto(row.get(col_map.get('desc_nomenclador', ''), None)),
-            })
+        partes.append(nomencladores)
 
-    df_nomen = pd.DataFrame(all_nomen)
+    with medir_paso('limpieza'):
+        df_nomen = preparar_nomencladores(partes)
     if df_nomen.empty:
         log("  ERROR: No se encontraron nomencladores")
         return 0
 
-    df_nomen = df_nomen.drop_duplicates(subset=['id_nomenclador'], keep='last')
     log(f"  Nomencladores unicos: {len(df_nomen)}")
+    METRICAS.sumar('filas_limpias_total', len(df_nomen), entidad='nomencladores')
+    METRICAS.sumar('filas_descartadas_total', sum(map(len, partes)) - len(df_nomen), entidad='nomencladores',
+                   motivo='duplicada')
+    def escribir(cur, records):
+        return escribir_registros(
+            cur, 'nomencladores', *con_columnas_tenant(CAMPOS_SQL_NOMENCLADOR, UPSERT_NOMENCLADORES_SQL),
+            records, bulk_mode)
+
+    if TENANT is not None:
+        df_nomen = con_ids_del_tenant(conn, df_nomen, 'nomencladores', registros_nomencladores, escribir)
+
+    carga_delta = None
+    if delta:
+        carga_delta = CargaDelta(conn, 'nomencladores', con_embeddings=client is not None and not skip_embeddings,
+                                 bajas=bajas)
+
+    total_inserted = cargar_en_pipeline(
+        conn, df_nomen, 'nomencladores', 'descripcion', None if skip_embeddings else client,
+        registros_nomencladores, escribir,
+        desc="(nomencladores)", filtrar=carga_delta.filtrar if carga_delta else None
+    )
+    if carga_delta:
+        carga_delta.guardar()
+    METRICAS.sumar('filas_escritas_total', total_inserted, tabla='nomencladores')
+    log(f"  Nomencladores cargados: {total_inserted}")
+    return total_inserted
 
-    df_nomen['descripcion_normalizada'] = df_nomen['descripcion'].apply(normalizar_texto)
 
-    def extraer_grupo(id_nom):
-        s = str(id_nom)
-        return s[:2] if len(s) >= 2 else None
+# ============================================================
+# CARGAR ACUERDOS (de ambos Excel combinados)
+# ============================================================
+def _condicion_inicio(cur, inicio):
+    """
+    Con `inicio` no se pisan filas ya escritas en esta misma carga, lo que
+    mantiene la regla "gana la primera aparicion" entre chunks sin guardar
+    en memoria las claves ya vistas.
+    """
+    if inicio is None:
+        return ''
+    return f"WHERE acuerdos_prestador.updated_at < {cur.mogrify('%s', (inicio,)).decode()}"
+
+
+class InformeRechazos:
+    """
+    CSV con los acuerdos descartados y el motivo de cada uno. El archivo se
+    crea con el primer rechazo, asi una carga sin rechazos no deja informe.
+    """
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self.total = 0
+        self.motivos = {}
+        if ruta and os.path.exists(ruta):
+            os.remove(ruta)
+
+    def agregar(self, filas, motivos):
+        """Agrega las filas (DataFrame con CAMPOS_ACUERDO) con su motivo."""
+        filas = filas.assign(motivo=motivos)
+        self.total += len(filas)
+        for motivo, cantidad in filas['motivo'].str.split(':').str[0].value_counts().items():
+            self.motivos[motivo] = self.motivos.get(motivo, 0) + int(cantidad)
+            METRICAS.sumar('filas_descartadas_total', int(cantidad), entidad='acuerdos', motivo=motivo)
+        if self.ruta:
+            os.makedirs(os.path.dirname(self.ruta) or '.', exist_ok=True)
+            filas.to_csv(self.ruta, mode='a', header=not os.path.exists(self.ruta), index=False)
+
+    def resumen(self):
+        if not self.total:
+            return
+        detalle = ', '.join(f"{motivo}: {cantidad}" for motivo, cantidad in self.motivos.items())
+        destino = f" (ver {self.ruta})" if self.ruta else ""
+        log(f"  Acuerdos rechazados: {self.total} ({detalle}){destino}")
+
+
+def claves_existentes(cur):
+    """Ids de prestadores y nomencladores ya cargados, una consulta por tabla."""
+    cur.execute("SELECT id_prestador FROM prestadores")
+    prestadores = {fila[0] for fila in cur}
+    cur.execute("SELECT id_nomenclador FROM nomencladores")
+    nomencladores = {fila[0] for fila in cur}
+    return prestadores, nomencladores
+
+
+def filtrar_fk_acuerdos(df, claves, informe):
+    """
+    Descarta en memoria los acuerdos cuyo prestador o nomenclador no existe,
+    asi el INSERT no falla por FK y no hace falta reintentar fila a fila.
+    """
+    prestadores, nomencladores = claves
+    sin_nomenclador = ~df['id_nomenclador'].isin(nomencladores)
+    sin_prestador = ~df['prest_id_prestador'].isin(prestadores)
+    rechazados = sin_nomenclador | sin_prestador
+    if rechazados.any():
+        motivos = np.select(
+            [sin_nomenclador & sin_prestador, sin_nomenclador],
+            ['prestador y nomenclador inexistentes', 'nomenclador inexistente'],
+            default='prestador inexistente',
+        )
+        informe.agregar(df[rechazados], motivos[rechazados.to_numpy()])
+        df = df[~rechazados]
+    return df
 
-    def extraer_subgrupo(id_nom):
-        s = str(id_nom)
-        return s[:4] if len(s) >= 4 else None
 
-    df_nomen['grupo'] = df_nomen['id_nomenclador'].apply(extraer_grupo)
-    df_nomen['subgrupo'] = df_nomen['id_nomenclador'].apply(extraer_subgrupo)
+def motivo_error(error):
+    """Primera linea del error de la base, con su SQLSTATE."""
+    mensaje = error.diag.message_primary or str(error).strip().splitlines()[0]
+    return f"base ({error.pgcode}): {mensaje}"
 
-    embeddings = [None] * len(df_nomen)
-    if not skip_embeddings and client:
-        embeddings = generar_embeddings_batch(
-            client,
-            df_nomen['descripcion'].tolist(),
-            desc="(nomencladores)"
-        )
 
-    cur = conn.cursor()
-    records = []
-    for i, (_, row) in enumerate(df_nomen.iterrows()):
-        records.append((
-            int(row['id_nomenclador']),
-            row.get('especialidad'),
-            row.get('descripcion'),
-            row.get('id_nomenclador2'),
-            row.get('id_servicio'),
-            row.get('desc_nomenclador'),
-            row.get('grupo'),
-            row.get('subgrupo'),
-            embedding_to_pgvector(embeddings[i]),
-            row.get('descripcion_normalizada'),
-        ))
-
-    batch_size = 500
-    total_inserted = 0
-    for i in range(0, len(records), batch_size):
-        batch = records[i:i + batch_size]
-        execute_values(
-            cur,
-            """
-            INSERT INTO nomencladores (
-                id_nomenclador, especialidad, descripcion,
-                id_nomenclador2, id_servicio, desc_nomenclador,
-                grupo, subgrupo, descripcion_embedding,
-                descripcion_normalizada
-            ) VALUES %s
-            ON CONFLICT (id_nomenclador) DO UPDATE SET
-                especialidad = EXCLUDED.especialidad,
-                descripcion = EXCLUDED.descripcion,
-                id_nomenclador2 = EXCLUDED.id_nomenclador2,
-                id_servicio = EXCLUDED.id_servicio,
-                desc_nomenclador = EXCLUDED.desc_nomenclador,
-                grupo = EXCLUDED.grupo,
-                subgrupo = EXCLUDED.subgrupo,
-                descripcion_embedding = COALESCE(EXCLUDED.descripcion_embedding, nomencladores.descripcion_embedding),
-                descripcion_normalizada = EXCLUDED.descripcion_normalizada,
-                updated_at = NOW()
-            """,
-            batch
-        )
-        total_inserted += len(batch)
-        if total_inserted % 1000 == 0:
-            log(f"  Insertados: {total_inserted}/{len(records)}")
+def _upsert_biseccion(cur, sql, batch, informe):
+    cur.execute("SAVEPOINT batch_acuerdos")
+    try:
+        execute_values(cur, sql, batch, page_size=len(batch))
+        cur.execute("RELEASE SAVEPOINT batch_acuerdos")
+        return len(batch)
+    except psycopg2.Error as e:
+        cur.execute("ROLLBACK TO SAVEPOINT batch_acuerdos")
+        cur.execute("RELEASE SAVEPOINT batch_acuerdos")
+        if len(batch) == 1:
+            informe.agregar(pd.DataFrame(batch, columns=CAMPOS_ACUERDO), motivo_error(e))
+            return 0
+
+    mitad = len(batch) // 2
+    return (_upsert_biseccion(cur, sql, batch[:mitad], informe)
+            + _upsert_biseccion(cur, sql, batch[mitad:], informe))
+
+
+def upsert_acuerdos(cur, batch, informe, inicio=None):
+    """
+    Inserta un batch de acuerdos bajo un savepoint. Si la base lo rechaza se
+    parte en mitades hasta aislar las filas con error, que van al informe;
+    el resto del batch se escribe igual y sin commits intermedios.
+    """
+    sql = UPSERT_ACUERDOS_SQL.format(origen='VALUES %s', condicion=_condicion_inicio(cur, inicio))
+    with METRICAS.medir('upsert_batch_segundos', tabla='acuerdos_prestador'):
+        return _upsert_biseccion(cur, sql, batch, informe)
+
+
+def upsert_acuerdos_copy(cur, registros, informe, inicio=None):
+    """
+    Variante COPY de upsert_acuerdos: un COPY a staging y un unico merge. Si
+    el merge falla se reintenta por batches de INSERT con biseccion.
+    """
+    cur.execute("SAVEPOINT copy_acuerdos")
+    try:
+        with METRICAS.medir('upsert_batch_segundos', tabla='acuerdos_prestador'):
+            staging = crear_staging(cur, 'acuerdos_prestador', CAMPOS_ACUERDO, registros)
+            fusionar_staging(cur, staging, CAMPOS_ACUERDO, UPSERT_ACUERDOS_SQL,
+                             condicion=_condicion_inicio(cur, inicio))
+        cur.execute("RELEASE SAVEPOINT copy_acuerdos")
+        return len(registros)
+    except psycopg2.Error as e:
+        log(f"  Error en COPY de acuerdos, se reintenta con INSERT por batches: {e}")
+        cur.execute("ROLLBACK TO SAVEPOINT copy_acuerdos")
+        cur.execute("RELEASE SAVEPOINT copy_acuerdos")
+    return sum(upsert_acuerdos(cur, registros[i:i + 1000], informe, inicio)
+               for i in range(0, len(registros), 1000))
+
+
+CONTADORES_ACUERDOS_SQL = """
+    UPDATE {tabla} t
+    SET cantidad_acuerdos = sub.cnt
+    FROM (
+        SELECT a.{columna}, COUNT(*) as cnt
+        FROM acuerdos_prestador a
+        {filtro}
+        GROUP BY a.{columna}
+    ) sub
+    WHERE t.{id} = sub.{columna}
+      AND t.cantidad_acuerdos IS DISTINCT FROM sub.cnt
+"""
 
-    conn.commit()
-    cur.close()
-    log(f"  Nomencladores cargados: {total_inserted}")
-    return total_inserted
+# Ids cuyo contador pudo cambiar en la carga. Los prestadores escritos se
+# incluyen porque el upsert pisa cantidad_acuerdos con el valor del Excel.
+TOCADOS_NOMENCLADORES_SQL = """
+    SELECT id_nomenclador FROM acuerdos_prestador WHERE updated_at >= %(desde)s
+"""
+TOCADOS_PRESTADORES_SQL = """
+    SELECT prest_id_prestador FROM acuerdos_prestador WHERE updated_at >= %(desde)s
+    UNION
+    SELECT id_prestador FROM prestadores WHERE updated_at >= %(desde)s
+"""
 
 
-# ============================================================
-# CARGAR ACUERDOS (de ambos Excel combinados)
-# ============================================================
-def cargar_acuerdos(conn):
+def actualizar_contadores_acuerdos(conn, cur, desde=None):
+    """
+    Recalcula cantidad_acuerdos de nomencladores y prestadores. Con `desde`
+    solo para los ids tocados desde ese momento; sin el, para todos
+    (--recount-all). Las filas cuyo contador no cambia no se reescriben.
+    """
+    log("  Actualizando contadores de acuerdos" + ("..." if desde else " (todos)..."))
+    actualizados = 0
+    with medir_paso('contadores') as paso:
+        for tabla, id_col, columna, tocados in [
+            ('nomencladores', 'id_nomenclador', 'id_nomenclador', TOCADOS_NOMENCLADORES_SQL),
+            ('prestadores', 'id_prestador', 'prest_id_prestador', TOCADOS_PRESTADORES_SQL),
+        ]:
+            filtro = f"WHERE a.{columna} IN ({tocados})" if desde else ""
+            cur.execute(CONTADORES_ACUERDOS_SQL.format(tabla=tabla, id=id_col, columna=columna, filtro=filtro),
+                        {'desde': desde})
+            actualizados += cur.rowcount
+        conn.commit()
+        paso['filas'] = actualizados
+    METRICAS.sumar('contadores_actualizados_total', actualizados)
+    log(f"  Contadores actualizados: {actualizados}")
+
+
+@etapa_perfilada
+def cargar_acuerdos(conn, bulk_mode='values', delta=False, bajas=False, desde=None):
     log("=" * 60)
     log("CARGANDO ACUERDOS")
     log("=" * 60)
 
-    all_acuerdos = []
+    partes = []
 
-    for archivo, nombre in [
-        (EXCEL_NOMENCLADORES, 'NOMENCLADORES_GENERALES'),
-        (EXCEL_ACUERDOS, 'ACUERDO_PRESTADORES'),
-    ]:
+    for archivo, nombre in libros_combinados():
         if not os.path.exists(archivo):
             continue
 
-        df = pd.read_excel(archivo, sheet_name=0)
-
-        col_map = {}
-        for col in df.columns:
-            col_upper = str(col).strip().upper()
-            if col_upper == 'ID_NOMENCLADOR':
-                col_map['id_nomenclador'] = col
-            elif col_upper == 'PREST_ID_PRESTADOR':
-                col_map['prest_id_prestador'] = col
-            elif col_upper == 'PLAN_ID_PLAN':
-                col_map['plan_id_plan'] = col
-            elif col_upper == 'PRECIO':
-                col_map['precio'] = col
-            elif col_upper == 'PRECIO_NORMAL':
-                col_map['precio_normal'] = col
-            elif col_upper == 'PRECIO_DIFERENCIADO':
-                col_map['precio_diferenciado'] = col
-            elif col_upper == 'PRECIO_INTERNADO':
-                col_map['precio_internado'] = col
-
-        required = ['id_nomenclador', 'prest_id_prestador', 'plan_id_plan']
-        if not all(k in col_map for k in required):
+        libro = leer_libro_combinado(archivo, nombre)
+        if libro['acuerdos'] is None:
             log(f"  {nombre}: Columnas de acuerdo no encontradas, saltando")
             continue
 
-        log(f"  {nombre}: procesando {len(df)} filas de acuerdos...")
+        log(f"  {nombre}: procesando {libro['filas']} filas de acuerdos...")
+        METRICAS.sumar('filas_descartadas_total', libro['filas'] - len(libro['acuerdos']),
+                       entidad='acuerdos', motivo='incompleta')
+        partes.append(libro['acuerdos'])
 
-        for _, row in df.iterrows():
-            id_nom = row.get(col_map['id_nomenclador'])
-            id_prest = row.get(col_map['prest_id_prestador'])
-            id_plan = row.get(col_map['plan_id_plan'])
+    df_acuerdos = pd.concat(partes, ignore_index=True) if partes else pd.DataFrame()
+    if df_acuerdos.empty:
+        log("  ERROR: No se encontraron acuerdos")
+        return 0
 
-            if pd.isna(id_nom) or pd.isna(id_prest) or pd.isna(id_plan):
-                continue
+    total_acuerdos = len(df_acuerdos)
+    df_acuerdos = df_acuerdos.drop_duplicates(subset=CAMPOS_ACUERDO[:3], keep='first')
+    unicos = len(df_acuerdos)
+    METRICAS.sumar('filas_limpias_total', unicos, entidad='acuerdos')
+    METRICAS.sumar('filas_descartadas_total', total_acuerdos - unicos, entidad='acuerdos', motivo='duplicada')
 
-            def safe_float(val):
-                if pd.isna(val) or val is None:
-                    return None
-                try:
-                    return float(val)
-                except (ValueError, TypeError):
-                    return None
-
-            all_acuerdos.append((
-                int(id_nom),
-                int(id_prest),
-                int(id_plan),
-                safe_float(row.get(col_map.get('precio', ''))),
-                safe_float(row.get(col_map.get('precio_normal', ''))),
-                safe_float(row.get(col_map.get('precio_diferenciado', ''))),
-                safe_float(row.get(col_map.get('precio_internado', ''))),
-            ))
+    cur = conn.cursor()
+    informe = InformeRechazos(RECHAZOS_ACUERDOS_PATH)
+    if TENANT is not None:
+        df_acuerdos = acuerdos_del_tenant(df_acuerdos, TENANT.mapas_ids(cur), informe)
 
-    if not all_acuerdos:
-        log("  ERROR: No se encontraron acuerdos")
-        return 0
+    carga_delta = None
+    if delta:
+        carga_delta = CargaDelta(conn, 'acuerdos_prestador', bajas=bajas)
+        df_acuerdos = carga_delta.filtrar(df_acuerdos)
 
-    seen = set()
-    unique_acuerdos = []
-    for a in all_acuerdos:
-        key = (a[0], a[1], a[2])
-        if key not in seen:
-            seen.add(key)
-            unique_acuerdos.append(a)
+    df_acuerdos = filtrar_fk_acuerdos(df_acuerdos, claves_existentes(cur), informe)
+    with medir_paso('serializacion', len(df_acuerdos)):
+        unique_acuerdos = filas_como_tuplas(df_acuerdos)
+    del df_acuerdos
 
-    log(f"  Acuerdos totales: {len(all_acuerdos)}, unicos: {len(unique_acuerdos)}")
+    log(f"  Acuerdos totales: {total_acuerdos}, unicos: {unicos}, con FK validas: {len(unique_acuerdos)}")
 
-    cur = conn.cursor()
     batch_size = 1000
     total_inserted = 0
 
-    for i in range(0, len(unique_acuerdos), batch_size):
-        batch = unique_acuerdos[i:i + batch_size]
+    with medir_paso('escritura', len(unique_acuerdos)):
+        if bulk_mode == 'copy':
+            total_inserted = upsert_acuerdos_copy(cur, unique_acuerdos, informe)
 
-        try:
-            execute_values(
-                cur,
-                """
-                INSERT INTO acuerdos_prestador (
-                    id_nomenclador, prest_id_prestador, plan_id_plan,
-                    precio, precio_normal, precio_diferenciado, precio_internado
-                ) VALUES %s
-                ON CONFLICT (prest_id_prestador, id_nomenclador, plan_id_plan) DO UPDATE SET
-                    precio = EXCLUDED.precio,
-                    precio_normal = EXCLUDED.precio_normal,
-                    precio_diferenciado = EXCLUDED.precio_diferenciado,
-                    precio_internado = EXCLUDED.precio_internado,
-                    updated_at = NOW()
-                """,
-                batch
-            )
-            total_inserted += len(batch)
-        except Exception as e:
-            log(f"  Error en batch {i}: {e}")
-            conn.rollback()
-            skipped = 0
-            for record in batch:
-                try:
-                    cur.execute(
-                        """
-                        INSERT INTO acuerdos_prestador (
-                            id_nomenclador, prest_id_prestador, plan_id_plan,
-                            precio, precio_normal, precio_diferenciado, precio_internado
-                        ) VALUES (%s, %s, %s, %s, %s, %s, %s)
-                        ON CONFLICT (prest_id_prestador, id_nomenclador, plan_id_plan) DO UPDATE SET
-                            precio = EXCLUDED.precio,
-                            precio_normal = EXCLUDED.precio_normal,
-                            precio_diferenciado = EXCLUDED.precio_diferenciado,
-                            precio_internado = EXCLUDED.precio_internado,
-                            updated_at = NOW()
-                        """,
-                        record
-                    )
-                    conn.commit()
-                    total_inserted += 1
-                except Exception as e2:
-                    conn.rollback()
-                    skipped += 1
-            if skipped:
-                log(f"  Saltados {skipped} acuerdos con FK invalidas")
+        for i in range(0, len(unique_acuerdos) if bulk_mode != 'copy' else 0, batch_size):
+            batch = unique_acuerdos[i:i + batch_size]
+            total_inserted += upsert_acuerdos(cur, batch, informe)
 
-        if total_inserted % 5000 == 0:
-            log(f"  Insertados: {total_inserted}/{len(unique_acuerdos)}")
+            if (i + batch_size) % 5000 == 0:
+                log(f"  Insertados: {total_inserted}/{len(unique_acuerdos)}")
 
-    conn.commit()
+        conn.commit()
+    if carga_delta:
+        carga_delta.guardar()
 
-    log("  Actualizando contadores de acuerdos...")
-    cur.execute("""
-        UPDATE nomencladores n
-        SET cantidad_acuerdos = sub.cnt
-        FROM (
-            SELECT id_nomenclador, COUNT(*) as cnt
-            FROM acuerdos_prestador
-            GROUP BY id_nomenclador
-        ) sub
-        WHERE n.id_nomenclador = sub.id_nomenclador
-    """)
-    cur.execute("""
-        UPDATE prestadores p
-        SET cantidad_acuerdos = sub.cnt
-        FROM (
-            SELECT prest_id_prestador, COUNT(*) as cnt
-            FROM acuerdos_prestador
-            GROUP BY prest_id_prestador
-        ) sub
-        WHERE p.id_prestador = sub.prest_id_prestador
-    """)
+    actualizar_contadores_acuerdos(conn, cur, desde)
+    cur.close()
+    informe.resumen()
+    METRICAS.sumar('filas_escritas_total', total_inserted, tabla='acuerdos_prestador')
+    log(f"  Acuerdos cargados: {total_inserted}")
+    return total_inserted
+
+
+@etapa_perfilada
+def cargar_acuerdos_streaming(conn, chunk_size=STREAM_CHUNK_SIZE, bulk_mode='values', delta=False, bajas=False,
+                              desde=None):
+    """
+    Variante de cargar_acuerdos con memoria acotada para hojas muy grandes.
+
+    Lee cada Excel por chunks de `chunk_size` filas y limpia, deduplica y
+    escribe cada chunk antes de leer el siguiente (commit por chunk). Con
+    `desde`, los contadores se recalculan solo para lo tocado desde entonces.
+    Los chunks ya commiteados por una carga cortada (--resume) se saltean.
+    """
+    log("=" * 60)
+    log(f"CARGANDO ACUERDOS (streaming, chunks de {chunk_size} filas)")
+    log("=" * 60)
+
+    cur = conn.cursor()
+    cur.execute("SELECT LOCALTIMESTAMP")
+    # Al reanudar, lo escrito antes del corte sigue contando como "ya escrito en esta carga"
+    inicio = momento_carga('streaming acuerdos_prestador', cur.fetchone()[0])
+    claves = claves_existentes(cur)
+    mapas = TENANT.mapas_ids(cur) if TENANT is not None else None
     conn.commit()
+    informe = InformeRechazos(RECHAZOS_ACUERDOS_PATH)
+    carga_delta = CargaDelta(conn, 'acuerdos_prestador', bajas=bajas) if delta else None
+
+    total_filas = 0
+    total_acuerdos = 0
+    total_inserted = 0
+    salteados = 0
+
+    for archivo, nombre in libros_combinados():
+        if not os.path.exists(archivo):
+            continue
+
+        log(f"  {nombre}: procesando acuerdos por chunks...")
+        sin_columnas = False
+        for df in iterar_excel(archivo, chunk_size):
+            total_filas += len(df)
+            huella = (huella_chunk(df, 'acuerdos_prestador', nombre, *contexto_tenant())
+                      if DIARIO is not None else None)
+            escrito = huella is not None and DIARIO.hecho('acuerdos_prestador', huella)
+            if escrito and not carga_delta:
+                salteados += len(df)
+                continue
+            with medir_paso('limpieza', len(df)):
+                acuerdos = procesar_libro_combinado(df, entidades=('acuerdos',))['acuerdos']
+            if acuerdos is None:
+                sin_columnas = True  # hoja sin columnas de acuerdo
+                continue
+
+            validos = len(acuerdos)
+            # Los duplicados entre chunks no se ven aca: los descarta la condicion del upsert
+            acuerdos = acuerdos.drop_duplicates(subset=CAMPOS_ACUERDO[:3], keep='first')
+            total_acuerdos += len(acuerdos)
+            METRICAS.sumar('filas_limpias_total', len(acuerdos), entidad='acuerdos')
+            METRICAS.sumar('filas_descartadas_total', len(df) - validos, entidad='acuerdos', motivo='incompleta')
+            METRICAS.sumar('filas_descartadas_total', validos - len(acuerdos), entidad='acuerdos',
+                           motivo='duplicada')
+            if mapas is not None:
+                # Los chunks ya escritos se traducen igual (para el delta), sin volver a informar rechazos
+                acuerdos = acuerdos_del_tenant(acuerdos, mapas, None if escrito else informe)
+            if carga_delta:
+                # Tambien para los chunks ya escritos: --bajas necesita ver todas las claves
+                acuerdos = carga_delta.filtrar(acuerdos)
+            if escrito:
+                salteados += len(df)
+                continue
+            acuerdos = filtrar_fk_acuerdos(acuerdos, claves, informe)
+            with medir_paso('serializacion', len(acuerdos)):
+                registros = filas_como_tuplas(acuerdos)
+            del df, acuerdos
+
+            with medir_paso('escritura', len(registros)):
+                if bulk_mode == 'copy':
+                    total_inserted += upsert_acuerdos_copy(cur, registros, informe, inicio)
+                else:
+                    for i in range(0, len(registros), 1000):
+                        total_inserted += upsert_acuerdos(cur, registros[i:i + 1000], informe, inicio)
+                conn.commit()
+            if huella:
+                DIARIO.registrar('acuerdos_prestador', huella, len(registros))
+            log(f"  {nombre}: filas leidas {total_filas}, acuerdos enviados {total_inserted}")
+        if sin_columnas:
+            log(f"  {nombre}: hojas sin columnas de acuerdo, salteadas")
+
+    if salteados:
+        log(f"  {salteados} filas en chunks ya escritos en la carga anterior, salteadas")
+    if not total_acuerdos and not salteados:
+        log("  ERROR: No se encontraron acuerdos")
+        cur.close()
+        return 0
+
+    if carga_delta:
+        carga_delta.guardar()
+    actualizar_contadores_acuerdos(conn, cur, desde)
     cur.close()
+    informe.resumen()
+    METRICAS.sumar('filas_escritas_total', total_inserted, tabla='acuerdos_prestador')
     log(f"  Acuerdos cargados: {total_inserted}")
     return total_inserted
 
@@ -566,51 +2788,331 @@ def cargar_acuerdos(conn):
 # ============================================================
 # REGENERAR EMBEDDINGS (para datos ya cargados sin embedding)
 # ============================================================
-def regenerar_embeddings(conn, client):
+BACKFILL_BATCH_SIZE = 1000
+
+UPDATE_EMBEDDINGS_SQL = """
+    UPDATE {tabla} t SET {columna} = v.embedding{cast}, updated_at = NOW()
+    FROM {origen} WHERE t.{id} = v.id
+"""
+
+
+def candidatos_sin_embedding(conn_lectura, tabla, id_col, texto_col, emb_col, lote):
+    """
+    Filas sin embedding recorridas por keyset sobre la PK: cada pagina es un
+    SELECT ... WHERE id > ultimo ORDER BY id LIMIT lote, asi la memoria depende
+    del lote y no del tamano de la tabla.
+    """
+    cur = conn_lectura.cursor()
+    base = f"SELECT {id_col}, {texto_col} FROM {tabla} WHERE {emb_col} IS NULL AND {texto_col} IS NOT NULL"
+    ultimo = None
+    try:
+        while True:
+            if ultimo is None:
+                cur.execute(f"{base} ORDER BY {id_col} LIMIT %s", (lote,))
+            else:
+                cur.execute(f"{base} AND {id_col} > %s ORDER BY {id_col} LIMIT %s", (ultimo, lote))
+            filas = cur.fetchall()
+            if not filas:
+                return
+            yield filas
+            ultimo = filas[-1][0]
+    finally:
+        cur.close()
+
+
+def actualizar_embeddings(cur, tabla, id_col, emb_col, pares, bulk_mode):
+    """Un solo UPDATE ... FROM por batch: VALUES en modo values, COPY binario a staging en modo copy."""
+    with METRICAS.medir('upsert_batch_segundos', tabla=tabla):
+        if bulk_mode == 'copy':
+            staging = crear_staging(cur, tabla, [id_col, emb_col], pares, binario=True)
+            cur.execute(UPDATE_EMBEDDINGS_SQL.format(
+                tabla=tabla, columna=emb_col, id=id_col, cast='',
+                origen=f"(SELECT {id_col} AS id, {emb_col} AS embedding FROM {staging}) v"
+            ))
+            cur.execute(f"DROP TABLE {staging}")
+        else:
+            execute_values(cur, UPDATE_EMBEDDINGS_SQL.format(
+                tabla=tabla, columna=emb_col, id=id_col, cast=f'::{EMBEDDING_TYPE}',
+                origen="(VALUES %s) AS v(id, embedding)"
+            ), pares, page_size=len(pares))
+    return len(pares)
+
+
+def regenerar_tabla(conn, conn_lectura, client, tabla, id_col, texto_col, emb_col, desc, bulk_mode):
+    cur = conn.cursor()
+    cur.execute(f"SELECT COUNT(*) FROM {tabla} WHERE {emb_col} IS NULL AND {texto_col} IS NOT NULL")
+    pendientes = cur.fetchone()[0]
+    if not pendientes:
+        cur.close()
+        return 0
+    log(f"  {desc} sin embedding: {pendientes}")
+
+    def con_embeddings(paginas):
+        for filas in paginas:
+            with medir_paso('embeddings', len(filas)):
+                embeddings = generar_embeddings_batch(client, [f[1] for f in filas],
+                                                      desc=f"({desc.lower()} faltantes)", detalle=False,
+                                                      tabla=tabla, ids=[f[0] for f in filas])
+            yield len(filas), [(f[0], e) for f, e in zip(filas, embeddings) if e is not None]
+
+    paginas = en_segundo_plano(candidatos_sin_embedding(
+        conn_lectura, tabla, id_col, texto_col, emb_col, BACKFILL_BATCH_SIZE))
+    revisados = actualizados = 0
+    try:
+        with closing(en_segundo_plano(con_embeddings(paginas))) as etapas:
+            for leidos, pares in etapas:
+                with medir_paso('escritura', len(pares)):
+                    if pares:
+                        actualizados += actualizar_embeddings(cur, tabla, id_col, emb_col, pares, bulk_mode)
+                    conn.commit()
+                revisados += leidos
+                log(f"  {desc}: {revisados}/{pendientes} revisados, {actualizados} actualizados")
+    finally:
+        cur.close()
+    METRICAS.sumar('filas_escritas_total', actualizados, tabla=tabla)
+    log(f"  {desc} actualizados: {actualizados}")
+    return actualizados
+
+
+@etapa_perfilada
+def regenerar_embeddings(conn, client, bulk_mode='values'):
     log("=" * 60)
     log("REGENERANDO EMBEDDINGS FALTANTES")
     log("=" * 60)
 
+    # El recorrido por keyset va por una conexion aparte (autocommit) para que
+    # los commits por batch de la escritura no interfieran con la lectura
+    conn_lectura = psycopg2.connect(**DB_CONFIG)
+    conn_lectura.autocommit = True
+    try:
+        regenerar_tabla(conn, conn_lectura, client, 'prestadores', 'id_prestador',
+                        'nombre_fantasia', 'nombre_embedding', 'Prestadores', bulk_mode)
+        regenerar_tabla(conn, conn_lectura, client, 'nomencladores', 'id_nomenclador',
+                        'descripcion', 'descripcion_embedding', 'Nomencladores', bulk_mode)
+    finally:
+        conn_lectura.close()
+
+
+# ============================================================
+# INDICES VECTORIALES (se sacan antes de una carga grande y se recrean despues)
+# ============================================================
+# Mismos nombres que crea src/workers/embedding.worker.js
+INDICES_VECTORIALES = {
+    'prestadores': ('idx_prestadores_embedding', 'nombre_embedding'),
+    'nomencladores': ('idx_nomencladores_embedding', 'descripcion_embedding'),
+}
+INDEX_MAINTENANCE_WORK_MEM = os.getenv('INDEX_MAINTENANCE_WORK_MEM', '1GB')
+
+
+def parametros_indice(tipo, filas):
+    """
+    Opciones del CREATE INDEX segun las filas con embedding, siguiendo las
+    recomendaciones de pgvector, y el ajuste sugerido para las consultas.
+    IVFFlat: lists = filas / 1000 (sqrt(filas) desde 1M), probes ~ sqrt(lists).
+    HNSW: m y ef_construction mas altos para tablas de mas de 1M filas.
+    """
+    if tipo == 'hnsw':
+        m, ef_construction = (16, 64) if filas <= 1000000 else (24, 128)
+        return f"m = {m}, ef_construction = {ef_construction}", f"hnsw.ef_search = {ef_construction}"
+    lists = max(1, filas // 1000) if filas <= 1000000 else int(filas ** 0.5)
+    return f"lists = {lists}", f"ivfflat.probes = {max(1, round(lists ** 0.5))}"
+
+
+def indices_vectoriales(cur, tabla, columna):
+    """Nombres de los indices ivfflat/hnsw sobre `columna`."""
+    cur.execute("""
+        SELECT i.relname
+        FROM pg_index x
+        JOIN pg_class i ON i.oid = x.indexrelid
+        JOIN pg_am am ON am.oid = i.relam
+        JOIN pg_attribute a ON a.attrelid = x.indrelid AND a.attnum = ANY(x.indkey)
+        WHERE x.indrelid = %s::regclass AND a.attname = %s AND am.amname IN ('ivfflat', 'hnsw')
+    """, (tabla, columna))
+    return [fila[0] for fila in cur.fetchall()]
+
+
+def tipo_columna(cur, tabla, columna):
+    """Tipo de `columna` con sus modificadores, p. ej. 'vector(1536)' o 'halfvec(512)'."""
+    cur.execute(
+        "SELECT format_type(atttypid, atttypmod) FROM pg_attribute "
+        "WHERE attrelid = %s::regclass AND attname = %s AND NOT attisdropped",
+        (tabla, columna)
+    )
+    fila = cur.fetchone()
+    return fila[0] if fila else None
+
+
+def verificar_columnas_embedding(conn, tablas):
+    """Las columnas de embedding de `tablas` tienen que coincidir con EMBEDDING_TYPE/EMBEDDING_DIMENSIONS."""
+    esperado = f"{EMBEDDING_TYPE}({EMBEDDING_DIMENSIONS})"
+    with conn.cursor() as cur:
+        for tabla in tablas:
+            _, columna = INDICES_VECTORIALES[tabla]
+            actual = tipo_columna(cur, tabla, columna)
+            if actual != esperado:
+                raise RuntimeError(
+                    f"{tabla}.{columna} es {actual} y la carga genera {esperado}; aplicar "
+                    f"database/migration_embeddings_reducidos.sql o ajustar EMBEDDING_TYPE/EMBEDDING_DIMENSIONS")
+    conn.commit()
+
+
+def eliminar_indices_vectoriales(conn, tablas):
+    """Saca los indices vectoriales de `tablas`: escribir vectores en un indice vivo es lento."""
     cur = conn.cursor()
+    for tabla in tablas:
+        _, columna = INDICES_VECTORIALES[tabla]
+        for indice in indices_vectoriales(cur, tabla, columna):
+            cur.execute(f"DROP INDEX IF EXISTS {indice}")
+            log(f"  Indice {indice} eliminado, se recrea al terminar la carga")
+    conn.commit()
+    cur.close()
 
-    cur.execute("SELECT id_prestador, nombre_fantasia FROM prestadores WHERE nombre_embedding IS NULL AND nombre_fantasia IS NOT NULL")
-    rows = cur.fetchall()
-    if rows:
-        log(f"  Prestadores sin embedding: {len(rows)}")
-        ids = [r[0] for r in rows]
-        textos = [r[1] for r in rows]
-        embeddings = generar_embeddings_batch(client, textos, desc="(prestadores faltantes)")
-        for pid, emb in zip(ids, embeddings):
-            if emb:
-                cur.execute(
-                    "UPDATE prestadores SET nombre_embedding = %s, updated_at = NOW() WHERE id_prestador = %s",
-                    (embedding_to_pgvector(emb), pid)
-                )
-        conn.commit()
-        log(f"  Prestadores actualizados: {sum(1 for e in embeddings if e)}")
-
-    cur.execute("SELECT id_nomenclador, descripcion FROM nomencladores WHERE descripcion_embedding IS NULL AND descripcion IS NOT NULL")
-    rows = cur.fetchall()
-    if rows:
-        log(f"  Nomencladores sin embedding: {len(rows)}")
-        ids = [r[0] for r in rows]
-        textos = [r[1] for r in rows]
-        embeddings = generar_embeddings_batch(client, textos, desc="(nomencladores faltantes)")
-        for nid, emb in zip(ids, embeddings):
-            if emb:
-                cur.execute(
-                    "UPDATE nomencladores SET descripcion_embedding = %s, updated_at = NOW() WHERE id_nomenclador = %s",
-                    (embedding_to_pgvector(emb), nid)
-                )
+
+def crear_indices_vectoriales(conn, tablas, tipo='ivfflat'):
+    """
+    Recrea el indice vectorial de cada tabla con parametros segun sus filas
+    con embedding, con maintenance_work_mem alto solo para el build.
+    """
+    cur = conn.cursor()
+    for tabla in tablas:
+        indice, columna = INDICES_VECTORIALES[tabla]
+        cur.execute(f"SELECT COUNT(*) FROM {tabla} WHERE {columna} IS NOT NULL")
+        filas = cur.fetchone()[0]
+        if not filas:
+            log(f"  {tabla}: sin embeddings, no se crea {indice}")
+            continue
+
+        opciones, ajuste = parametros_indice(tipo, filas)
+        # vector_cosine_ops o halfvec_cosine_ops segun el tipo de la columna
+        operadores = tipo_columna(cur, tabla, columna).split('(')[0] + '_cosine_ops'
+        inicio = time.time()
+        for existente in indices_vectoriales(cur, tabla, columna):
+            cur.execute(f"DROP INDEX IF EXISTS {existente}")
+        cur.execute("SET LOCAL maintenance_work_mem = %s", (INDEX_MAINTENANCE_WORK_MEM,))
+        cur.execute(f"CREATE INDEX {indice} ON {tabla} USING {tipo} ({columna} {operadores}) "
+                    f"WITH ({opciones})")
         conn.commit()
-        log(f"  Nomencladores actualizados: {sum(1 for e in embeddings if e)}")
+        duracion = time.time() - inicio
 
+        cur.execute("SELECT pg_size_pretty(pg_relation_size(%s::regclass))", (indice,))
+        log(f"  Indice {indice}: {tipo} ({opciones}) sobre {filas} filas en {duracion:.1f}s, "
+            f"{cur.fetchone()[0]}; en las consultas: SET {ajuste}")
+    conn.commit()
     cur.close()
 
 
+# ============================================================
+# PLANIFICADOR (cargas independientes en paralelo)
+# ============================================================
+TIEMPOS_ETAPAS = {}
+
+
+@contextmanager
+def medir_etapa(nombre):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        TIEMPOS_ETAPAS[nombre] = TIEMPOS_ETAPAS.get(nombre, 0) + time.perf_counter() - inicio
+
+
+def resumen_etapas():
+    if TIEMPOS_ETAPAS:
+        log("  Tiempos por etapa: " + ", ".join(f"{nombre} {segundos:.1f}s"
+                                               for nombre, segundos in TIEMPOS_ETAPAS.items()))
+    if PASOS:
+        log("  Pasos: " + ", ".join(
+            f"{nombre} {p['segundos']:.1f}s"
+            + (f" ({p['filas'] / p['segundos']:,.0f} filas/s)" if p['filas'] and p['segundos'] > 0 else "")
+            for nombre, p in PASOS.items()) + f"; pico de RSS {rss_pico_mb():.0f} MB")
+
+
+def _leer_hoja_aparte(archivo, nombre, hoja, procesar, varias):
+    """Lee y limpia una hoja en un proceso hijo; devuelve tambien sus pasos y metricas."""
+    PASOS.clear()  # el proceso puede haber leido otra hoja antes
+    METRICAS.reiniciar()
+    return leer_hoja(archivo, archivo, nombre, hoja, procesar, varias), dict(PASOS), METRICAS.series
+
+
+def parsear_en_procesos(libros):
+    """
+    Lee y limpia los `libros` [(archivo, nombre, procesar)] en procesos
+    aparte (el parseo usa CPU y no libera el GIL), una tarea por hoja, y
+    deja cada libro unido en _libros_leidos para las cargas. Los que estan
+    en la cache de parseo se leen de ahi. Con una sola CPU, o si no se
+    pueden crear procesos, cada carga parsea su libro como siempre.
+    """
+    if (os.cpu_count() or 1) < 2:
+        return
+    tareas = []
+    for archivo, nombre, procesar in libros:
+        if os.path.exists(archivo) and archivo not in _libros_leidos and libro_de_cache(archivo, nombre) is None:
+            hojas = hojas_excel(archivo)
+            tareas += [(archivo, nombre, hoja, procesar, len(hojas) > 1) for hoja in hojas]
+    procesos = min(len(tareas), os.cpu_count())
+    if procesos < 2:
+        return
+    try:
+        with medir_etapa('parseo'), ProcessPoolExecutor(max_workers=procesos) as pool:
+            futuros = {pool.submit(_leer_hoja_aparte, *tarea): i for i, tarea in enumerate(tareas)}
+            hojas = [None] * len(tareas)
+            for futuro in as_completed(futuros):
+                hojas[futuros[futuro]], pasos, metricas = futuro.result()
+                sumar_pasos(pasos)
+                METRICAS.combinar(metricas)
+        for archivo in dict.fromkeys(tarea[0] for tarea in tareas):
+            libro = unir_hojas([hoja for tarea, hoja in zip(tareas, hojas) if tarea[0] == archivo])
+            guardar_cache_parseo(archivo, libro)
+            _libros_leidos[archivo] = libro
+    except Exception as e:
+        log(f"  ADVERTENCIA: Parseo en procesos no disponible, se parsea en cada carga: {e}")
+
+
+def crear_pool_cargas():
+    """
+    Pool de cargar_en_paralelo: una conexion por carga independiente (todas
+    las tablas menos acuerdos). Todas quedan abiertas al devolverlas, asi
+    una recarga de --watch no vuelve a conectarse.
+    """
+    n = len(TABLAS_CARGA) - 1
+    return ThreadedConnectionPool(n, n, **DB_CONFIG)
+
+
+def _con_conexion(pool, nombre, carga):
+    conn = pool.getconn()
+    try:
+        with medir_etapa(nombre):
+            return carga(conn)
+    except Exception:
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            pass  # conexion rota: el pool la descarta al devolverla y abre otra
+        raise
+    finally:
+        pool.putconn(conn)
+
+
+def cargar_en_paralelo(pool, independientes, dependiente=None):
+    """
+    Corre las cargas `independientes` ({nombre: carga(conn)}) a la vez, cada
+    una en su hilo y con su conexion de `pool`, y despues `dependiente`
+    (nombre, carga), que necesita a todas: acuerdos tiene FK a prestadores y
+    nomencladores. Si una carga falla, la dependiente no se corre.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, len(independientes))) as hilos:
+        futuros = [hilos.submit(_con_conexion, pool, nombre, carga)
+                   for nombre, carga in independientes.items()]
+        for futuro in as_completed(futuros):
+            futuro.result()
+    if dependiente:
+        _con_conexion(pool, *dependiente)
+
+
 # ============================================================
 # ESTADISTICAS FINALES
 # ============================================================
+@etapa_perfilada
 def mostrar_estadisticas(conn):
     log("=" * 60)
     log("ESTADISTICAS FINALES")
@@ -662,10 +3164,469 @@ def mostrar_estadisticas(conn):
     cur.close()
 
 
+# ============================================================
+# CARGA MULTI-TENANT (--tenant: los Excel de varios tenants en una corrida)
+# ============================================================
+TENANTS_DIR = os.getenv('TENANTS_DIR', os.path.join(DATA_DIR, 'tenants'))
+TENANTS = []   # TenantCarga de --tenant, en el orden de la linea de comandos
+TENANT = None  # el que se esta cargando (None fuera de --tenant)
+COLUMNAS_TENANT = ['id_externo', 'tenant_id']
+
+# Columnas que agregan migration_multitenant.sql y migration_ingestion_jobs.sql
+ESQUEMA_TENANT = [
+    ('prestadores', 'tenant_id'), ('prestadores', 'id_externo'),
+    ('nomencladores', 'tenant_id'), ('nomencladores', 'id_externo'),
+    ('acuerdos_prestador', 'tenant_id'),
+]
+
+ASIGNAR_TENANT_ACUERDOS_SQL = """
+    UPDATE acuerdos_prestador a SET tenant_id = p.tenant_id
+    FROM prestadores p
+    WHERE a.prest_id_prestador = p.id_prestador
+      AND p.tenant_id = %s
+      AND a.tenant_id IS DISTINCT FROM p.tenant_id
+"""
+
+
+class TenantCarga:
+    """
+    Un tenant de --tenant: su slug en `tenants` y el directorio con sus tres
+    Excel (mismos nombres que en data/). Los ids del Excel se guardan como
+    id_externo y cada fila recibe un id interno, asi dos tenants con el mismo
+    catalogo no se pisan.
+    """
+
+    def __init__(self, slug, directorio):
+        self.slug = slug
+        self.directorio = directorio
+        self.id = None  # UUID, lo completa resolver_tenants
+
+    def archivos(self):
+        return tuple(os.path.join(self.directorio, os.path.basename(ruta))
+                     for ruta in (EXCEL_PRESTADORES, EXCEL_NOMENCLADORES, EXCEL_ACUERDOS))
+
+    def mapa_ids(self, cur, tabla, id_col):
+        """{id_externo: id interno} de las filas del tenant en `tabla`."""
+        cur.execute(f"SELECT id_externo, {id_col} FROM {tabla} WHERE tenant_id = %s", (self.id,))
+        return dict(cur.fetchall())
+
+    def mapas_ids(self, cur):
+        return {'prestadores': self.mapa_ids(cur, 'prestadores', 'id_prestador'),
+                'nomencladores': self.mapa_ids(cur, 'nomencladores', 'id_nomenclador')}
+
+
+def tenant_de_argumento(valor):
+    """SLUG o SLUG=DIR de --tenant (sin DIR, TENANTS_DIR/SLUG)."""
+    slug, _, directorio = valor.partition('=')
+    if not slug:
+        raise argparse.ArgumentTypeError(f"tenant sin slug: {valor!r}")
+    return TenantCarga(slug, directorio or os.path.join(TENANTS_DIR, slug))
+
+
+def contexto_tenant():
+    """Lo que distingue un chunk de un tenant del mismo chunk de otro, para el DIARIO."""
+    return (TENANT.slug,) if TENANT is not None else ()
+
+
+def con_columnas_tenant(columnas, upsert_sql):
+    """Columnas y upsert de prestadores o nomencladores, con id_externo y tenant_id si hay TENANT."""
+    if TENANT is None:
+        return columnas, upsert_sql
+    return (columnas + COLUMNAS_TENANT,
+            upsert_sql.replace(') {origen}', f", {', '.join(COLUMNAS_TENANT)}) {{origen}}", 1))
+
+
+def con_ids_del_tenant(conn, df, tabla, a_registros, escribir):
+    """
+    `df` de prestadores o nomencladores con el id del Excel en id_externo y
+    el id interno del tenant en su lugar: el que ya tenia esa fila o, si es
+    nueva, uno a continuacion del maximo de la tabla.
+
+    Las filas nuevas se escriben enseguida (sin embedding; el pipeline las
+    completa) en la misma transaccion que toma el maximo, con la tabla
+    bloqueada: la API de ingesta, que tambien asigna con MAX + 1, espera al
+    commit y ya no puede tomar un id reservado para una fila todavia sin
+    escribir.
+    """
+    id_col = TABLAS_DELTA[tabla]['claves'][0]
+    externos = df[id_col].astype('int64').astype(str)
+    with conn.cursor() as cur:
+        # SHARE ROW EXCLUSIVE choca con los INSERT/UPDATE de otros, no con las lecturas
+        cur.execute(f"LOCK TABLE {tabla} IN SHARE ROW EXCLUSIVE MODE")
+        mapa = TENANT.mapa_ids(cur, tabla, id_col)
+        nuevas = ~externos.isin(mapa)
+        nuevos = externos[nuevas].unique()
+        if len(nuevos):
+            cur.execute(f"SELECT COALESCE(MAX({id_col}), 0) FROM {tabla}")
+            siguiente = cur.fetchone()[0] + 1
+            mapa.update(zip(nuevos, range(siguiente, siguiente + len(nuevos))))
+        df = df.assign(**{id_col: externos.map(mapa).astype('int64').to_numpy(),
+                          'id_externo': externos.to_numpy()})
+        if len(nuevos):
+            parte = df[nuevas.to_numpy()]
+            escribir(cur, a_registros(parte, [None] * len(parte)))
+    conn.commit()
+    log(f"  Tenant {TENANT.slug}: {len(externos) - len(nuevos)} {tabla} existentes, {len(nuevos)} nuevos")
+    return df
+
+
+def acuerdos_del_tenant(df, mapas, informe):
+    """
+    Acuerdos con los ids del Excel pasados a los internos del tenant. Los que
+    apuntan a un prestador o nomenclador que el tenant no tiene se descartan
+    y, con `informe`, van al CSV de rechazos con los ids del Excel.
+    """
+    prestadores = df['prest_id_prestador'].astype('int64').astype(str).map(mapas['prestadores'])
+    nomencladores = df['id_nomenclador'].astype('int64').astype(str).map(mapas['nomencladores'])
+    if informe is not None:
+        claves = (set(df['prest_id_prestador'][prestadores.notna()]),
+                  set(df['id_nomenclador'][nomencladores.notna()]))
+        filtrar_fk_acuerdos(df, claves, informe)
+    validos = prestadores.notna() & nomencladores.notna()
+    return df[validos].assign(prest_id_prestador=prestadores[validos].astype('int64'),
+                              id_nomenclador=nomencladores[validos].astype('int64'))
+
+
+def resolver_tenants(conn, tenants):
+    """Verifica las columnas de tenant y completa el UUID de cada tenant por su slug."""
+    with conn.cursor() as cur:
+        for tabla, columna in ESQUEMA_TENANT:
+            cur.execute("SELECT 1 FROM information_schema.columns WHERE table_name = %s AND column_name = %s",
+                        (tabla, columna))
+            if cur.fetchone() is None:
+                raise RuntimeError(f"{tabla} no tiene la columna {columna}; aplicar database/migration_multitenant.sql, "
+                                   f"migration_ingestion_jobs.sql y migration_tenant_isolation.sql para usar --tenant")
+        cur.execute("SELECT slug, id::text FROM tenants WHERE slug = ANY(%s)", ([t.slug for t in tenants],))
+        ids = dict(cur.fetchall())
+    conn.commit()
+    faltantes = [t.slug for t in tenants if t.slug not in ids]
+    if faltantes:
+        raise RuntimeError(f"Tenants inexistentes en la tabla tenants: {', '.join(faltantes)}")
+    for tenant in tenants:
+        tenant.id = ids[tenant.slug]
+
+
+@contextmanager
+def en_tenant(tenant):
+    """
+    Apunta TENANT, los Excel y el CSV de rechazos de acuerdos al tenant. Al
+    salir suelta sus libros leidos, asi en memoria hay solo los de uno.
+    """
+    global TENANT, EXCEL_PRESTADORES, EXCEL_NOMENCLADORES, EXCEL_ACUERDOS, RECHAZOS_ACUERDOS_PATH
+    anteriores = TENANT, EXCEL_PRESTADORES, EXCEL_NOMENCLADORES, EXCEL_ACUERDOS, RECHAZOS_ACUERDOS_PATH
+    EXCEL_PRESTADORES, EXCEL_NOMENCLADORES, EXCEL_ACUERDOS = tenant.archivos()
+    if RECHAZOS_ACUERDOS_PATH:
+        base, extension = os.path.splitext(RECHAZOS_ACUERDOS_PATH)
+        RECHAZOS_ACUERDOS_PATH = f"{base}_{tenant.slug}{extension}"
+    TENANT = tenant
+    try:
+        yield
+    finally:
+        for archivo in tenant.archivos():
+            _libros_leidos.pop(archivo, None)
+        TENANT, EXCEL_PRESTADORES, EXCEL_NOMENCLADORES, EXCEL_ACUERDOS, RECHAZOS_ACUERDOS_PATH = anteriores
+
+
+def cargar_tenants(conn, client, args, tablas, desde, pool=None):
+    """
+    Carga los Excel de cada tenant de TENANTS, de a uno. Los embeddings se
+    comparten: un texto que ya embebio otro tenant (en esta corrida o en una
+    anterior) sale de la cache de embeddings, que es por contenido, asi que
+    cada texto distinto se pide una sola vez aunque este en todos los tenants.
+    """
+    resolver_tenants(conn, TENANTS)
+    for n, tenant in enumerate(TENANTS, 1):
+        log("=" * 60)
+        log(f"TENANT {n}/{len(TENANTS)}: {tenant.slug} ({tenant.directorio})")
+        log("=" * 60)
+        with _lock_estadisticas:
+            antes = dict(ESTADISTICAS_EMBEDDINGS)
+        with en_tenant(tenant):
+            cargar_tablas(conn, client, args, tablas, desde, pool)
+        if 'acuerdos' in tablas:
+            with conn.cursor() as cur:
+                cur.execute(ASIGNAR_TENANT_ACUERDOS_SQL, (tenant.id,))
+            conn.commit()
+        if client and not args.skip_embeddings:
+            with _lock_estadisticas:
+                e = {clave: ESTADISTICAS_EMBEDDINGS[clave] - antes[clave] for clave in antes}
+            log(f"  Tenant {tenant.slug}: {e['distintos']} textos distintos, {e['cache']} de la cache "
+                f"(compartidos con otros tenants o cargas anteriores), {e['api']} pedidos a la API")
+
+
+# ============================================================
+# CORRIDA (una carga completa, sola o dentro de --watch)
+# ============================================================
+TABLAS_CARGA = ('prestadores', 'nomencladores', 'acuerdos')
+TABLAS_CON_EMBEDDING = {'prestadores', 'nomencladores'}
+
+
+def crear_cliente_embeddings(api_key):
+    """Cliente de la API; el SDK se importa recien aca, asi las cargas sin embeddings no lo cargan."""
+    from openai import OpenAI
+
+    # Los reintentos (y Retry-After) los maneja pedir_embeddings
+    return OpenAI(api_key=api_key, max_retries=0)
+
+
+def reiniciar_mediciones():
+    """Deja en cero los tiempos, pasos, estadisticas y metricas de la corrida anterior (--watch)."""
+    PASOS.clear()
+    TIEMPOS_ETAPAS.clear()
+    with _lock_estadisticas:
+        for clave in ESTADISTICAS_EMBEDDINGS:
+            ESTADISTICAS_EMBEDDINGS[clave] = 0
+    METRICAS.reiniciar()
+
+
+def cargar_tablas(conn, client, args, tablas, desde, pool=None):
+    """
+    Carga `tablas` de los Excel configurados: en paralelo, con las conexiones
+    de `pool`, o, con --secuencial, una por una en `conn`.
+    """
+    independientes = {}
+    libros = []
+    if 'prestadores' in tablas:
+        independientes['prestadores'] = lambda c: cargar_prestadores(
+            c, client, args.skip_embeddings, args.bulk_mode, args.delta, args.bajas)
+        libros.append((EXCEL_PRESTADORES, 'PRESTADORES_PRINCIPALES', procesar_prestadores))
+
+    if 'nomencladores' in tablas:
+        independientes['nomencladores'] = lambda c: cargar_nomencladores(
+            c, client, args.skip_embeddings, args.chunk_size if args.streaming else None,
+            args.bulk_mode, args.delta, args.bajas)
+
+    acuerdos = None
+    if 'acuerdos' in tablas:
+        if args.streaming:
+            acuerdos = ('acuerdos', lambda c: cargar_acuerdos_streaming(
+                c, args.chunk_size, args.bulk_mode, args.delta, args.bajas, desde))
+        else:
+            acuerdos = ('acuerdos', lambda c: cargar_acuerdos(
+                c, args.bulk_mode, args.delta, args.bajas, desde))
+
+    if not args.streaming and (acuerdos or 'nomencladores' in independientes):
+        libros += [(archivo, nombre, procesar_libro_combinado) for archivo, nombre in libros_combinados()]
+
+    if args.secuencial:
+        for nombre, carga in [*independientes.items(), *([acuerdos] if acuerdos else [])]:
+            with medir_etapa(nombre):
+                carga(conn)
+    else:
+        if not PERFIL:  # con --profile el parseo queda en el perfil de cada etapa
+            parsear_en_procesos(libros)
+        cargar_en_paralelo(pool, independientes, acuerdos)
+
+
+def ejecutar_carga(conn, client, args, tablas, reanudar=False, pool=None):
+    """
+    Una corrida: carga `tablas` (o regenera embeddings con --only-embeddings),
+    muestra el resumen y, salga bien o mal, exporta las metricas. Los errores
+    e interrupciones se propagan a quien llama. Sin `pool` (ver
+    crear_pool_cargas), la carga en paralelo abre uno y lo cierra al terminar.
+    """
+    global DIARIO, RECHAZOS_EMBEDDINGS
+    reiniciar_mediciones()
+    RECHAZOS_EMBEDDINGS = TextosRechazados(RECHAZOS_EMBEDDINGS_PATH) if client else None
+    if DIARIO_CARGA_PATH and not args.only_embeddings:
+        DIARIO = DiarioCarga(DIARIO_CARGA_PATH, reanudar=reanudar)
+        if reanudar:
+            chunks, filas = DIARIO.pendiente()
+            log(f"  Reanudando carga: {chunks} chunks ({filas} filas) ya escritos" if chunks
+                else "  ADVERTENCIA: --resume sin carga cortada registrada, se carga todo")
+
+    inicio = time.time()
+    exito = False
+    propio = pool is None and not (args.secuencial or args.only_embeddings)
+    if propio:
+        pool = crear_pool_cargas()
+    try:
+        desde = None
+        if not args.recount_all:
+            with conn.cursor() as cur:
+                cur.execute("SELECT LOCALTIMESTAMP")
+                desde = momento_carga('desde', cur.fetchone()[0])
+            conn.commit()
+
+        tablas_vectoriales = [t for t in INDICES_VECTORIALES if args.only_embeddings or t in tablas]
+        if client:
+            verificar_columnas_embedding(conn, tablas_vectoriales)
+
+        tablas_indices = []
+        if args.recrear_indices:
+            tablas_indices = tablas_vectoriales
+            eliminar_indices_vectoriales(conn, tablas_indices)
+
+        try:
+            if args.only_embeddings:
+                if not client:
+                    log("ERROR: Se requiere OPENAI_API_KEY para generar embeddings")
+                    sys.exit(1)
+                regenerar_embeddings(conn, client, args.bulk_mode)
+            elif TENANTS:
+                cargar_tenants(conn, client, args, tablas, desde, pool)
+            else:
+                cargar_tablas(conn, client, args, tablas, desde, pool)
+        finally:
+            # Tambien si la carga falla: la base no queda sin indices vectoriales
+            if tablas_indices:
+                conn.rollback()
+                with medir_etapa('indices'):
+                    crear_indices_vectoriales(conn, tablas_indices, args.tipo_indice)
+
+        mostrar_estadisticas(conn)
+        resumen_cache_embeddings()
+        resumen_etapas()
+
+        duracion = time.time() - inicio
+        log(f"\nTiempo total: {duracion:.1f}s ({duracion/60:.1f} min)")
+        log("Carga completada exitosamente")
+        exito = True
+        if DIARIO:
+            DIARIO.vaciar()  # no queda nada que reanudar
+    finally:
+        exportar_metricas(exito, time.time() - inicio, args.metricas_json, args.metricas_prom)
+        if propio:
+            pool.closeall()
+        if DIARIO:
+            DIARIO.cerrar()
+            DIARIO = None
+        RECHAZOS_EMBEDDINGS = None
+
+
+# ============================================================
+# MODO VIGILANCIA (--watch: proceso que queda vivo y recarga lo que cambia)
+# ============================================================
+VIGILANCIA_ESTADO_PATH = os.getenv('VIGILANCIA_ESTADO_PATH', os.path.join(DATA_DIR, '.cache', 'vigilancia.json'))
+VIGILANCIA_DEBOUNCE = float(os.getenv('VIGILANCIA_DEBOUNCE', '10'))  # segundos sin cambios antes de cargar
+VIGILANCIA_INTERVALO = float(os.getenv('VIGILANCIA_INTERVALO', '2'))  # segundos entre revisiones
+VIGILANCIA_REINTENTO = float(os.getenv('VIGILANCIA_REINTENTO', '60'))  # espera tras una carga fallida
+
+
+def tablas_afectadas(archivos):
+    """
+    Tablas a recargar cuando cambian `archivos`. Acuerdos va siempre: sus FK
+    y los contadores dependen tanto de prestadores como de nomencladores.
+    """
+    tablas = set()
+    for archivo in archivos:
+        tablas |= {'prestadores' if archivo == EXCEL_PRESTADORES else 'nomencladores', 'acuerdos'}
+    return tablas
+
+
+class VigilanteLibros:
+    """
+    Sigue los Excel por (tamano, mtime) y entrega los que difieren de la
+    ultima carga buena (sha256 guardado en `ruta_estado`), recien cuando no
+    cambiaron durante `debounce` segundos y ya se abren como zip: una copia
+    a medias o un guardado de Excel en curso no dispara una carga.
+    """
+
+    def __init__(self, archivos, ruta_estado, debounce):
+        self.archivos = list(archivos)
+        self.ruta_estado = ruta_estado
+        self.debounce = debounce
+        self.vistos = {}  # archivo -> [firma (tamano, mtime), visto desde, sha256 o None]
+        self.cargados = {}  # archivo -> sha256 de la ultima carga buena
+        if ruta_estado and os.path.exists(ruta_estado):
+            try:
+                with open(ruta_estado, encoding='utf-8') as f:
+                    self.cargados = json.load(f)
+            except (OSError, ValueError) as e:
+                log(f"  ADVERTENCIA: Estado de vigilancia ilegible ({ruta_estado}), se recarga todo: {e}")
+
+    def listos(self, ahora=None):
+        """[(archivo, sha256)] estables y distintos de lo ultimo cargado."""
+        ahora = time.monotonic() if ahora is None else ahora
+        listos = []
+        for archivo in self.archivos:
+            try:
+                st = os.stat(archivo)
+            except FileNotFoundError:
+                self.vistos.pop(archivo, None)
+                continue
+            firma = (st.st_size, st.st_mtime_ns)
+            visto = self.vistos.get(archivo)
+            if visto is None or visto[0] != firma:
+                self.vistos[archivo] = [firma, ahora, None]
+                continue
+            if ahora - visto[1] < self.debounce or not zipfile.is_zipfile(archivo):
+                continue
+            if visto[2] is None:  # el hash se calcula una vez por version del archivo
+                visto[2] = sha256_archivo(archivo)
+            if visto[2] != self.cargados.get(archivo):
+                listos.append((archivo, visto[2]))
+        return listos
+
+    def marcar_cargados(self, listos):
+        self.cargados.update(listos)
+        if self.ruta_estado:
+            _escribir_atomico(self.ruta_estado, json.dumps(self.cargados, indent=2))
+
+
+def vigilar(client, args, tablas):
+    """
+    Bucle de --watch: la conexion, el pool de la carga en paralelo, el
+    cliente de embeddings y los libros ya parseados se mantienen entre
+    cargas; cada cambio recarga solo las tablas afectadas (dentro de
+    `tablas`). Una carga fallida se reintenta, con el diario, desde el
+    primer chunk sin escribir. Termina con Ctrl+C.
+    """
+    vigilante = VigilanteLibros([], VIGILANCIA_ESTADO_PATH, args.debounce)
+    log(f"\nVigilando {DATA_DIR} (revision cada {args.intervalo:g}s, "
+        f"{args.debounce:g}s sin cambios antes de cargar)... Ctrl+C para terminar")
+    conn = pool = None
+    reanudar = args.resume
+    try:
+        while True:
+            # Con --libros, un libro nuevo en el directorio entra en la proxima revision
+            vigilante.archivos = [EXCEL_PRESTADORES, *(archivo for archivo, _ in libros_combinados())]
+            listos = vigilante.listos()
+            afectadas = tablas_afectadas(archivo for archivo, _ in listos) & tablas
+            if not afectadas:
+                if listos:  # cambios en libros de tablas fuera de --only
+                    vigilante.marcar_cargados(listos)
+                time.sleep(args.intervalo)
+                continue
+
+            log(f"\n{'='*60}\nCambios en {', '.join(nombre_libro(a) for a, _ in listos)}: "
+                f"recargando {', '.join(t for t in TABLAS_CARGA if t in afectadas)}")
+            for archivo, _ in listos:
+                _libros_leidos.pop(archivo, None)
+            try:
+                if conn is None or conn.closed:
+                    conn = conectar_db(reintentable=True)
+                if pool is None and not args.secuencial:
+                    pool = crear_pool_cargas()
+                ejecutar_carga(conn, client, args, afectadas, reanudar=reanudar, pool=pool)
+                vigilante.marcar_cargados(listos)
+                reanudar = False
+            except Exception as e:
+                log(f"\nERROR durante la carga: {e} (reintento en {VIGILANCIA_REINTENTO:g}s)")
+                import traceback
+                traceback.print_exc()
+                if conn is not None and not conn.closed:
+                    try:
+                        conn.rollback()
+                    except psycopg2.Error:
+                        conn.close()  # conexion rota: se abre otra en el reintento
+                reanudar = bool(DIARIO_CARGA_PATH)
+                time.sleep(VIGILANCIA_REINTENTO)
+    except KeyboardInterrupt:
+        log("\nVigilancia terminada por el usuario.")
+    finally:
+        if pool is not None:
+            pool.closeall()
+        if conn is not None and not conn.closed:
+            conn.close()
+
+
 # ============================================================
 # MAIN
 # ============================================================
 def main():
+    global PARSE_CACHE_DIR, EMBEDDING_CACHE_PATH, RECHAZOS_ACUERDOS_PATH, EMBEDDING_DIMENSIONS, EMBEDDING_TYPE, PERFIL
+    global LIBROS_COMBINADOS, REINTENTAR_RECHAZADOS, TENANTS
     parser = argparse.ArgumentParser(description='Cargar datos Excel a PostgreSQL')
     parser.add_argument('--skip-embeddings', action='store_true',
                         help='Cargar datos sin generar embeddings (mas rapido)')
@@ -673,68 +3634,155 @@ def main():
                         help='Solo regenerar embeddings faltantes')
     parser.add_argument('--only', choices=['prestadores', 'nomencladores', 'acuerdos'],
                         help='Cargar solo una tabla especifica')
+    parser.add_argument('--libros', action='append', metavar='RUTA',
+                        help='Excel de nomencladores y acuerdos: archivo, directorio o glob (repetible); '
+                             'reemplaza a NOMENCLADORES_GENERALES.xlsx y ACUERDO_PRESTADORES.xlsx. '
+                             'Se leen todas las hojas de cada libro')
+    parser.add_argument('--tenant', action='append', dest='tenants', type=tenant_de_argumento, metavar='SLUG[=DIR]',
+                        help='Cargar los Excel de un tenant (repetible): los de DIR, o de data/tenants/SLUG. '
+                             'Los embeddings se piden una vez por texto distinto entre todos los tenants')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Ignorar la cache de parseo y volver a leer los Excel')
+    parser.add_argument('--no-embedding-cache', action='store_true',
+                        help='No usar la cache local de embeddings (siempre pedir a la API)')
+    parser.add_argument('--bulk-mode', choices=['values', 'copy'], default='values',
+                        help='Escritura con INSERT por batches (values) o COPY a tabla staging (copy)')
+    parser.add_argument('--streaming', action='store_true',
+                        help='Cargar acuerdos leyendo el Excel por chunks (memoria acotada)')
+    parser.add_argument('--chunk-size', type=int, default=STREAM_CHUNK_SIZE,
+                        help=f'Filas por chunk en modo --streaming (default {STREAM_CHUNK_SIZE})')
+    parser.add_argument('--delta', action='store_true',
+                        help='Escribir solo las filas nuevas o cambiadas (requiere migration_carga_delta.sql)')
+    parser.add_argument('--bajas', action='store_true',
+                        help='Con --delta, dar de baja las claves que ya no vienen en el Excel')
+    parser.add_argument('--secuencial', action='store_true',
+                        help='Cargar las tablas una por una en una sola conexion (sin paralelismo)')
+    parser.add_argument('--recrear-indices', action='store_true',
+                        help='Sacar los indices vectoriales antes de la carga y recrearlos al final')
+    parser.add_argument('--tipo-indice', choices=['ivfflat', 'hnsw'], default='ivfflat',
+                        help='Tipo de indice vectorial a recrear con --recrear-indices (default ivfflat)')
+    parser.add_argument('--dimensiones', type=int, default=EMBEDDING_DIMENSIONS,
+                        help=f'Dimensiones de los embeddings (default {EMBEDDING_DIMENSIONS}, o EMBEDDING_DIMENSIONS)')
+    parser.add_argument('--tipo-vector', choices=['vector', 'halfvec'], default=EMBEDDING_TYPE,
+                        help=f'Tipo pgvector de las columnas de embedding (default {EMBEDDING_TYPE}, o EMBEDDING_TYPE)')
+    parser.add_argument('--recount-all', action='store_true',
+                        help='Recalcular cantidad_acuerdos de todas las filas, no solo de las tocadas')
+    parser.add_argument('--rechazos',
+                        help='CSV con los acuerdos rechazados y su motivo (default data/acuerdos_rechazados.csv)')
+    parser.add_argument('--reintentar-rechazados', action='store_true',
+                        help='Volver a pedir a la API los textos que ya rechazo en cargas anteriores')
+    parser.add_argument('--metricas-json', default=METRICAS_JSON_PATH,
+                        help='Resumen JSON de metricas de la carga (default data/metricas_carga.json; "" para no escribirlo)')
+    parser.add_argument('--metricas-prom', default=METRICAS_PROM_PATH,
+                        help='Metricas en formato Prometheus para el textfile collector '
+                             '(default data/metricas_carga.prom; "" para no escribirlo)')
+    parser.add_argument('--resume', action='store_true',
+                        help='Continuar una carga cortada: saltear los chunks que ya se escribieron')
+    parser.add_argument('--profile', nargs='?', const=PERFILES_DIR, metavar='DIR',
+                        help='Perfilar cada etapa (cProfile, tracemalloc, espera de base y API) y dejar los '
+                             '.pstats y un informe en DIR/<fecha> (default data/perfiles)')
+    parser.add_argument('--watch', action='store_true',
+                        help='Quedar vigilando data/ y recargar las tablas afectadas cuando cambia un Excel')
+    parser.add_argument('--debounce', type=float, default=VIGILANCIA_DEBOUNCE,
+                        help=f'Con --watch, segundos sin cambios antes de cargar un Excel (default {VIGILANCIA_DEBOUNCE:g})')
+    parser.add_argument('--intervalo', type=float, default=VIGILANCIA_INTERVALO,
+                        help=f'Con --watch, segundos entre revisiones de data/ (default {VIGILANCIA_INTERVALO:g})')
     args = parser.parse_args()
+    if args.bajas and not args.delta:
+        parser.error('--bajas requiere --delta')
+    if args.resume and (args.only_embeddings or not DIARIO_CARGA_PATH):
+        parser.error('--resume no aplica a --only-embeddings y requiere DIARIO_CARGA_PATH')
+    if args.watch and (args.only_embeddings or args.profile):
+        parser.error('--watch no se combina con --only-embeddings ni con --profile')
+    if args.tenants:
+        if args.watch or args.only_embeddings or args.libros or args.bajas:
+            parser.error('--tenant no se combina con --watch, --only-embeddings, --libros ni --bajas')
+        if args.no_embedding_cache and not args.skip_embeddings:
+            parser.error('--tenant comparte los embeddings entre tenants por la cache de embeddings; '
+                         'no se combina con --no-embedding-cache')
+        slugs = [t.slug for t in args.tenants]
+        if len(set(slugs)) < len(slugs):
+            parser.error('--tenant repetido')
+    if not 1 <= args.dimensiones <= EMBEDDING_DIMENSIONS_MODELO:
+        parser.error(f'--dimensiones debe estar entre 1 y {EMBEDDING_DIMENSIONS_MODELO}')
+
+    EMBEDDING_DIMENSIONS = args.dimensiones
+    EMBEDDING_TYPE = args.tipo_vector
+    if args.rechazos:
+        RECHAZOS_ACUERDOS_PATH = args.rechazos
+    if args.no_cache:
+        PARSE_CACHE_DIR = None
+    if args.libros:
+        LIBROS_COMBINADOS = args.libros
+    TENANTS = args.tenants or []
+    if args.no_embedding_cache:
+        EMBEDDING_CACHE_PATH = None
+    REINTENTAR_RECHAZADOS = args.reintentar_rechazados
+    if args.profile:
+        PERFIL = Perfilado(os.path.join(args.profile, time.strftime('%Y%m%d-%H%M%S')))
+        DB_CONFIG['connection_factory'] = ConexionMedida
 
     log("=" * 60)
     log("CARGA DE DATOS EXCEL -> POSTGRESQL")
     log("=" * 60)
 
-    for archivo, nombre in [
-        (EXCEL_PRESTADORES, 'Prestadores'),
-        (EXCEL_NOMENCLADORES, 'Nomencladores'),
-        (EXCEL_ACUERDOS, 'Acuerdos'),
-    ]:
+    requeridos = [(EXCEL_PRESTADORES, 'Prestadores')]
+    if TENANTS:
+        log(f"  Tenants: {len(TENANTS)}")
+        requeridos = [(archivo, f"{tenant.slug}: {os.path.basename(archivo)}")
+                      for tenant in TENANTS for archivo in tenant.archivos()]
+    elif LIBROS_COMBINADOS is None:
+        requeridos += [(EXCEL_NOMENCLADORES, 'Nomencladores'), (EXCEL_ACUERDOS, 'Acuerdos')]
+    for archivo, nombre in requeridos:
         exists = os.path.exists(archivo)
         log(f"  {nombre}: {'OK' if exists else 'NO ENCONTRADO'} ({archivo})")
-        if not exists and not args.only_embeddings:
+        if not exists and not args.only_embeddings and not args.watch:
             log(f"ERROR: Archivo requerido no encontrado: {archivo}")
             sys.exit(1)
+    if LIBROS_COMBINADOS is not None:
+        combinados = libros_combinados()
+        log(f"  Nomencladores y acuerdos: {len(combinados)} libros ({', '.join(LIBROS_COMBINADOS)})")
+        for archivo, _ in combinados:
+            log(f"    {archivo}")
+        if not combinados and not args.only_embeddings and not args.watch:
+            log("ERROR: --libros no encontro ningun Excel")
+            sys.exit(1)
 
+    tablas = {args.only} if args.only else set(TABLAS_CARGA)
     client = None
     api_key = os.getenv('OPENAI_API_KEY')
-    if not args.skip_embeddings:
+    if not args.skip_embeddings and (args.only_embeddings or tablas & TABLAS_CON_EMBEDDING):
         if not api_key:
             log("ADVERTENCIA: OPENAI_API_KEY no configurada. Se cargaran datos sin embeddings.")
             args.skip_embeddings = True
         else:
-            client = OpenAI(api_key=api_key)
+            client = crear_cliente_embeddings(api_key)
             log(f"  OpenAI API: configurada ({api_key[:8]}...)")
+            log(f"  Embeddings: {EMBEDDING_MODEL} como {EMBEDDING_TYPE}({EMBEDDING_DIMENSIONS})")
+    if PERFIL:
+        log(f"  Perfilado: activo, resultados en {PERFIL.directorio}")
 
-    conn = conectar_db()
+    if args.watch:
+        vigilar(client, args, tablas)
+        return
 
+    conn = conectar_db()
     try:
-        inicio = time.time()
-
-        if args.only_embeddings:
-            if not client:
-                log("ERROR: Se requiere OPENAI_API_KEY para generar embeddings")
-                sys.exit(1)
-            regenerar_embeddings(conn, client)
-        else:
-            if args.only is None or args.only == 'prestadores':
-                cargar_prestadores(conn, client, args.skip_embeddings)
-
-            if args.only is None or args.only == 'nomencladores':
-                cargar_nomencladores(conn, client, args.skip_embeddings)
-
-            if args.only is None or args.only == 'acuerdos':
-                cargar_acuerdos(conn)
-
-        mostrar_estadisticas(conn)
-
-        duracion = time.time() - inicio
-        log(f"\nTiempo total: {duracion:.1f}s ({duracion/60:.1f} min)")
-        log("Carga completada exitosamente")
-
+        ejecutar_carga(conn, client, args, tablas, reanudar=args.resume)
     except KeyboardInterrupt:
-        log("\nCarga interrumpida por el usuario. Los datos ya insertados se conservan.")
+        log("\nCarga interrumpida por el usuario. Los datos ya insertados se conservan "
+            "(--resume continua desde el primer chunk sin escribir).")
     except Exception as e:
         log(f"\nERROR durante la carga: {e}")
+        if DIARIO_CARGA_PATH and not args.only_embeddings:
+            log("  Los chunks ya escritos se conservan; --resume continua la carga.")
         import traceback
         traceback.print_exc()
         conn.rollback()
         sys.exit(1)
     finally:
+        if PERFIL:
+            PERFIL.escribir()
         conn.close()
 
 
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Recall de embeddings reducidos contra los de 1536 dimensiones.
+
+Lee los embeddings completos de una tabla ya cargada (vector(1536)), los
+recorta a cada cantidad de dimensiones pedida (lo mismo que devuelve la API
+con `dimensions`) y, con halfvec, los redondea a float16. Para una muestra
+de filas como consulta compara los k vecinos mas cercanos por coseno contra
+los de 1536 dimensiones en float32. No llama a la API.
+
+Uso:
+    python scripts/recall_embeddings.py --tabla nomencladores
+    python scripts/recall_embeddings.py --tabla prestadores --dimensiones 256 512 --k 5
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import psycopg2
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from cargar_datos_excel import (DB_CONFIG, EMBEDDING_DIMENSIONS_MODELO, INDICES_VECTORIALES,  # noqa: E402
+                                log, reducir_dimensiones)
+
+
+def leer_embeddings(conn, tabla):
+    """Matriz float32 (filas x 1536) con los embeddings no nulos de `tabla`."""
+    _, columna = INDICES_VECTORIALES[tabla]
+    with conn.cursor(name='recall_embeddings') as cur:
+        cur.itersize = 5000
+        cur.execute(f"SELECT {columna}::text FROM {tabla} WHERE {columna} IS NOT NULL")
+        vectores = [np.array(texto[1:-1].split(','), dtype=np.float32) for (texto,) in cur]
+    conn.commit()
+    if not vectores:
+        return np.empty((0, EMBEDDING_DIMENSIONS_MODELO), dtype=np.float32)
+    matriz = np.vstack(vectores)
+    if matriz.shape[1] != EMBEDDING_DIMENSIONS_MODELO:
+        raise RuntimeError(f"{tabla}.{columna} tiene {matriz.shape[1]} dimensiones; "
+                           f"la referencia tiene que ser de {EMBEDDING_DIMENSIONS_MODELO}")
+    return matriz
+
+
+def vecinos(base, consultas, filas_consulta, k, bloque=256):
+    """Indices de los k vecinos por coseno de cada consulta (sin contarse a si misma)."""
+    resultado = np.empty((len(consultas), k), dtype=np.int64)
+    for i in range(0, len(consultas), bloque):
+        similitud = consultas[i:i + bloque] @ base.T
+        similitud[np.arange(len(similitud)), filas_consulta[i:i + bloque]] = -np.inf
+        mejores = np.argpartition(-similitud, k, axis=1)[:, :k]
+        orden = np.take_along_axis(similitud, mejores, axis=1).argsort(axis=1)[:, ::-1]
+        resultado[i:i + bloque] = np.take_along_axis(mejores, orden, axis=1)
+    return resultado
+
+
+def variante(base, dimensiones, tipo):
+    reducida = reducir_dimensiones(base, dimensiones)
+    if tipo == 'halfvec':
+        reducida = reducida.astype(np.float16).astype(np.float32)
+    return reducida
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Recall de embeddings reducidos contra 1536 dimensiones')
+    parser.add_argument('--tabla', choices=list(INDICES_VECTORIALES), default='nomencladores')
+    parser.add_argument('--dimensiones', type=int, nargs='+', default=[256, 512, 768, 1024, 1536])
+    parser.add_argument('--tipos', nargs='+', choices=['vector', 'halfvec'], default=['vector', 'halfvec'])
+    parser.add_argument('--consultas', type=int, default=1000, help='Filas de muestra usadas como consulta')
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--semilla', type=int, default=0)
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        base = leer_embeddings(conn, args.tabla)
+    finally:
+        conn.close()
+    if len(base) <= args.k:
+        log(f"ERROR: {args.tabla} tiene {len(base)} embeddings, se necesitan mas de {args.k}")
+        sys.exit(1)
+
+    base = reducir_dimensiones(base, EMBEDDING_DIMENSIONS_MODELO)  # normalizados: producto = coseno
+    filas_consulta = np.random.default_rng(args.semilla).choice(
+        len(base), min(args.consultas, len(base)), replace=False)
+    referencia = vecinos(base, base[filas_consulta], filas_consulta, args.k)
+    log(f"{args.tabla}: {len(base)} embeddings, {len(filas_consulta)} consultas, recall@{args.k} "
+        f"contra vector({EMBEDDING_DIMENSIONS_MODELO})")
+    log(f"  {'tipo':<16} {'recall@' + str(args.k):>10} {'top-1':>7} {'bytes/fila':>11} {'tiempo':>8}")
+
+    for dimensiones in args.dimensiones:
+        for tipo in args.tipos:
+            inicio = time.perf_counter()
+            reducida = variante(base, dimensiones, tipo)
+            encontrados = vecinos(reducida, reducida[filas_consulta], filas_consulta, args.k)
+            duracion = time.perf_counter() - inicio
+            recall = np.mean([len(np.intersect1d(a, b)) / args.k for a, b in zip(referencia, encontrados)])
+            top1 = np.mean(referencia[:, 0] == encontrados[:, 0])
+            # vector/halfvec en disco: 8 bytes de cabecera + dimensiones x 4 (float4) o x 2 (float2)
+            tamano = 8 + dimensiones * (2 if tipo == 'halfvec' else 4)
+            log(f"  {f'{tipo}({dimensiones})':<16} {recall:>10.3f} {top1:>7.3f} {tamano:>11} {duracion:>7.1f}s")
+
+
+if __name__ == '__main__':
+    main()
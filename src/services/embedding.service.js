@@ -52,13 +52,40 @@ class EmbeddingCache {
   }
 }
 
+const MODEL_DIMENSIONS = 1536;
+const VECTOR_TYPES = ['vector', 'halfvec'];
+
+function parseDimensions(value) {
+  // Number() y no parseInt: '512abc' o '1e3' no pasan como 512 o 1
+  const dimensions = Number(value);
+  if (!Number.isInteger(dimensions) || dimensions < 1 || dimensions > MODEL_DIMENSIONS) {
+    throw new Error(`EMBEDDING_DIMENSIONS invalido: ${JSON.stringify(value)} (entero entre 1 y ${MODEL_DIMENSIONS})`);
+  }
+  return dimensions;
+}
+
+function parseVectorType(value) {
+  // Va interpolado en CREATE INDEX (..._cosine_ops): solo valores conocidos
+  if (!VECTOR_TYPES.includes(value)) {
+    throw new Error(`EMBEDDING_TYPE invalido: ${JSON.stringify(value)} (${VECTOR_TYPES.join(' o ')})`);
+  }
+  return value;
+}
+
 class EmbeddingService {
   constructor() {
     this.model = 'text-embedding-3-small';
+    // Deben coincidir con las columnas de embedding (ver database/migration_embeddings_reducidos.sql)
+    this.dimensions = parseDimensions(process.env.EMBEDDING_DIMENSIONS || String(MODEL_DIMENSIONS));
+    this.vectorType = parseVectorType(process.env.EMBEDDING_TYPE || 'vector');
     this.batchSize = 100;
     this.cache = new EmbeddingCache(500);
   }
 
+  dimensionsParam() {
+    return this.dimensions !== MODEL_DIMENSIONS ? { dimensions: this.dimensions } : {};
+  }
+
   async generateEmbedding(text) {
     try {
       if (!text || text.trim().length === 0) {
@@ -76,7 +103,8 @@ class EmbeddingService {
       const response = await openai.embeddings.create({
         model: this.model,
         input: normalizedText,
-        encoding_format: 'float'
+        encoding_format: 'float',
+        ...this.dimensionsParam()
       });
 
       const embedding = response.data[0].embedding;
@@ -132,7 +160,8 @@ class EmbeddingService {
           const response = await openai.embeddings.create({
             model: this.model,
             input: batch,
-            encoding_format: 'float'
+            encoding_format: 'float',
+            ...this.dimensionsParam()
           });
 
           const batchEmbeddings = response.data.map(d => d.embedding);
@@ -5,6 +5,12 @@ const logger = require('../config/logger.config');
 
 const BATCH_SIZE = 100;
 
+// IVFFlat lists from the row count, as pgvector recommends (same rule as
+// parametros_indice in scripts/cargar_datos_excel.py)
+function ivfflatLists(rows) {
+  return rows <= 1000000 ? Math.max(1, Math.floor(rows / 1000)) : Math.floor(Math.sqrt(rows));
+}
+
 class EmbeddingWorker {
   constructor() {
     jobQueueService.registerHandler('embedding_prestadores', this.processPrestadores.bind(this));
@@ -161,9 +167,9 @@ class EmbeddingWorker {
       if (count > 300) {
         await query(
           `CREATE INDEX IF NOT EXISTS idx_prestadores_embedding
-           ON prestadores USING ivfflat(nombre_embedding vector_cosine_ops) WITH (lists=50)`
+           ON prestadores USING ivfflat(nombre_embedding ${embeddingService.vectorType}_cosine_ops) WITH (lists=${ivfflatLists(count)})`
         );
-        logger.info('IVFFlat index created for prestadores', { rowsWithEmbeddings: count });
+        logger.info('IVFFlat index created for prestadores', { rowsWithEmbeddings: count, lists: ivfflatLists(count) });
       }
     } catch (error) {
       logger.warn('Could not create prestadores IVFFlat index', { error: error.message });
@@ -180,9 +186,9 @@ class EmbeddingWorker {
       if (count > 300) {
         await query(
           `CREATE INDEX IF NOT EXISTS idx_nomencladores_embedding
-           ON nomencladores USING ivfflat(descripcion_embedding vector_cosine_ops) WITH (lists=100)`
+           ON nomencladores USING ivfflat(descripcion_embedding ${embeddingService.vectorType}_cosine_ops) WITH (lists=${ivfflatLists(count)})`
         );
-        logger.info('IVFFlat index created for nomencladores', { rowsWithEmbeddings: count });
+        logger.info('IVFFlat index created for nomencladores', { rowsWithEmbeddings: count, lists: ivfflatLists(count) });
       }
     } catch (error) {
       logger.warn('Could not create nomencladores IVFFlat index', { error: error.message });
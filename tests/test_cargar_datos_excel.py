@@ -0,0 +1,940 @@
+"""
+Tests for scripts/cargar_datos_excel.py (run with: python -m pytest tests)
+
+The vectorized cleaning must produce exactly the same records as the
+original row-by-row implementation, which is kept below as the reference.
+"""
+
+import importlib.util
+import os
+
+import pytest
+
+pd = pytest.importorskip('pandas')
+pytest.importorskip('openpyxl')
+pytest.importorskip('psycopg2')
+pytest.importorskip('openai')
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(PROJECT_DIR, 'scripts', 'cargar_datos_excel.py')
+EXCEL_ACUERDOS = os.path.join(PROJECT_DIR, 'data', 'ACUERDO_PRESTADORES.xlsx')
+
+spec = importlib.util.spec_from_file_location('cargar_datos_excel', SCRIPT)
+carga = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(carga)
+
+
+# ------------------------------------------------------------------
+# Reference: original iterrows/apply implementation
+# ------------------------------------------------------------------
+def ref_normalizar_texto(texto):
+    if pd.isna(texto) or texto is None:
+        return None
+    texto = str(texto).strip().lower()
+    reemplazos = {
+        'á': 'a', 'é': 'e', 'í': 'i', 'ó': 'o', 'ú': 'u',
+        'ä': 'a', 'ë': 'e', 'ï': 'i', 'ö': 'o', 'ü': 'u',
+        'ñ': 'n',
+    }
+    for old, new in reemplazos.items():
+        texto = texto.replace(old, new)
+    return ' '.join(texto.split())
+
+
+def ref_limpiar_texto(texto):
+    if pd.isna(texto) or texto is None:
+        return None
+    texto = str(texto).strip()
+    texto = texto.replace('\xa0', ' ')
+    texto = ' '.join(texto.split())
+    return texto if texto else None
+
+
+def ref_safe_float(val):
+    if pd.isna(val) or val is None:
+        return None
+    try:
+        return float(val)
+    except (ValueError, TypeError):
+        return None
+
+
+def ref_libro_combinado(df):
+    col_map = carga.mapear_columnas(df.columns, {**carga.COLUMNAS_NOMENCLADOR, **carga.COLUMNAS_ACUERDO})
+    nomencladores, acuerdos = [], []
+    for _, row in df.iterrows():
+        id_nom = row[col_map['id_nomenclador']]
+        if pd.isna(id_nom):
+            continue
+        nomencladores.append((
+            int(id_nom),
+            ref_limpiar_texto(row.get(col_map.get('especialidad', ''), None)),
+            ref_limpiar_texto(row.get(col_map['descripcion'], None)),
+            int(row[col_map['id_nomenclador2']]) if 'id_nomenclador2' in col_map and pd.notna(row.get(col_map['id_nomenclador2'])) else None,
+            int(row[col_map['id_servicio']]) if 'id_servicio' in col_map and pd.notna(row.get(col_map['id_servicio'])) else None,
+            ref_limpiar_texto(row.get(col_map.get('desc_nomenclador', ''), None)),
+        ))
+        id_prest = row.get(col_map['prest_id_prestador'])
+        id_plan = row.get(col_map['plan_id_plan'])
+        if pd.isna(id_prest) or pd.isna(id_plan):
+            continue
+        acuerdos.append((
+            int(id_nom), int(id_prest), int(id_plan),
+            ref_safe_float(row.get(col_map.get('precio', ''))),
+            ref_safe_float(row.get(col_map.get('precio_normal', ''))),
+            ref_safe_float(row.get(col_map.get('precio_diferenciado', ''))),
+            ref_safe_float(row.get(col_map.get('precio_internado', ''))),
+        ))
+
+    seen, unicos = set(), []
+    for a in acuerdos:
+        if a[:3] not in seen:
+            seen.add(a[:3])
+            unicos.append(a)
+
+    ultimo = {}
+    for n in nomencladores:
+        ultimo.pop(n[0], None)
+        ultimo[n[0]] = n
+    registros = []
+    for n in ultimo.values():
+        s = str(n[0])
+        registros.append(n + (
+            s[:2] if len(s) >= 2 else None,
+            s[:4] if len(s) >= 4 else None,
+            None,
+            ref_normalizar_texto(n[2]),
+        ))
+    return registros, unicos
+
+
+def nuevo_libro_combinado(df):
+    libro = carga.procesar_libro_combinado(df)
+    df_nomen = carga.preparar_nomencladores([libro['nomencladores']])
+    registros = carga.registros_nomencladores(df_nomen, [None] * len(df_nomen))
+    acuerdos = carga.filas_como_tuplas(
+        libro['acuerdos'].drop_duplicates(subset=carga.CAMPOS_ACUERDO[:3], keep='first')
+    )
+    return registros, acuerdos
+
+
+def assert_mismos_registros(obtenidos, esperados):
+    assert len(obtenidos) == len(esperados)
+    for fila_obtenida, fila_esperada in zip(obtenidos, esperados):
+        assert fila_obtenida == fila_esperada
+        assert [type(v) for v in fila_obtenida] == [type(v) for v in fila_esperada]
+
+
+# ------------------------------------------------------------------
+# Fixtures
+# ------------------------------------------------------------------
+@pytest.fixture(scope='module')
+def libro_incluido():
+    if not os.path.exists(EXCEL_ACUERDOS):
+        pytest.skip('data/ACUERDO_PRESTADORES.xlsx not present')
+    try:
+        return pd.read_excel(EXCEL_ACUERDOS, sheet_name=0)
+    except Exception as e:
+        pytest.skip(f'data/ACUERDO_PRESTADORES.xlsx is not readable: {e}')
+
+
+@pytest.fixture
+def libro_sintetico():
+    return pd.DataFrame({
+        'ID_NOMENCLADOR': [370228, 160501.0, None, 160501, 42, '7', 370228.0],
+        'ESPECIALIDAD': ['CLINICA MEDICA', '  GINECOLOGÍA\xa0Y  OBSTETRICIA ', None, '', 'X', 5, 'ÑANDÚ'],
+        'NOMEN_DESCRIPCION_DET': [' VISITAS  SANATORIALES ', 'HISTERECTOMÍA RADICAL', 'x', '   ', 12.5, 'ÁÉÍÓÚ äëïöü Ñ', None],
+        'ID_NOMENCLADOR2': [None, '10110501', 1, 10110501.0, None, 3.9, None],
+        'ID_SERVICIO': [None, '110501', 2, 110501, 7, None, 8],
+        'DESC_NOMENCLADOR': [None, 'HISTERECTOMÍA  RADICAL', None, 'a\tb', None, None, 'z'],
+        'PLAN_ID_PLAN': [1, 1, 1, 1, None, 2.0, 1],
+        'PREST_ID_PRESTADOR': [35, 72, 72, 72, 1, '9', 35],
+        'PRECIO': [120000, 9561695, None, 'N/A', 1.5, ' 12 ', 99],
+        'PRECIO_NORMAL': [0, 0, 0, 0, 0, None, 1],
+        'PRECIO_DIFERENCIADO': [120000, 9561695.25, None, None, True, 3, 2],
+        'PRECIO_INTERNADO': [0, 0, None, 'abc', 0, 0, 3],
+    })
+
+
+# ------------------------------------------------------------------
+# Tests
+# ------------------------------------------------------------------
+def test_normalizar_and_limpiar_texto_match_reference():
+    valores = [None, float('nan'), '', '   ', ' ÁRBOL  Ñandú\xa0ÜÖ ', 'a\tb\nc', 12.0, 7, 'ÉÍÓÚ']
+    for valor in valores:
+        assert carga.normalizar_texto(valor) == ref_normalizar_texto(valor)
+        assert carga.limpiar_texto(valor) == ref_limpiar_texto(valor)
+
+    serie = pd.Series(valores, dtype=object)
+    assert carga.normalizar_serie(serie).tolist() == [ref_normalizar_texto(v) for v in valores]
+    assert carga.limpiar_serie(serie).tolist() == [ref_limpiar_texto(v) for v in valores]
+
+
+def test_combined_workbook_matches_reference_on_synthetic_rows(libro_sintetico):
+    registros, acuerdos = nuevo_libro_combinado(libro_sintetico)
+    ref_registros, ref_acuerdos = ref_libro_combinado(libro_sintetico)
+    assert_mismos_registros(registros, ref_registros)
+    assert_mismos_registros(acuerdos, ref_acuerdos)
+
+
+def test_combined_workbook_matches_reference_on_bundled_excel(libro_incluido):
+    registros, acuerdos = nuevo_libro_combinado(libro_incluido)
+    ref_registros, ref_acuerdos = ref_libro_combinado(libro_incluido)
+    assert_mismos_registros(registros, ref_registros)
+    assert_mismos_registros(acuerdos, ref_acuerdos)
+
+
+def test_prestadores_match_reference():
+    df = pd.DataFrame({
+        'Unnamed: 0': [0, 1, 2, 3, 4],
+        'ID_PRESTADOR': [1, 2, None, 2, '5'],
+        'RUC': [' 80000001-1 ', None, 'x', 'y', 80000005.0],
+        'NOMBRE_FANTASIA': ['  Sanatorio  ÓVARIOS ', None, 'a', 'dup', 'Clínica\xa0Ñ'],
+        'RAZON_SOCIAL': ['RAZÓN  SOCIAL', 'b', None, 'c', ''],
+        'RANKING': [1.5, None, 'x', 3, 'abc'],
+        'REGISTRO_PROFESIONAL': [1234, None, 'R-55', None, ' 9 '],
+        'CANTIDAD': [None, 3, 10, 4, '7'],
+    })
+    df_clean = carga.procesar_prestadores(df)['prestadores']
+    registros = carga.registros_prestadores(df_clean, [None] * len(df_clean))
+
+    esperados = []
+    vistos = set()
+    for _, row in df.iterrows():
+        id_prest = pd.to_numeric(row['ID_PRESTADOR'], errors='coerce')
+        if pd.isna(id_prest) or int(id_prest) in vistos:
+            continue
+        vistos.add(int(id_prest))
+        nombre = ref_limpiar_texto(row['NOMBRE_FANTASIA'])
+        ranking = pd.to_numeric(row['RANKING'], errors='coerce')
+        cantidad = pd.to_numeric(row['CANTIDAD'], errors='coerce')
+        esperados.append((
+            int(id_prest),
+            str(row['RUC']).strip() if pd.notna(row['RUC']) else None,
+            nombre,
+            ref_limpiar_texto(row['RAZON_SOCIAL']),
+            str(row['REGISTRO_PROFESIONAL']).strip() if pd.notna(row['REGISTRO_PROFESIONAL']) else None,
+            float(ranking) if pd.notna(ranking) else 0.0,
+            None,
+            ref_normalizar_texto(nombre),
+            int(cantidad) if pd.notna(cantidad) else 0,
+        ))
+    assert_mismos_registros(registros, esperados)
+
+
+def test_valor_copy_escapes_text_format():
+    fila = (1, None, 2.5, 'a\tb\nc\\d\re', '[0.1,0.2]')
+    linea = '\t'.join(map(carga._valor_copy, fila))
+    assert linea == '1\t\\N\t2.5\ta\\tb\\nc\\\\d\\re\t[0.1,0.2]'
+
+
+def test_embeddings_as_float32_and_pgvector_encodings():
+    import base64
+    import struct
+    np = pytest.importorskip('numpy')
+
+    vector = np.array([0.1, -2.5, 1e-8, 3.0], dtype=np.float32)
+    desde_base64 = carga.vector_de_respuesta(base64.b64encode(vector.astype('<f4').tobytes()).decode())
+    desde_lista = carga.vector_de_respuesta([0.1, -2.5, 1e-8, 3.0])
+    assert desde_base64.dtype == desde_lista.dtype == np.float32
+    assert np.array_equal(desde_base64, vector) and np.array_equal(desde_lista, vector)
+
+    texto = carga.embedding_to_pgvector(vector)
+    assert np.array_equal(np.array(texto[1:-1].split(','), dtype=np.float32), vector)
+    assert carga.embedding_to_pgvector(None) is None
+
+    binario = carga.embedding_to_pgvector_binario(vector)
+    assert struct.unpack('!hh', binario[:4]) == (4, 0)
+    assert np.array_equal(np.frombuffer(binario[4:], dtype='>f4'), vector)
+
+
+class ClienteFalso:
+    """Imita client.embeddings.create y registra los textos pedidos."""
+
+    def __init__(self):
+        self.pedidos = []
+        self.opciones = []
+        self.embeddings = self
+
+    def create(self, model, input, **kwargs):
+        from types import SimpleNamespace
+        self.pedidos.append(list(input))
+        self.opciones.append(kwargs)
+        return SimpleNamespace(data=[
+            SimpleNamespace(index=i, embedding=[float(len(t)), float(i)])
+            for i, t in enumerate(input)
+        ])
+
+
+def test_embedding_cache_deduplicates_and_persists(tmp_path, monkeypatch):
+    monkeypatch.setattr(carga, 'EMBEDDING_CACHE_PATH', str(tmp_path / 'embeddings.sqlite'))
+    monkeypatch.setattr(carga, '_cache_embeddings', {})
+    monkeypatch.setattr(carga, 'ESTADISTICAS_EMBEDDINGS', dict.fromkeys(carga.ESTADISTICAS_EMBEDDINGS, 0))
+    monkeypatch.setattr(carga.time, 'sleep', lambda s: None)
+    monkeypatch.setattr(carga, '_tokenizador', {'encoding': None})
+
+    textos = ['aa', None, 'bbb', 'aa', '  bbb ', '']
+    cliente = ClienteFalso()
+    primera = carga.generar_embeddings_batch(cliente, textos)
+    assert cliente.pedidos == [['aa', 'bbb']]
+    assert primera[1] is None and primera[5] is None
+    assert primera[0].tolist() == primera[3].tolist() == [2.0, 0.0]
+    assert primera[2].tolist() == primera[4].tolist() == [3.0, 1.0]
+
+    carga._cache_embeddings.clear()
+    cliente = ClienteFalso()
+    segunda = carga.generar_embeddings_batch(cliente, textos + ['cccc'])
+    assert cliente.pedidos == [['cccc']]
+    assert [None if e is None else e.tolist() for e in segunda[:6]] == \
+        [None if e is None else e.tolist() for e in primera]
+    assert carga.ESTADISTICAS_EMBEDDINGS == {'textos': 9, 'distintos': 5, 'cache': 2, 'api': 3,
+                                             'requests': 2, 'tokens': 4}
+
+
+def test_reduced_dimensions_from_cache_and_halfvec_encodings(tmp_path, monkeypatch):
+    import struct
+    np = pytest.importorskip('numpy')
+    monkeypatch.setattr(carga, 'EMBEDDING_CACHE_PATH', str(tmp_path / 'embeddings.sqlite'))
+    monkeypatch.setattr(carga, '_cache_embeddings', {})
+    monkeypatch.setattr(carga, '_tokenizador', {'encoding': None})
+    monkeypatch.setattr(carga, 'EMBEDDING_DIMENSIONS_MODELO', 4)
+    monkeypatch.setattr(carga, 'EMBEDDING_DIMENSIONS', 4)
+    carga.guardar_cache_embeddings({'aa': np.array([3.0, 4.0, 0.0, 12.0])})
+
+    # Con dimensiones reducidas el vector completo de la cache se recorta y renormaliza
+    monkeypatch.setattr(carga, 'EMBEDDING_DIMENSIONS', 2)
+    assert carga.leer_cache_embeddings(['aa'])['aa'].tolist() == pytest.approx([0.6, 0.8])
+    cliente = ClienteFalso()
+    resultado = carga.generar_embeddings_batch(cliente, ['aa', 'bbb'])
+    assert cliente.pedidos == [['bbb']] and cliente.opciones[0]['dimensions'] == 2
+    assert resultado[0].tolist() == pytest.approx([0.6, 0.8])
+
+    vector = np.array([0.5, -0.25, 1 / 3], dtype=np.float32)
+    binario = carga.embedding_to_halfvec_binario(vector)
+    assert struct.unpack('!hh', binario[:4]) == (3, 0)
+    assert np.array_equal(np.frombuffer(binario[4:], dtype='>f2'), vector.astype(np.float16))
+    monkeypatch.setattr(carga, 'EMBEDDING_TYPE', 'halfvec')
+    texto = carga.embedding_to_pgvector(vector)
+    assert np.array_equal(np.array(texto[1:-1].split(','), dtype=np.float16), vector.astype(np.float16))
+
+
+@pytest.fixture
+def stub_embeddings():
+    """
+    Servidor HTTP local que imita /v1/embeddings: agrega latencia, responde 429
+    con Retry-After al primer request y registra cuantos hubo en vuelo a la vez.
+    """
+    import base64
+    import json
+    import struct
+    import threading
+    import time
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    estado = {'requests': 0, 'en_vuelo': 0, 'max_en_vuelo': 0, 'rechazos': [], 'lock': threading.Lock()}
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def responder(self, codigo, cuerpo, headers=()):
+            datos = json.dumps(cuerpo).encode()
+            self.send_response(codigo)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(datos)))
+            for clave, valor in headers:
+                self.send_header(clave, valor)
+            self.end_headers()
+            self.wfile.write(datos)
+
+        def do_POST(self):
+            pedido = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            with estado['lock']:
+                estado['requests'] += 1
+                primero = estado['requests'] == 1
+                estado['en_vuelo'] += 1
+                estado['max_en_vuelo'] = max(estado['max_en_vuelo'], estado['en_vuelo'])
+            try:
+                if primero:
+                    estado['rechazos'].append(time.monotonic())
+                    self.responder(429, {'error': {'message': 'rate limited', 'type': 'rate_limit'}},
+                                   [('Retry-After', '0.3')])
+                    return
+                time.sleep(0.05)
+                data = [{'object': 'embedding', 'index': i,
+                         'embedding': base64.b64encode(struct.pack('<2f', float(t.split()[-1]), 1.0)).decode()}
+                        for i, t in enumerate(pedido['input'])]
+                self.responder(200, {'object': 'list', 'data': data, 'model': pedido['model'],
+                                     'usage': {'prompt_tokens': 1, 'total_tokens': 1}})
+            finally:
+                with estado['lock']:
+                    estado['en_vuelo'] -= 1
+
+    servidor = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    hilo = threading.Thread(target=servidor.serve_forever, daemon=True)
+    hilo.start()
+    estado['url'] = f'http://127.0.0.1:{servidor.server_port}/v1'
+    yield estado
+    servidor.shutdown()
+
+
+def test_concurrent_engine_against_stub_server(stub_embeddings, monkeypatch):
+    import time
+    from openai import OpenAI
+
+    monkeypatch.setattr(carga, 'EMBEDDING_CACHE_PATH', None)
+    monkeypatch.setattr(carga, 'EMBEDDING_BATCH_SIZE', 5)
+    monkeypatch.setattr(carga, 'EMBEDDING_CONCURRENCY', 4)
+    monkeypatch.setattr(carga, '_limites_api', {})
+
+    cliente = OpenAI(api_key='test', base_url=stub_embeddings['url'], max_retries=0)
+    textos = [f'texto {i}' if i % 7 else None for i in range(60)]
+    inicio = time.monotonic()
+    embeddings = carga.generar_embeddings_batch(cliente, textos)
+
+    for texto, emb in zip(textos, embeddings):
+        if texto is None:
+            assert emb is None
+        else:
+            assert emb.tolist() == [float(texto.split()[-1]), 1.0]
+    assert 1 < stub_embeddings['max_en_vuelo'] <= 4
+    # 51 textos en batches de 5 = 11 requests, mas el rechazado con 429
+    assert stub_embeddings['requests'] == 12
+    assert time.monotonic() - inicio >= 0.3
+
+
+def test_token_bucket_throttles_after_burst():
+    import time
+
+    cubo = carga.CuboTokens(600)
+    cubo.tomar(600)
+    inicio = time.monotonic()
+    cubo.tomar(3)
+    assert 0.25 <= time.monotonic() - inicio < 1.0
+
+    cubo.pausar(0.2)
+    inicio = time.monotonic()
+    cubo.tomar(1)
+    assert time.monotonic() - inicio >= 0.2
+
+
+def test_batches_packed_by_tokens_and_item_cap():
+    tokens = {'a': 40, 'b': 30, 'c': 50, 'd': 500, 'e': 1, 'f': 1, 'g': 1}
+    batches = carga.planificar_batches(list(tokens), tokens, max_textos=2, max_tokens=100)
+    assert batches == [['a', 'b'], ['c'], ['d'], ['e', 'f'], ['g']]
+    assert carga.planificar_batches([], tokens) == []
+
+
+def test_truncation_on_token_boundaries_without_tiktoken(monkeypatch):
+    monkeypatch.setattr(carga, '_tokenizador', {'encoding': None})
+
+    assert carga.recortar_tokens('HISTERECTOMIA RADICAL.', 100) == ('HISTERECTOMIA RADICAL.', 9)
+    recortado, tokens = carga.recortar_tokens('uno dos, tres cuatro', 4)
+    assert (recortado, tokens) == ('uno dos,', 3)
+    largo = 'palabra ' * 10000
+    recortado, tokens = carga.recortar_tokens(largo, carga.EMBEDDING_MAX_TOKENS_TEXTO)
+    assert tokens <= carga.EMBEDDING_MAX_TOKENS_TEXTO
+    assert largo.startswith(recortado) and recortado.endswith('palabra')
+
+
+def test_background_stage_is_bounded_and_propagates_errors():
+    import threading
+    import time
+
+    producidos = []
+    detenido = threading.Event()
+
+    def productor():
+        try:
+            for i in range(100):
+                producidos.append(i)
+                yield i
+        finally:
+            detenido.set()
+
+    etapa = carga.en_segundo_plano(productor(), maxsize=2)
+    assert [next(etapa) for _ in range(3)] == [0, 1, 2]
+    time.sleep(0.2)
+    # Lo consumido + la cola (2) + el elemento que espera para entrar
+    assert len(producidos) <= 6
+    etapa.close()
+    assert detenido.wait(2)
+
+    def falla():
+        yield 1
+        raise ValueError('chunk invalido')
+
+    with pytest.raises(ValueError, match='chunk invalido'):
+        list(carga.en_segundo_plano(falla()))
+    assert list(carga.en_segundo_plano(iter(range(5)))) == [0, 1, 2, 3, 4]
+
+
+def test_acuerdos_fk_filter_and_bisection_report_rejects(tmp_path, monkeypatch):
+    import psycopg2
+
+    informe = carga.InformeRechazos(str(tmp_path / 'rechazados.csv'))
+    df = pd.DataFrame([
+        (10, 1, 1, 5.0, None, None, None),
+        (11, 1, 1, 5.0, None, None, None),
+        (10, 2, 1, 5.0, None, None, None),
+        (11, 2, 1, 5.0, None, None, None),
+    ], columns=carga.CAMPOS_ACUERDO)
+    validos = carga.filtrar_fk_acuerdos(df, ({1}, {10}), informe)
+    assert validos.values.tolist() == df.iloc[[0]].values.tolist()
+
+    class Cursor:
+        def __init__(self):
+            self.sentencias = []
+
+        def execute(self, sql):
+            self.sentencias.append(sql)
+
+    def execute_values(cur, sql, batch, page_size=100):
+        if any(fila[3] > 1e16 for fila in batch):
+            raise psycopg2.DataError('numeric field overflow')
+
+    monkeypatch.setattr(carga, 'execute_values', execute_values)
+    cur = Cursor()
+    batch = [(i, 1, 1, 1e20 if i in (3, 700) else 1.0, None, None, None) for i in range(1000)]
+    assert carga.upsert_acuerdos(cur, batch, informe) == 998
+    assert 'COMMIT' not in cur.sentencias
+    assert cur.sentencias.count('SAVEPOINT batch_acuerdos') < 60
+
+    rechazados = pd.read_csv(tmp_path / 'rechazados.csv')
+    assert rechazados['motivo'].tolist() == [
+        'nomenclador inexistente', 'prestador inexistente',
+        'prestador y nomenclador inexistentes',
+        'base (None): numeric field overflow', 'base (None): numeric field overflow',
+    ]
+    assert rechazados['id_nomenclador'].tolist()[-2:] == [3, 700]
+    assert informe.total == 5
+
+
+def test_delta_passes_only_new_or_changed_keys(monkeypatch):
+    existentes = pd.DataFrame({
+        'id_nomenclador': [1, 2, 3, 4],
+        'hash': carga.hash_filas(pd.DataFrame({
+            'id_nomenclador': [1, 2, 3, 4], 'descripcion': ['a', 'b', 'c', None],
+        })),
+        'activo': [True, True, True, True],
+        'sin_embedding': [False, False, True, True],
+    })
+    monkeypatch.setattr(carga, 'leer_hashes', lambda conn, tabla, con_embeddings: (None, existentes))
+    delta = carga.CargaDelta(None, 'nomencladores', con_embeddings=True)
+
+    # 1 igual, 2 cambiada, 3 igual pero sin embedding, 4 igual sin texto, 5 nueva
+    primero = pd.DataFrame({'id_nomenclador': [1, 2, 3, 4, 5], 'descripcion': ['a', 'B', 'c', None, 'e']})
+    assert delta.filtrar(primero)['id_nomenclador'].tolist() == [2, 3, 5]
+    # En un chunk posterior las claves ya vistas no se reescriben (gana la primera)
+    segundo = pd.DataFrame({'id_nomenclador': [1, 6], 'descripcion': ['otra', 'f']})
+    assert delta.filtrar(segundo)['id_nomenclador'].tolist() == [6]
+    assert delta.sin_cambios == 2
+    assert delta.activas[~delta.vistas].sum() == 0
+
+
+def test_vector_index_parameters_scale_with_rows():
+    assert carga.parametros_indice('ivfflat', 500) == ('lists = 1', 'ivfflat.probes = 1')
+    assert carga.parametros_indice('ivfflat', 36742) == ('lists = 36', 'ivfflat.probes = 6')
+    assert carga.parametros_indice('ivfflat', 4_000_000) == ('lists = 2000', 'ivfflat.probes = 45')
+    assert carga.parametros_indice('hnsw', 1_000_000) == ('m = 16, ef_construction = 64', 'hnsw.ef_search = 64')
+    assert carga.parametros_indice('hnsw', 1_000_001) == ('m = 24, ef_construction = 128', 'hnsw.ef_search = 128')
+
+
+def test_medir_paso_counts_nested_time_in_inner_step(monkeypatch):
+    monkeypatch.setattr(carga, 'PASOS', {})
+    reloj = iter([0.0, 1.0, 3.0, 10.0])  # entra escritura, entra serializacion, sale, sale
+    monkeypatch.setattr(carga.time, 'perf_counter', lambda: next(reloj))
+    with carga.medir_paso('escritura', 5):
+        with carga.medir_paso('serializacion') as paso:
+            paso['filas'] = 5
+    assert carga.PASOS['escritura']['segundos'] == 8.0
+    assert carga.PASOS['serializacion']['segundos'] == 2.0
+    assert carga.PASOS['escritura']['filas'] == carga.PASOS['serializacion']['filas'] == 5
+
+
+def test_metrics_record_retries_and_export_json_and_prometheus(tmp_path, monkeypatch):
+    import json
+
+    monkeypatch.setattr(carga, 'METRICAS', carga.Metricas())
+    monkeypatch.setattr(carga, 'PASOS', {'lectura': {'segundos': 2.5, 'filas': 10, 'rss_pico_mb': 1.0}})
+    monkeypatch.setattr(carga, 'TIEMPOS_ETAPAS', {})
+    monkeypatch.setattr(carga.time, 'sleep', lambda s: None)
+
+    class LimiteAlcanzado(Exception):
+        status_code = 429
+
+    class ClienteLimitado(ClienteFalso):
+        def create(self, model, input, **kwargs):
+            if not self.pedidos:
+                self.pedidos.append(None)
+                raise LimiteAlcanzado('rate limit')
+            return super().create(model, input, **kwargs)
+
+    vectores, _ = carga.pedir_embeddings(ClienteLimitado(), ['aa'], 1, '1/1')
+    assert list(vectores) == ['aa']
+    carga.METRICAS.sumar('filas_descartadas_total', 3, entidad='acuerdos', motivo='prestador "x"')
+    with carga.METRICAS.medir('upsert_batch_segundos', tabla='acuerdos_prestador'):
+        pass
+
+    ruta_json, ruta_prom = tmp_path / 'metricas.json', tmp_path / 'metricas.prom'
+    carga.exportar_metricas(True, 12.5, str(ruta_json), str(ruta_prom))
+
+    resumen = json.loads(ruta_json.read_text())
+    assert resumen['carga_excel_embeddings_reintentos_total']['series'] == [
+        {'etiquetas': {'motivo': 'rate_limit'}, 'valor': 1}]
+    requests = {s['etiquetas']['resultado']: s['cantidad']
+                for s in resumen['carga_excel_embeddings_request_segundos']['series']}
+    assert requests == {'ok': 1, 'rate_limit': 1}
+
+    prom = ruta_prom.read_text().splitlines()
+    assert '# TYPE carga_excel_upsert_batch_segundos histogram' in prom
+    assert 'carga_excel_upsert_batch_segundos_bucket{tabla="acuerdos_prestador",le="+Inf"} 1' in prom
+    assert 'carga_excel_filas_descartadas_total{entidad="acuerdos",motivo="prestador \\"x\\""} 3' in prom
+    assert 'carga_excel_paso_segundos{paso="lectura"} 2.5' in prom
+    assert 'carga_excel_exito 1' in prom
+    assert not list(tmp_path.glob('*.tmp'))
+
+
+class EntradaInvalida(Exception):
+    status_code = 400
+
+
+def test_rejected_texts_are_isolated_dead_lettered_and_skipped_later(tmp_path, monkeypatch):
+    monkeypatch.setattr(carga, 'EMBEDDING_CACHE_PATH', str(tmp_path / 'embeddings.sqlite'))
+    monkeypatch.setattr(carga, '_cache_embeddings', {})
+    monkeypatch.setattr(carga, 'ESTADISTICAS_EMBEDDINGS', dict.fromkeys(carga.ESTADISTICAS_EMBEDDINGS, 0))
+    monkeypatch.setattr(carga, 'METRICAS', carga.Metricas())
+    monkeypatch.setattr(carga, 'RECHAZOS_EMBEDDINGS', carga.TextosRechazados(str(tmp_path / 'rechazados.csv')))
+    monkeypatch.setattr(carga, 'EMBEDDING_BATCH_SIZE', 16)
+    monkeypatch.setattr(carga, '_tokenizador', {'encoding': None})
+    monkeypatch.setattr(carga, '_estado_api', {'respondio': False})
+
+    class ClienteQuisquilloso(ClienteFalso):
+        def create(self, model, input, **kwargs):
+            if 'malo' in input:
+                self.pedidos.append(list(input))
+                raise EntradaInvalida('invalid input')
+            return super().create(model, input, **kwargs)
+
+    textos = [f't{i:02d}' for i in range(8)] + ['malo', 'malo']
+    cliente = ClienteQuisquilloso()
+    embeddings = carga.generar_embeddings_batch(cliente, textos, tabla='nomencladores', ids=list(range(10)))
+    assert embeddings[8] is None and embeddings[9] is None
+    assert all(e is not None for e in embeddings[:8])
+    assert len(cliente.pedidos) < 10  # se parte a la mitad, no se pide texto por texto
+
+    rechazados = pd.read_csv(tmp_path / 'rechazados.csv')
+    assert rechazados[['tabla', 'id', 'origen']].values.tolist() == [
+        ['nomencladores', 8, 'api'], ['nomencladores', 9, 'api']]
+    assert rechazados['error'].str.contains('invalid input').all()
+
+    # En la carga siguiente el texto conocido no se pide, pero uno cambiado si
+    carga._cache_embeddings.clear()
+    cliente = ClienteQuisquilloso()
+    embeddings = carga.generar_embeddings_batch(cliente, ['t00', 'malo', 'malo!'], tabla='nomencladores',
+                                                ids=[0, 8, 11])
+    assert cliente.pedidos == [['malo!']]
+    assert embeddings[1] is None and embeddings[2] is not None
+    assert carga.RECHAZOS_EMBEDDINGS.conocidos == 1
+    series = {s['etiquetas']['origen']: s['valor']
+              for s in carga.METRICAS.como_dict()['carga_excel_embeddings_rechazados_total']['series']}
+    assert series == {'api': 1, 'conocido': 1}
+
+    # Un limite de tokens no se guarda: depende del recorte, no del texto
+    class ClienteConLimite(ClienteFalso):
+        def create(self, model, input, **kwargs):
+            if 'largo' in input:
+                raise EntradaInvalida('maximum context length is 8192 tokens')
+            return super().create(model, input, **kwargs)
+
+    embeddings = carga.generar_embeddings_batch(ClienteConLimite(), ['t10', 'largo'], tabla='nomencladores',
+                                                ids=[10, 12])
+    assert embeddings[0] is not None and embeddings[1] is None
+    assert carga.leer_rechazados(['largo']) == {}
+
+    # Si la API rechaza el request (no los textos), se corta tras partir un solo batch:
+    # en una corrida nueva, donde tambien rechaza un texto que ya tiene vector
+    monkeypatch.setattr(carga, '_estado_api', {'respondio': False})
+
+    class ClienteMalConfigurado(ClienteFalso):
+        def create(self, model, input, **kwargs):
+            self.pedidos.append(list(input))
+            raise EntradaInvalida('invalid dimensions')
+
+    cliente = ClienteMalConfigurado()
+    otros = [f'u{i:03d}' for i in range(160)]
+    with pytest.raises(RuntimeError, match='invalid dimensions'):
+        carga.generar_embeddings_batch(cliente, ['t00', *otros], tabla='nomencladores', ids=list(range(161)))
+    assert cliente.pedidos[-1] == ['t00']  # el control, de la cache
+    assert len(cliente.pedidos) < 10 + 2 * 16
+    assert carga.leer_rechazados(otros) == {}
+
+
+def test_bad_texts_next_to_cached_ones_are_dead_lettered_not_taken_for_a_bad_request(tmp_path, monkeypatch):
+    monkeypatch.setattr(carga, 'EMBEDDING_CACHE_PATH', str(tmp_path / 'embeddings.sqlite'))
+    monkeypatch.setattr(carga, '_cache_embeddings', {})
+    monkeypatch.setattr(carga, 'ESTADISTICAS_EMBEDDINGS', dict.fromkeys(carga.ESTADISTICAS_EMBEDDINGS, 0))
+    monkeypatch.setattr(carga, 'METRICAS', carga.Metricas())
+    monkeypatch.setattr(carga, 'RECHAZOS_EMBEDDINGS', carga.TextosRechazados(str(tmp_path / 'rechazados.csv')))
+    monkeypatch.setattr(carga, '_tokenizador', {'encoding': None})
+    carga.generar_embeddings_batch(ClienteFalso(), ['a', 'b'])
+
+    class ClienteQuisquilloso(ClienteFalso):
+        def create(self, model, input, **kwargs):
+            if any(t.startswith('malo') for t in input):
+                self.pedidos.append(list(input))
+                raise EntradaInvalida('invalid input')
+            return super().create(model, input, **kwargs)
+
+    # Corrida nueva (p. ej. --resume o --delta): lo unico que va a la API son los dos malos
+    monkeypatch.setattr(carga, '_estado_api', {'respondio': False})
+    cliente = ClienteQuisquilloso()
+    embeddings = carga.generar_embeddings_batch(cliente, ['a', 'b', 'malo1', 'malo2'], tabla='nomencladores',
+                                                ids=[1, 2, 3, 4])
+    assert embeddings[0] is not None and embeddings[1] is not None
+    assert embeddings[2] is None and embeddings[3] is None
+    assert cliente.pedidos[-1] in (['a'], ['b'])  # el control anduvo: los rechazos son de los textos
+    assert set(carga.leer_rechazados(['malo1', 'malo2'])) == {'malo1', 'malo2'}
+    rechazados = pd.read_csv(tmp_path / 'rechazados.csv')
+    assert sorted(rechazados['id']) == [3, 4]
+
+
+def test_profile_stage_includes_helper_threads_and_is_inert_when_off(tmp_path, monkeypatch):
+    import pstats
+
+    monkeypatch.setattr(carga, 'PERFIL', None)
+    assert carga.en_hilo(sorted) is sorted
+
+    def trabajo_auxiliar(n):
+        carga.PERFIL.sumar_espera('api', 0.5)
+        return sum(range(n))
+
+    @carga.etapa_perfilada
+    def cargar_algo():
+        carga.PERFIL.sumar_espera('base', 0.25)
+        with carga.ThreadPoolExecutor(max_workers=1) as pool:
+            return pool.submit(carga.en_hilo(trabajo_auxiliar), 1000).result()
+
+    perfil = carga.Perfilado(str(tmp_path / 'perfil'))
+    monkeypatch.setattr(carga, 'PERFIL', perfil)
+    try:
+        assert cargar_algo() == sum(range(1000))
+    finally:
+        perfil.escribir()
+
+    etapa = perfil.etapas['cargar_algo']
+    assert etapa['espera'] == {'base': 0.25, 'api': 0.5}
+    assert len(etapa['perfiles']) == 2
+    funciones = {clave[2] for clave in pstats.Stats(str(tmp_path / 'perfil' / 'cargar_algo.pstats')).stats}
+    assert 'trabajo_auxiliar' in funciones
+    fila = (tmp_path / 'perfil' / 'informe.txt').read_text().splitlines()[3].split()
+    assert fila[0] == 'cargar_algo' and fila[2:4] == ['0.2s', '0.5s']
+
+
+def test_resume_skips_chunks_committed_before_the_interruption(tmp_path, monkeypatch):
+    from datetime import datetime
+
+    class Conexion:
+        def cursor(self):
+            return self
+
+        def commit(self):
+            pass
+
+        def close(self):
+            pass
+
+    escritos = []
+
+    def escribir(cur, records):
+        if len(escritos) == 2 and corte:
+            raise RuntimeError('corte')
+        escritos.append([r[0] for r in records])
+        return len(records)
+
+    def cargar(filtrar=None):
+        return carga.cargar_en_pipeline(Conexion(), df, 'prestadores', 'nombre_fantasia', None,
+                                        lambda parte, embeddings: list(parte.itertuples(index=False)),
+                                        escribir, desc='(prueba)', filtrar=filtrar)
+
+    monkeypatch.setattr(carga, 'PIPELINE_CHUNK_SIZE', 5)
+    df = pd.DataFrame({'id_prestador': range(12), 'nombre_fantasia': [f'p{i}' for i in range(12)]})
+    ruta = str(tmp_path / 'diario.sqlite')
+
+    monkeypatch.setattr(carga, 'DIARIO', carga.DiarioCarga(ruta))
+    inicio = carga.momento_carga('desde', datetime(2026, 1, 1, 10, 0))
+    corte = True
+    with pytest.raises(RuntimeError):
+        cargar()
+    assert escritos == [[0, 1, 2, 3, 4], [5, 6, 7, 8, 9]]
+
+    # Reanudar: solo el ultimo chunk, y con el inicio de la carga cortada. Con --delta
+    # lo ya escrito deja de pasar el filtro, pero los chunks se cortan igual que antes
+    monkeypatch.setattr(carga, 'DIARIO', carga.DiarioCarga(ruta, reanudar=True))
+    assert carga.DIARIO.pendiente() == (2, 10)
+    assert carga.momento_carga('desde', datetime(2026, 1, 1, 11, 0)) == inicio
+    corte, escritos[:] = False, []
+    vistos = []
+    assert cargar(lambda parte: vistos.extend(parte['id_prestador']) or parte[parte['id_prestador'] != 3]) == 2
+    assert vistos == list(range(12))
+    assert escritos == [[10, 11]]
+
+    # Una carga nueva (sin --resume) empieza de cero
+    monkeypatch.setattr(carga, 'DIARIO', carga.DiarioCarga(ruta))
+    assert carga.DIARIO.pendiente() == (0, 0)
+
+
+def test_watcher_debounces_partial_writes_and_remembers_loaded_books(tmp_path, monkeypatch):
+    import zipfile
+
+    monkeypatch.setattr(carga, 'EXCEL_PRESTADORES', str(tmp_path / 'PRESTADORES_PRINCIPALES.xlsx'))
+    libro = tmp_path / 'PRESTADORES_PRINCIPALES.xlsx'
+    estado = str(tmp_path / 'vigilancia.json')
+    vigilante = carga.VigilanteLibros([str(libro)], estado, debounce=5)
+
+    libro.write_bytes(b'PK\x03\x04 copia a medias')
+    assert vigilante.listos(ahora=0) == []
+    assert vigilante.listos(ahora=10) == []  # estable pero todavia no es un zip valido
+
+    with zipfile.ZipFile(libro, 'w') as z:
+        z.writestr('xl/workbook.xml', 'v1')
+    assert vigilante.listos(ahora=11) == []
+    assert vigilante.listos(ahora=14) == []  # dentro del debounce
+    listos = vigilante.listos(ahora=16)
+    assert [archivo for archivo, _ in listos] == [str(libro)]
+    assert carga.tablas_afectadas([str(libro)]) == {'prestadores', 'acuerdos'}
+    assert carga.tablas_afectadas(['NOMENCLADORES_GENERALES.xlsx']) == {'nomencladores', 'acuerdos'}
+    assert carga.tablas_afectadas([]) == set()
+
+    vigilante.marcar_cargados(listos)
+    assert vigilante.listos(ahora=20) == []
+
+    # Un proceso nuevo no recarga lo que ya se cargo, pero si lo que cambio
+    vigilante = carga.VigilanteLibros([str(libro)], estado, debounce=5)
+    vigilante.listos(ahora=0)
+    assert vigilante.listos(ahora=6) == []
+    with zipfile.ZipFile(libro, 'w') as z:
+        z.writestr('xl/workbook.xml', 'v2')
+    vigilante.listos(ahora=7)
+    assert [archivo for archivo, _ in vigilante.listos(ahora=13)] == [str(libro)]
+
+
+def test_module_import_does_not_load_openai_sdk():
+    import subprocess
+    import sys
+
+    codigo = ("import importlib.util, sys; "
+              f"spec = importlib.util.spec_from_file_location('carga', {SCRIPT!r}); "
+              "spec.loader.exec_module(importlib.util.module_from_spec(spec)); "
+              "print('openai' in sys.modules)")
+    salida = subprocess.run([sys.executable, '-c', codigo], capture_output=True, text=True, check=True)
+    assert salida.stdout.strip() == 'False'
+
+
+def test_workbook_directory_with_several_sheets_matches_single_sheet(tmp_path, monkeypatch, libro_sintetico):
+    def escribir(ruta, hojas):
+        with pd.ExcelWriter(ruta) as excel:
+            for nombre, df in hojas:
+                df.to_excel(excel, sheet_name=nombre, index=False)
+
+    escribir(tmp_path / 'unico.xlsx', [('Hoja1', libro_sintetico)])
+    regiones = tmp_path / 'regiones'
+    regiones.mkdir()
+    escribir(regiones / 'b_sur.xlsx', [('Marzo', libro_sintetico.iloc[5:])])
+    escribir(regiones / 'a_norte.xlsx', [('Notas', pd.DataFrame({'NOTA': ['sin datos']})),
+                                         ('Enero', libro_sintetico.iloc[:3]), ('Febrero', libro_sintetico.iloc[3:5])])
+    (regiones / '~$a_norte.xlsx').write_bytes(b'')
+
+    libros = carga.expandir_libros([str(regiones)])
+    assert [os.path.basename(archivo) for archivo in libros] == ['a_norte.xlsx', 'b_sur.xlsx']
+    assert carga.hojas_excel(libros[0]) == ['Notas', 'Enero', 'Febrero']
+    assert [len(df) for df in carga.iterar_excel(libros[0], 2)] == [1, 2, 1, 2]
+
+    monkeypatch.setattr(carga, 'PARSE_CACHE_DIR', None)
+    monkeypatch.setattr(carga, '_libros_leidos', {})
+    unico = carga.leer_libro_combinado(str(tmp_path / 'unico.xlsx'), 'unico')
+    partes = [carga.leer_libro_combinado(archivo, carga.nombre_libro(archivo)) for archivo in libros]
+    assert [parte['filas'] for parte in partes] == [6, 2]
+
+    # Las reglas de duplicados entre hojas y libros son las de un libro de una sola hoja
+    pd.testing.assert_frame_equal(carga.preparar_nomencladores([parte['nomencladores'] for parte in partes]),
+                                  carga.preparar_nomencladores([unico['nomencladores']]))
+    pd.testing.assert_frame_equal(
+        pd.concat([parte['acuerdos'] for parte in partes], ignore_index=True)
+        .drop_duplicates(subset=carga.CAMPOS_ACUERDO[:3], keep='first'),
+        unico['acuerdos'].drop_duplicates(subset=carga.CAMPOS_ACUERDO[:3], keep='first'))
+
+
+def test_tenant_rows_get_internal_ids_and_keep_excel_ids(tmp_path, monkeypatch):
+    tenant = carga.tenant_de_argumento('norte')
+    assert tenant.directorio == os.path.join(carga.TENANTS_DIR, 'norte')
+    assert os.path.basename(tenant.archivos()[0]) == 'PRESTADORES_PRINCIPALES.xlsx'
+    tenant.id = '6f1c2a9e-0000-4000-8000-000000000001'
+    mapas = {'prestadores': {'10': 501}, 'nomencladores': {'7': 900}}
+    monkeypatch.setattr(tenant, 'mapa_ids', lambda cur, tabla, id_col: dict(mapas[tabla]))
+    monkeypatch.setattr(carga, 'TENANT', tenant)
+
+    class ConexionFalsa:
+        def cursor(self):
+            return self
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def execute(self, sql, params=None):
+            sentencias.append(sql)
+
+        def fetchone(self):
+            return (1200,)  # maximo id de la tabla, de todos los tenants
+
+        def commit(self):
+            sentencias.append('COMMIT')
+
+    sentencias = []
+    df = pd.DataFrame({'id_prestador': [10, 11, 12], 'nombre_fantasia': ['A', 'B', 'C']})
+    traducido = carga.con_ids_del_tenant(
+        ConexionFalsa(), df, 'prestadores',
+        lambda parte, embeddings: list(zip(parte['id_prestador'], parte['id_externo'], embeddings)),
+        lambda cur, records: sentencias.append(records))
+    assert traducido['id_prestador'].tolist() == [501, 1201, 1202]
+    assert traducido['id_externo'].tolist() == ['10', '11', '12']
+    # Los ids nuevos se escriben bajo el bloqueo, antes del commit que lo suelta
+    assert sentencias[0] == 'LOCK TABLE prestadores IN SHARE ROW EXCLUSIVE MODE'
+    assert sentencias[-2:] == [[(1201, '11', None), (1202, '12', None)], 'COMMIT']
+
+    columnas, sql = carga.con_columnas_tenant(carga.CAMPOS_SQL_PRESTADOR, carga.UPSERT_PRESTADORES_SQL)
+    assert columnas[-2:] == ['id_externo', 'tenant_id']
+    assert ', id_externo, tenant_id) VALUES %s' in sql.format(origen='VALUES %s')
+    registros = carga.con_columnas_del_tenant(pd.DataFrame({'id_prestador': [501]}), traducido.iloc[:1])
+    assert registros.values.tolist() == [[501, '10', tenant.id]]
+
+    informe = carga.InformeRechazos(str(tmp_path / 'rechazados.csv'))
+    acuerdos = pd.DataFrame([(7, 10, 1, 5.0, None, None, None), (8, 10, 1, 5.0, None, None, None)],
+                            columns=carga.CAMPOS_ACUERDO)
+    validos = carga.acuerdos_del_tenant(acuerdos, mapas, informe)
+    assert validos[['id_nomenclador', 'prest_id_prestador']].values.tolist() == [[900, 501]]
+    # El informe muestra los ids del Excel del tenant, no los internos
+    rechazados = pd.read_csv(tmp_path / 'rechazados.csv')
+    assert rechazados[['id_nomenclador', 'prest_id_prestador', 'motivo']].values.tolist() == [
+        [8, 10, 'nomenclador inexistente']]
+
+
+def test_parse_cache_version_changes_with_cleaning_rules_and_pandas(monkeypatch):
+    monkeypatch.setattr(carga, '_version_limpieza', None)
+    antes = carga.version_limpieza()
+    monkeypatch.setattr(carga, '_version_limpieza', None)
+    monkeypatch.setattr(carga, 'TABLA_ACENTOS', str.maketrans('áéíóúäëïöüñç', 'aeiouaeiounc'))
+    con_acentos = carga.version_limpieza()
+    assert con_acentos != antes
+
+    monkeypatch.setattr(carga, '_version_limpieza', None)
+    monkeypatch.setattr(carga, 'REQUERIDAS_PRESTADOR', ('id_prestador',))
+    con_requeridas = carga.version_limpieza()
+    assert con_requeridas != con_acentos
+
+    monkeypatch.setattr(carga, '_version_limpieza', None)
+    monkeypatch.setattr(carga.pd, '__version__', '0.0.0')
+    assert carga.version_limpieza() != con_requeridas